@@ -0,0 +1,307 @@
+#!/usr/bin/python3
+
+################################################################################
+# Copyright 2019 Supranational LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+################################################################################
+# Benchmarks with regression tracking
+################################################################################
+# Times the models and generators over a range of geometries:
+#
+#   compressor_tree          primitives.compressor_tree, elements terms
+#   compressor_tree_word     primitives.compressor_tree_word, same shape
+#   multiply                 primitives.multiply, elements x elements
+#   modular_square           modular_square_9_cycles.modular_square
+#   generate_reduction_luts  modular_square_9_cycles.generate_reduction_luts
+#   gen_reduction_lut        gen_reduction_lut.generate, all RTL files
+#   vdf_basic                vdf_basic.py as a process, per squaring engine
+#
+# Each benchmark is run enough times to take at least the minimum time, and
+# the best of a few repeats is kept as seconds per call.  The LUT and
+# generated file caches are disabled so the generators do their full work.
+#
+# Every result is compared with the most recent recorded run on the same
+# host, and the run fails (exit status 1) when any benchmark is slower by
+# more than the threshold.  Passing runs are appended to a JSON history
+# file; failing runs are not, so the baseline stays at the last good run.
+
+import getopt
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+MODEL_DIR = os.path.dirname(os.path.realpath(__file__))
+
+sys.path.append(os.path.join(MODEL_DIR, '..', '..', 'primitives', 'model'))
+sys.path.append(os.path.join(MODEL_DIR, '..', 'rtl'))
+
+import primitives as p
+import modular_square_9_cycles as ms
+import sqr_engines
+import gen_reduction_lut
+
+BENCHMARKS     = ['compressor_tree', 'compressor_tree_word', 'multiply',
+                  'modular_square', 'generate_reduction_luts',
+                  'gen_reduction_lut', 'vdf_basic']
+
+ELEMENTS       = [8, 32, 128]
+WORD_LENS      = [4, 8, 16]
+
+REDUNDANT      = 2
+NUM_SEGMENTS   = 4
+
+VDF_ITERATIONS = 100000
+
+HISTORY_FILE   = 'benchmark_history.json'
+
+################################################################################
+# Benchmarks
+################################################################################
+# Each setup function takes (elements, word_len) and returns the callable to
+# time.  Inputs are built once, outside the timed call.
+
+def setup_compressor_tree(elements, word_len):
+   bit_len = word_len + 1
+   terms   = [random.getrandbits(bit_len) for i in range (elements)]
+   # compressor_tree extends its terms in place
+   return lambda: p.compressor_tree([p.int_to_bits(t, bit_len)
+                                     for t in terms], bit_len)
+
+def setup_compressor_tree_word(elements, word_len):
+   bit_len = word_len + 1
+   terms   = [random.getrandbits(bit_len) for i in range (elements)]
+   return lambda: p.compressor_tree_word(terms, bit_len)
+
+def setup_multiply(elements, word_len):
+   bit_len     = word_len + 1
+   col_bit_len = (bit_len*2) - word_len + math.ceil(math.log2(elements))
+   A = [random.getrandbits(bit_len) for i in range (elements)]
+   B = [random.getrandbits(bit_len) for i in range (elements)]
+   return lambda: p.multiply(A, B, elements, col_bit_len, word_len)
+
+def random_modulus(bits):
+   return random.getrandbits(bits) | (1 << (bits-1)) | 1
+
+def setup_modular_square(elements, word_len):
+   mod_in = random_modulus(elements*word_len)
+   redLUT = ms.generate_reduction_luts(mod_in, elements, REDUNDANT,
+                                       NUM_SEGMENTS, word_len)
+   sqr_in = random.getrandbits(elements*word_len)
+   return lambda: ms.modular_square(sqr_in, mod_in, redLUT, REDUNDANT,
+                                    elements, NUM_SEGMENTS, word_len+1,
+                                    word_len, {})
+
+def setup_generate_reduction_luts(elements, word_len):
+   mod_in = random_modulus(elements*word_len)
+   return lambda: ms.generate_reduction_luts(mod_in, elements, REDUNDANT,
+                                             NUM_SEGMENTS, word_len)
+
+def setup_gen_reduction_lut(elements, word_len):
+   mod_in = random_modulus(elements*word_len)
+   return lambda: gen_reduction_lut.generate(mod_in, REDUNDANT, elements,
+                                             NUM_SEGMENTS, word_len)
+
+def setup_vdf_basic(engine):
+   cmd = [sys.executable, os.path.join(MODEL_DIR, 'vdf_basic.py'),
+          '-t', str(VDF_ITERATIONS), '-e', engine]
+   return lambda: subprocess.run(cmd, stdout=subprocess.DEVNULL, check=True)
+
+SETUPS = {'compressor_tree'         : setup_compressor_tree,
+          'compressor_tree_word'    : setup_compressor_tree_word,
+          'multiply'                : setup_multiply,
+          'modular_square'          : setup_modular_square,
+          'generate_reduction_luts' : setup_generate_reduction_luts,
+          'gen_reduction_lut'       : setup_gen_reduction_lut}
+
+# (key, callable) for every selected benchmark and geometry
+def cases(benchmarks, elements, word_lens):
+   for name in benchmarks:
+      if name == 'vdf_basic':
+         for engine in sqr_engines.ENGINES:
+            if engine == 'gmpy2' and sqr_engines.gmpy2 is None:
+               continue
+            yield ('vdf_basic/%s' % engine, lambda e=engine:
+                   setup_vdf_basic(e))
+         continue
+      for e in elements:
+         for w in word_lens:
+            yield ('%s/e%d/w%d' % (name, e, w),
+                   lambda n=name, e=e, w=w: SETUPS[n](e, w))
+
+################################################################################
+# Timing
+################################################################################
+
+# Best seconds per call over repeats, each repeat calling fn enough times to
+# take at least min_time
+def measure(fn, min_time, repeats):
+   number = 1
+   while True:
+      start   = time.perf_counter()
+      for i in range (number):
+         fn()
+      elapsed = time.perf_counter() - start
+      if elapsed >= min_time:
+         break
+      number *= 2
+
+   best = elapsed / number
+   for r in range (repeats-1):
+      start = time.perf_counter()
+      for i in range (number):
+         fn()
+      best  = min(best, (time.perf_counter() - start) / number)
+   return best
+
+################################################################################
+# History
+################################################################################
+
+def load_history(filename):
+   if not os.path.exists(filename):
+      return {'runs' : []}
+   with open(filename) as f:
+      return json.load(f)
+
+def save_history(history, filename):
+   tmp_filename = filename + '.tmp'
+   with open(tmp_filename, 'w') as f:
+      json.dump(history, f, indent=1, sort_keys=True)
+   os.replace(tmp_filename, filename)
+
+def git_commit():
+   try:
+      return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                            cwd=MODEL_DIR, capture_output=True, text=True,
+                            check=True).stdout.strip()
+   except (OSError, subprocess.CalledProcessError):
+      return None
+
+# Most recent result for key from an earlier run on this host
+def baseline(history, key, host):
+   for run in reversed(history['runs']):
+      if run['host'] == host and key in run['results']:
+         return run['results'][key], run.get('commit')
+   return None, None
+
+################################################################################
+# Command line
+################################################################################
+
+def usage():
+   print('benchmarks.py -f <history file> -t <threshold percent>',
+         '-b <benchmarks> -e <elements> -w <word lens>',
+         '-m <min seconds> -r <repeats> [-n]')
+   print('  lists are comma separated, benchmarks from',
+         ','.join(BENCHMARKS))
+   print('  -n  compare only, do not record the run')
+   print('  failing runs are never recorded')
+
+if __name__ == "__main__":
+   history_file = HISTORY_FILE
+   threshold    = 50.0
+   benchmarks   = BENCHMARKS
+   elements     = ELEMENTS
+   word_lens    = WORD_LENS
+   min_time     = 0.5
+   repeats      = 5
+   record       = True
+
+   try:
+      opts, args = getopt.getopt(sys.argv[1:], "hf:t:b:e:w:m:r:n")
+   except getopt.GetoptError:
+      usage()
+      sys.exit(2)
+
+   for opt, arg in opts:
+      if opt == '-h':
+         usage()
+         sys.exit()
+      elif opt == '-f':
+         history_file = arg
+      elif opt == '-t':
+         threshold = float(arg)
+      elif opt == '-b':
+         benchmarks = arg.split(',')
+      elif opt == '-e':
+         elements = [int(x) for x in arg.split(',')]
+      elif opt == '-w':
+         word_lens = [int(x) for x in arg.split(',')]
+      elif opt == '-m':
+         min_time = float(arg)
+      elif opt == '-r':
+         repeats = int(arg)
+      elif opt == '-n':
+         record = False
+
+   unknown = [b for b in benchmarks if b not in BENCHMARKS]
+   if unknown:
+      print("Unknown benchmarks", ', '.join(unknown))
+      usage()
+      sys.exit(2)
+
+   # Time the full computation rather than cache reads
+   os.environ['VDF_LUT_CACHE']   = ''
+   os.environ['VDF_BUILD_CACHE'] = ''
+
+   random.seed(0)
+
+   history = load_history(history_file)
+   host    = platform.node()
+   results = {}
+   slower  = []
+
+   print('%-40s %12s %12s %8s' % ('benchmark', 'seconds', 'baseline',
+                                  'change'))
+   for key, setup in cases(benchmarks, elements, word_lens):
+      seconds      = measure(setup(), min_time, repeats)
+      results[key] = seconds
+
+      base, commit = baseline(history, key, host)
+      if base is None:
+         print('%-40s %12.6f %12s %8s' % (key, seconds, '-', '-'),
+               flush=True)
+         continue
+
+      change = ((seconds / base) - 1) * 100
+      flag   = ''
+      if change > threshold:
+         slower.append(key)
+         flag = '  SLOWER than %s' % commit
+      print('%-40s %12.6f %12.6f %+7.1f%%%s' %
+            (key, seconds, base, change, flag), flush=True)
+
+   if record and not slower:
+      history['runs'].append({'time'    : time.strftime('%Y-%m-%dT%H:%M:%S'),
+                              'commit'  : git_commit(),
+                              'host'    : host,
+                              'python'  : platform.python_version(),
+                              'results' : results})
+      save_history(history, history_file)
+      print("Recorded in", history_file)
+
+   if slower:
+      print(len(slower), "benchmarks slower than the", "%g%%" % threshold,
+            "threshold:", ', '.join(slower))
+
+   result_str = "FAILED" if slower else "PASSED"
+   print(result_str)
+   sys.exit(1 if slower else 0)
@@ -0,0 +1,144 @@
+################################################################################
+# Copyright 2019 Supranational LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+################################################################################
+# Generated file cache
+################################################################################
+# gen_reduction_lut.py and gen_test.py produce identical files whenever they
+# are run with the same parameters.  Their outputs are stored in a content
+# addressed cache keyed by the generating source file and the full parameter
+# set, so a repeated run copies them out instead of recomputing them.
+#
+# Output files are only rewritten when their content changes.  Unchanged
+# files keep their mtimes and do not trigger a Verilator rebuild.
+#
+# The cache directory is taken from VDF_BUILD_CACHE (default
+# ~/.cache/vdf-fpga/build), set it empty to disable caching.  Unchanged files
+# are still left untouched when caching is disabled.  The cache never stops a
+# build: an entry that cannot be read is a miss and one that cannot be
+# written is skipped.
+#
+# Cache layout, one directory per key:
+#   <key>/files.json   list of the file names in the entry
+#   <key>/<n>          contents of the n-th file
+
+import hashlib
+import json
+import os
+import shutil
+
+INDEX_FILENAME = 'files.json'
+
+def default_cache_dir():
+   return os.environ.get('VDF_BUILD_CACHE',
+                         os.path.join(os.path.expanduser('~'), '.cache',
+                                      'vdf-fpga', 'build'))
+
+# Key covering the source that generates the files and its parameters,
+# params must be JSON serializable
+def cache_key(source_file, params):
+   with open(source_file, 'rb') as f:
+      source_hash = hashlib.sha256(f.read()).hexdigest()
+
+   desc = json.dumps({'source' : os.path.basename(source_file),
+                      'hash'   : source_hash,
+                      'params' : params}, sort_keys=True)
+   return hashlib.sha256(desc.encode()).hexdigest()
+
+# {name: bytes} stored under key, or None if there is no complete, readable
+# entry
+def lookup(key, cache_dir=None):
+   if cache_dir is None:
+      cache_dir = default_cache_dir()
+   if not cache_dir:
+      return None
+
+   entry = os.path.join(cache_dir, key)
+   try:
+      with open(os.path.join(entry, INDEX_FILENAME)) as f:
+         names = json.load(f)
+
+      files = {}
+      for n, name in enumerate(names):
+         with open(os.path.join(entry, str(n)), 'rb') as f:
+            files[name] = f.read()
+      return files
+   except (OSError, ValueError, TypeError):
+      return None
+
+def store(key, files, cache_dir=None):
+   if cache_dir is None:
+      cache_dir = default_cache_dir()
+   if not cache_dir:
+      return
+
+   # Fill a temporary directory and rename it into place so concurrent
+   # builds never see a partial entry
+   entry     = os.path.join(cache_dir, key)
+   tmp_entry = '%s.%d.tmp' % (entry, os.getpid())
+   try:
+      os.makedirs(tmp_entry, exist_ok=True)
+
+      names = sorted(files)
+      for n, name in enumerate(names):
+         with open(os.path.join(tmp_entry, str(n)), 'wb') as f:
+            f.write(files[name])
+      with open(os.path.join(tmp_entry, INDEX_FILENAME), 'w') as f:
+         json.dump(names, f)
+
+      os.rename(tmp_entry, entry)
+   except OSError:
+      # Another build stored the same entry first, or the cache directory
+      # is missing or read-only
+      shutil.rmtree(tmp_entry, ignore_errors=True)
+
+# Writes data to filename unless it already holds exactly that data.
+# Returns True if the file was written.
+def write_if_changed(filename, data):
+   try:
+      if os.path.getsize(filename) == len(data):
+         with open(filename, 'rb') as f:
+            if f.read() == data:
+               return False
+   except OSError:
+      pass
+
+   directory = os.path.dirname(filename)
+   if directory:
+      os.makedirs(directory, exist_ok=True)
+
+   tmp_filename = '%s.%d.tmp' % (filename, os.getpid())
+   with open(tmp_filename, 'wb') as f:
+      f.write(data)
+   os.replace(tmp_filename, filename)
+   return True
+
+# Writes every file in {name: bytes} that changed, or all of them if force.
+# Returns the lists of written and unchanged names.
+def write_files(files, directory='.', force=False):
+   written   = []
+   unchanged = []
+   for name in sorted(files):
+      filename = os.path.join(directory, name)
+      if force:
+         with open(filename, 'wb') as f:
+            f.write(files[name])
+         written.append(name)
+      elif write_if_changed(filename, files[name]):
+         written.append(name)
+      else:
+         unchanged.append(name)
+   return written, unchanged
@@ -0,0 +1,315 @@
+#!/usr/bin/python3
+
+################################################################################
+# Copyright 2019 Supranational LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+################################################################################
+# Chained squaring stability tracker
+################################################################################
+# Runs long chains of squarings through the batched model, feeding each
+# redundant output coefficient vector straight back in as the RTL does (or
+# carry propagated first with -N, as the scalar test loop does through an
+# integer), and records how far the redundant representation grows.
+#
+# Per window of squarings, the widest value over all chains of:
+#   value       output value vs num_elements*word_len bits
+#   multiple    output value / M, how far from fully reduced it is
+#   coeff       output coefficient vs bit_len, the sq_in register width
+#   excess      output coefficient above 2^word_len-1, per position
+#   grid_entry  compress_grid entries vs GRID_BIT_LEN, from MAX_VALUE
+#   accum       curr_accum coefficients ahead of each partial reduction
+#
+# A metric within the alert margin of its limit is reported as NEAR, past it
+# as OVER.  Results are checked against x^(2^n) mod M at the end of every
+# window.  The representation is called bounded unless a width is still
+# climbing at the end of the run: a new maximum in the third quarter of the
+# windows and another in the last quarter.  A single window a bit wider than
+# before is normal fluctuation and does not count.
+
+import csv
+import getopt
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', '..', 'primitives', 'model'))
+
+import modular_square_9_cycles as ms
+import modular_square_batch as msb
+import model_stats
+
+NUM_SEGMENTS = 4
+
+# Width metrics with a limit, in report order
+LIMITED      = ['value', 'coeff', 'grid_entry']
+
+HISTORY_COLS = ['squarings', 'value', 'multiple', 'coeff', 'excess',
+                'grid_entry', 'accum', 'grid_truncated', 'v7v6_overflow',
+                'v5v4_overflow', 'failed']
+
+################################################################################
+# Limits
+################################################################################
+
+def limits(redundant, nonredundant, bit_len, word_len):
+   plan = ms.grid_plan(redundant, nonredundant, NUM_SEGMENTS, bit_len,
+                       word_len)
+   return {'value'      : (redundant + nonredundant) * word_len,
+           'coeff'      : bit_len,
+           'grid_entry' : plan.grid_bit_len}
+
+def level(width, limit, margin):
+   if width > limit:
+      return 'OVER'
+   elif width > limit - margin:
+      return 'NEAR'
+   return 'ok'
+
+################################################################################
+# Tracking
+################################################################################
+
+class ChainTracker:
+   def __init__(self, mod_in, sqr_in, redundant, nonredundant, word_len,
+                normalize=False, margin=1):
+      self.mod_in       = mod_in
+      self.redundant    = redundant
+      self.nonredundant = nonredundant
+      self.word_len     = word_len
+      self.bit_len      = word_len + 1
+      self.normalize    = normalize
+      self.margin       = margin
+      self.limits       = limits(redundant, nonredundant, self.bit_len,
+                                 word_len)
+
+      redLUT        = ms.generate_reduction_luts(mod_in, nonredundant,
+                                                 redundant, NUM_SEGMENTS,
+                                                 word_len)
+      self.lut      = msb.lut_array(redLUT)
+      self.coeffs   = msb.to_coefficients(sqr_in, redundant + nonredundant,
+                                          word_len)
+      self.expected = [x % mod_in for x in sqr_in]
+
+      self.squarings = 0
+      self.history   = []
+      self.excess    = np.zeros(redundant + nonredundant, dtype=np.int64)
+      self.alerts    = {}
+
+   # Runs num squarings and appends one history row
+   def window(self, num):
+      WORD_MASK = (2**self.word_len) - 1
+
+      profile = model_stats.ModelProfile()
+      v7v6    = 0
+      v5v4    = 0
+      excess  = np.zeros_like(self.excess)
+
+      for i in range (num):
+         sqr_in = msb.normalize(self.coeffs, self.word_len) \
+                  if self.normalize else self.coeffs
+
+         stats       = {}
+         self.coeffs = msb.modular_square(sqr_in, self.lut, self.redundant,
+                                          self.nonredundant, NUM_SEGMENTS,
+                                          self.bit_len, self.word_len, stats,
+                                          profile)
+         v7v6   += int(stats['v7v6_overflow'].sum())
+         v5v4   += int(stats['v5v4_overflow'].sum())
+         excess  = np.maximum(excess, self.coeffs.max(axis=0) - WORD_MASK)
+
+      self.squarings += num
+      self.excess     = np.maximum(self.excess, excess)
+
+      values        = msb.from_coefficients(self.coeffs, self.word_len)
+      self.expected = [pow(x, 2**num, self.mod_in) for x in self.expected]
+      failed        = sum(1 for v, x in zip(values, self.expected)
+                          if (v % self.mod_in) != x)
+
+      def widest(prefix):
+         return max([max(hist) for name, hist in profile.widths.items()
+                     if name.startswith(prefix) and hist] + [0])
+
+      row = {'squarings'      : self.squarings,
+             'value'          : max(v.bit_length() for v in values),
+             'multiple'       : max(v // self.mod_in for v in values),
+             'coeff'          : int(self.coeffs.max()).bit_length(),
+             'excess'         : int(max(excess.max(), 0)),
+             'grid_entry'     : widest('grid_entry_'),
+             'accum'          : widest('accum_'),
+             'grid_truncated' : profile.counters['grid_truncated'],
+             'v7v6_overflow'  : v7v6,
+             'v5v4_overflow'  : v5v4,
+             'failed'         : failed}
+      self.history.append(row)
+
+      # Only the first squaring count a metric reaches each level at
+      for name in LIMITED:
+         l = level(row[name], self.limits[name], self.margin)
+         if l != 'ok' and (name, l) not in self.alerts:
+            self.alerts[(name, l)] = self.squarings
+            print("ALERT", l, name, "width", row[name], "limit",
+                  self.limits[name], "after", self.squarings, "squarings",
+                  flush=True)
+
+      return row
+
+   # Widths with a sustained increase, the running maximum raised in both
+   # the third and the last quarter of the history.  multiple and excess
+   # move around from window to window and are left out.
+   def growing(self):
+      quarter = len(self.history) // 4
+      if quarter == 0:
+         return []
+      half  = len(self.history) // 2
+      last  = len(self.history) - quarter
+
+      def widest(name, start, end):
+         return max(r[name] for r in self.history[start:end])
+
+      return [name for name in ['value', 'coeff', 'grid_entry', 'accum']
+              if widest(name, half, last) > widest(name, 0, half) and
+                 widest(name, last, None) > widest(name, 0, last)]
+
+   def save_csv(self, filename):
+      with open(filename, 'w', newline='') as f:
+         w = csv.DictWriter(f, fieldnames=HISTORY_COLS)
+         w.writeheader()
+         for row in self.history:
+            w.writerow(row)
+
+################################################################################
+# Command line
+################################################################################
+
+def usage():
+   print('chain_tracker.py -n <num chains> -c <chain length>',
+         '-i <window> -r <num redundant> -e <num nonredundant>',
+         '-w <word len> -s <seed> -a <alert margin bits>',
+         '[-M <modulus>] [-N] [-o <history csv>]')
+   print('  -N  carry propagate each output before feeding it back')
+
+if __name__ == "__main__":
+   num_chains    = 16
+   chain_len     = 100000
+   window_len    = 1000
+   redundant     = 2
+   nonredundant  = 8
+   word_len      = 16
+   seed          = 0
+   margin        = 1
+   mod_in        = None
+   normalize     = False
+   history_file  = None
+
+   try:
+      opts, args = getopt.getopt(sys.argv[1:], "hn:c:i:r:e:w:s:a:M:No:")
+   except getopt.GetoptError:
+      usage()
+      sys.exit(2)
+
+   for opt, arg in opts:
+      if opt == '-h':
+         usage()
+         sys.exit()
+      elif opt == '-n':
+         num_chains = int(arg)
+      elif opt == '-c':
+         chain_len = int(arg)
+      elif opt == '-i':
+         window_len = int(arg)
+      elif opt == '-r':
+         redundant = int(arg)
+      elif opt == '-e':
+         nonredundant = int(arg)
+      elif opt == '-w':
+         word_len = int(arg)
+      elif opt == '-s':
+         seed = int(arg)
+      elif opt == '-a':
+         margin = int(arg)
+      elif opt == '-M':
+         mod_in = int(arg, 16)
+      elif opt == '-N':
+         normalize = True
+      elif opt == '-o':
+         history_file = arg
+
+   random.seed(seed)
+
+   n = nonredundant*word_len
+   if mod_in is None:
+      mod_in = random.getrandbits(n) | (1 << (n-1))
+
+   # The largest inputs first, then random ones
+   sqr_in = [mod_in-1, (2**n)-1] + [random.getrandbits(n)
+                                    for i in range (num_chains-2)]
+   sqr_in = sqr_in[:num_chains]
+
+   tracker = ChainTracker(mod_in, sqr_in, redundant, nonredundant, word_len,
+                          normalize, margin)
+
+   print("Tracking", len(sqr_in), "chains of", chain_len,
+         "squarings, num elements", nonredundant, "+", redundant,
+         "with word len", word_len)
+   print("Limits", ' '.join('%s=%d' % (k, v)
+                            for k, v in sorted(tracker.limits.items())))
+
+   header = '%10s %6s %9s %6s %7s %6s %6s %6s %9s %9s %6s' % \
+            ('squarings', 'value', 'multiple', 'coeff', 'excess', 'grid',
+             'accum', 'trunc', 'v7v6', 'v5v4', 'failed')
+   print(header)
+
+   start = time.time()
+   while tracker.squarings < chain_len:
+      r = tracker.window(min(window_len, chain_len - tracker.squarings))
+      print('%10d %6d %9d %6d %7d %6d %6d %6d %9d %9d %6d' %
+            (r['squarings'], r['value'], r['multiple'], r['coeff'],
+             r['excess'], r['grid_entry'], r['accum'], r['grid_truncated'],
+             r['v7v6_overflow'], r['v5v4_overflow'], r['failed']),
+            flush=True)
+   elapsed = time.time() - start
+
+   if history_file is not None:
+      tracker.save_csv(history_file)
+
+   print()
+   print("Widest per metric:")
+   for name in LIMITED:
+      width = max(r[name] for r in tracker.history)
+      print("  %-10s %4d of %4d  %s" %
+            (name, width, tracker.limits[name],
+             level(width, tracker.limits[name], margin)))
+   print("Max excess per coefficient:", tracker.excess.tolist())
+
+   growing = tracker.growing()
+   print("Bounded" if not growing else
+         "Still growing at the end of the run: " + ', '.join(growing))
+   print("%.1f squarings per second" %
+         ((tracker.squarings * len(sqr_in)) / elapsed))
+
+   # One check per chain per window
+   tests_run    = len(tracker.history) * len(sqr_in)
+   tests_failed = sum(r['failed'] for r in tracker.history)
+   over         = [name for name, l in tracker.alerts if l == 'OVER']
+
+   print("Passed", tests_run-tests_failed, "out of", tests_run, "tests")
+
+   result_str = "FAILED" if (tests_failed > 0 or over) else "PASSED"
+   print(result_str)
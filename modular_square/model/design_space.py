@@ -0,0 +1,373 @@
+#!/usr/bin/python3
+
+################################################################################
+# Copyright 2019 Supranational LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+################################################################################
+# Design space explorer
+################################################################################
+# Enumerates (redundant, nonredundant, num_segments, word_len, bit_len,
+# num_uram) configurations, checks each one with the batched model over
+# random inputs and reports what the modular_square_8_cycles RTL would cost:
+#
+#   cycles      mean clocks per squaring, 8 plus CYCLE_8 when either
+#               overflow flag is set and CYCLE_9 when both are
+#   muls        multipliers in the two multiply blocks and their width
+#   dsps        DSP48 estimate, one per 26x17 bit product
+#   grid/mul/acc_levels
+#               CSA levels of the deepest compress_grid column tree (from the
+#               rows each column can have non-zero, GridPlan.column_rows),
+#               the deepest multiplier column tree and the accumulator trees
+#   lut_bits    reduction LUT contents
+#   brams/urams BRAM36/URAM288 blocks with num_uram tables in URAM
+#
+# Configurations are ranked per modulus size by cycles, then tree depth,
+# then DSPs.  Depth is the proxy for the squaring cycle's critical path.
+# Configurations that failed any test are listed after all passing ones.
+
+import getopt
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', '..', 'primitives', 'model'))
+
+import primitives as p
+import modular_square_9_cycles as ms
+import modular_square_batch as msb
+import reduction_lut
+import tree_analysis
+
+# Test Parameters
+NUM_SEGMENTS   = [4]                  # The multiplier schedule needs 4
+NUM_REDUNDANTS = [1, 2]               # Number of extra redundant elements
+NONREDUNDANTS  = [8, 16, 32, 64]      # number of elements list
+WORD_LENS      = [8, 16]              # bit length of each element
+NUM_URAMS      = [0]
+
+NUM_MULTIPLIERS  = 2
+BASE_CYCLES      = 8
+
+# DSP48E2 unsigned multiply
+DSP_A_BITS       = 26
+DSP_B_BITS       = 17
+
+# Block RAM aspect ratios as (depth, width)
+BRAM36_SHAPES    = [(512, 72), (1024, 36), (2048, 18), (4096, 9), (8192, 4),
+                    (16384, 2), (32768, 1)]
+URAM288_SHAPES   = [(4096, 72)]
+
+################################################################################
+# Derived metrics
+################################################################################
+
+# Reason a configuration cannot be built, None if it is valid
+def config_error(redundant, nonredundant, num_segments, word_len, bit_len,
+                 num_uram):
+   if num_segments != 4:
+      return 'multiplier schedule needs 4 segments'
+   if redundant < 1:
+      return 'needs a redundant element'
+   if nonredundant % num_segments != 0:
+      return 'nonredundant not a multiple of segments'
+   if word_len % 2 != 0:
+      return 'LUT address needs an even word length'
+   if word_len > 16:
+      return 'batched model supports words up to 16 bits'
+   if bit_len <= word_len or (bit_len - word_len) > (word_len // 2):
+      return 'overflow bits do not fit a LUT address'
+
+   segment_elements = nonredundant // num_segments
+   num_tables       = (segment_elements*2) + redundant + \
+                      reduction_lut.EXTRA_ELEMENTS
+   if num_uram > num_tables - 1:
+      return 'more URAMs than LUT tables'
+   return None
+
+# Blocks needed for one memory of depth x width with the best aspect ratio
+def memory_blocks(depth, width, shapes):
+   return min([math.ceil(depth / d) * math.ceil(width / w)
+               for d, w in shapes])
+
+def config_metrics(redundant, nonredundant, num_segments, word_len, bit_len,
+                   num_uram):
+   REDUNDANT_ELEMENTS    = redundant
+   NONREDUNDANT_ELEMENTS = nonredundant
+   NUM_SEGMENTS          = num_segments
+   WORD_LEN              = word_len
+   BIT_LEN               = bit_len
+
+   plan = ms.grid_plan(REDUNDANT_ELEMENTS, NONREDUNDANT_ELEMENTS,
+                       NUM_SEGMENTS, BIT_LEN, WORD_LEN)
+
+   NUM_ELEMENTS          = REDUNDANT_ELEMENTS + NONREDUNDANT_ELEMENTS
+   SEGMENT_ELEMENTS      = plan.segment_elements
+   MUL_NUM_ELEMENTS      = plan.mul_num_elements
+   ACC_ELEMENTS          = (SEGMENT_ELEMENTS*2) + REDUNDANT_ELEMENTS + \
+                           reduction_lut.EXTRA_ELEMENTS
+
+   num_tables            = ACC_ELEMENTS
+   num_entries           = 2 * (2**(WORD_LEN // 2))
+   entry_bits            = WORD_LEN * NONREDUNDANT_ELEMENTS
+
+   muls                  = NUM_MULTIPLIERS * (MUL_NUM_ELEMENTS**2)
+   dsps_per_mul          = math.ceil(BIT_LEN / DSP_A_BITS) * \
+                           math.ceil(BIT_LEN / DSP_B_BITS)
+
+   # Middle multiplier columns have the most products
+   mul_column_terms      = (MUL_NUM_ELEMENTS*2) - 1
+
+   grid_columns          = tree_analysis.analyze_grid(
+                              [(rows, plan.grid_bit_len)
+                               for rows in plan.column_rows()])
+
+   return {'modulus_bits'  : NONREDUNDANT_ELEMENTS * WORD_LEN,
+           'num_elements'  : NUM_ELEMENTS,
+           'muls'          : muls,
+           'mul_width'     : '%dx%d' % (BIT_LEN, BIT_LEN),
+           'dsps'          : muls * dsps_per_mul,
+           'mul_bit_len'   : plan.mul_bit_len,
+           'grid_size'     : plan.grid_size,
+           'grid_bit_len'  : plan.grid_bit_len,
+           'grid_levels'   : tree_analysis.summarize(grid_columns)['levels'],
+           'grid_column_levels' : [c['levels'] for c in grid_columns],
+           'mul_levels'    : p.compressor_tree_levels(mul_column_terms),
+           'acc_levels'    : p.compressor_tree_levels(ACC_ELEMENTS + 3),
+           'lut_tables'    : num_tables,
+           'lut_bits'      : num_tables * num_entries * entry_bits,
+           'urams'         : num_uram *
+                             memory_blocks(num_entries, entry_bits,
+                                           URAM288_SHAPES),
+           'brams'         : (num_tables - num_uram) *
+                             memory_blocks(num_entries, entry_bits,
+                                           BRAM36_SHAPES)}
+
+# Deepest tree on the squaring cycle path
+def max_levels(metrics):
+   return max(metrics['grid_levels'], metrics['mul_levels'],
+              metrics['acc_levels'])
+
+################################################################################
+# Running one configuration
+################################################################################
+
+def run_config(config):
+   (redundant, nonredundant, num_segments, word_len, bit_len, num_uram,
+    seed, num_inputs, chain_len) = config
+
+   result = {'redundant'    : redundant,
+             'nonredundant' : nonredundant,
+             'num_segments' : num_segments,
+             'word_len'     : word_len,
+             'bit_len'      : bit_len,
+             'num_uram'     : num_uram,
+             'tests_run'    : 0,
+             'tests_failed' : 0,
+             'skipped'      : False,
+             'error'        : config_error(redundant, nonredundant,
+                                           num_segments, word_len, bit_len,
+                                           num_uram)}
+
+   if result['error'] is not None:
+      result['skipped'] = True
+      return result
+
+   start = time.time()
+
+   result.update(config_metrics(redundant, nonredundant, num_segments,
+                                word_len, bit_len, num_uram))
+
+   rng    = random.Random('%d:%d:%d:%d:%d' % (redundant, nonredundant,
+                                              word_len, bit_len, seed))
+   mod_in = rng.getrandbits(nonredundant*word_len)
+   sqr_in = [rng.getrandbits(nonredundant*word_len)
+             for i in range (num_inputs)]
+
+   try:
+      redLUT = ms.generate_reduction_luts(mod_in, nonredundant, redundant,
+                                          num_segments, word_len)
+      lut    = msb.lut_array(redLUT)
+
+      extra_cycles = 0
+      coeffs       = msb.to_coefficients(sqr_in, redundant + nonredundant,
+                                         word_len)
+      for c in range (chain_len):
+         stats  = {}
+         coeffs = msb.modular_square(msb.normalize(coeffs, word_len), lut,
+                                     redundant, nonredundant, num_segments,
+                                     bit_len, word_len, stats)
+
+         v7v6          = stats['v7v6_overflow'].astype(bool)
+         v5v4          = stats['v5v4_overflow'].astype(bool)
+         extra_cycles += int(np.sum(v7v6 | v5v4)) + int(np.sum(v7v6 & v5v4))
+
+         sqr_out = msb.from_coefficients(coeffs, word_len)
+         for i in range (num_inputs):
+            result['tests_run'] += 1
+            if (sqr_out[i] % mod_in) != ((sqr_in[i] * sqr_in[i]) % mod_in):
+               result['tests_failed'] += 1
+         sqr_in = sqr_out
+
+      result['cycles'] = BASE_CYCLES + (extra_cycles / result['tests_run'])
+   except Exception as e:
+      result['error'] = '%s: %s' % (type(e).__name__, e)
+
+   result['elapsed'] = time.time() - start
+
+   return result
+
+def status(result):
+   if result['skipped']:
+      return 'SKIPPED'
+   if result['error'] is not None:
+      return 'ERROR'
+   return 'FAILED' if (result['tests_failed'] > 0) else 'PASSED'
+
+def rank_key(result):
+   return (result['tests_failed'] > 0, result['modulus_bits'],
+           result['cycles'], max_levels(result),
+           result['dsps'], result['brams'] + result['urams'])
+
+################################################################################
+# Summary
+################################################################################
+
+def summary_table(results):
+   ranked  = sorted([r for r in results if r['error'] is None],
+                    key=rank_key)
+   skipped = [r for r in results if r not in ranked]
+
+   lines = []
+   lines.append('%7s %3s %4s %3s %3s %4s %4s %6s %6s %5s %6s %4s %4s %4s '
+                '%10s %5s %5s  %s' %
+                ('modbits', 'red', 'nred', 'seg', 'wl', 'bl', 'uram',
+                 'cycles', 'muls', 'width', 'dsps', 'grid', 'mul', 'acc',
+                 'lut_bits', 'brams', 'urams', 'result'))
+   for r in ranked:
+      lines.append('%7d %3d %4d %3d %3d %4d %4d %6.3f %6d %5s %6d %4d %4d %4d '
+                   '%10d %5d %5d  %s' %
+                   (r['modulus_bits'], r['redundant'], r['nonredundant'],
+                    r['num_segments'], r['word_len'], r['bit_len'],
+                    r['num_uram'], r['cycles'], r['muls'], r['mul_width'],
+                    r['dsps'], r['grid_levels'], r['mul_levels'],
+                    r['acc_levels'], r['lut_bits'], r['brams'], r['urams'],
+                    status(r)))
+   for r in skipped:
+      lines.append('%-7s %3d %4d %3d %3d %4d %4d  %s' %
+                   (status(r), r['redundant'], r['nonredundant'],
+                    r['num_segments'], r['word_len'], r['bit_len'],
+                    r['num_uram'], r['error']))
+   return '\n'.join(lines) + '\n'
+
+def usage():
+   print('design_space.py -n <num inputs> -c <chain length> -s <seed>',
+         '-j <processes> [-o <json file>]',
+         '[-r <redundants>] [-e <nonredundants>] [-g <segments>]',
+         '[-w <word lens>] [-b <bit len - word len>] [-u <num urams>]')
+   print('  lists are comma separated, e.g. -w 8,16')
+
+if __name__ == "__main__":
+   num_inputs    = 64
+   chain_len     = 4
+   seed          = 0
+   processes     = None
+   json_file     = None
+   redundants    = NUM_REDUNDANTS
+   nonredundants = NONREDUNDANTS
+   num_segments  = NUM_SEGMENTS
+   word_lens     = WORD_LENS
+   extra_bits    = [1]
+   num_urams     = NUM_URAMS
+
+   try:
+      opts, args = getopt.getopt(sys.argv[1:], "hn:c:s:j:o:r:e:g:w:b:u:")
+   except getopt.GetoptError:
+      usage()
+      sys.exit(2)
+
+   for opt, arg in opts:
+      if opt == '-h':
+         usage()
+         sys.exit()
+      elif opt == '-n':
+         num_inputs = int(arg)
+      elif opt == '-c':
+         chain_len = int(arg)
+      elif opt == '-s':
+         seed = int(arg)
+      elif opt == '-j':
+         processes = int(arg)
+      elif opt == '-o':
+         json_file = arg
+      elif opt == '-r':
+         redundants = [int(x) for x in arg.split(',')]
+      elif opt == '-e':
+         nonredundants = [int(x) for x in arg.split(',')]
+      elif opt == '-g':
+         num_segments = [int(x) for x in arg.split(',')]
+      elif opt == '-w':
+         word_lens = [int(x) for x in arg.split(',')]
+      elif opt == '-b':
+         extra_bits = [int(x) for x in arg.split(',')]
+      elif opt == '-u':
+         num_urams = [int(x) for x in arg.split(',')]
+
+   configs = [(r, e, g, w, w + b, u, seed, num_inputs, chain_len)
+              for r in redundants
+              for e in nonredundants
+              for g in num_segments
+              for w in word_lens
+              for b in extra_bits
+              for u in num_urams]
+
+   # Larger configurations first so they are not left running alone at the
+   # end of the run
+   configs.sort(key=lambda c: c[1] * c[3], reverse=True)
+
+   print("Exploring", len(configs), "configurations")
+
+   results = []
+   with multiprocessing.Pool(processes) as pool:
+      for r in pool.imap_unordered(run_config, configs):
+         results.append(r)
+
+   print(summary_table(results), end='')
+
+   if json_file is not None:
+      with open(json_file, 'w') as f:
+         json.dump(sorted(results, key=lambda r: (r['nonredundant'],
+                                                  r['word_len'],
+                                                  r['redundant'],
+                                                  r['bit_len'],
+                                                  r['num_uram'])),
+                   f, indent=1)
+
+   tests_run    = sum(r['tests_run'] for r in results)
+   tests_failed = sum(r['tests_failed'] for r in results)
+   errors       = sum(1 for r in results if status(r) == 'ERROR')
+
+   print("Passed", tests_run-tests_failed, "out of", tests_run, "tests")
+
+   result_str = "FAILED" if (tests_failed > 0 or errors > 0) else "PASSED"
+   print(result_str)
+   sys.exit(1 if result_str == "FAILED" else 0)
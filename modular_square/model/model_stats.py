@@ -0,0 +1,154 @@
+################################################################################
+# Copyright 2019 Supranational LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+################################################################################
+# Model profiling
+################################################################################
+# Collects per cycle statistics from modular_square() over many squarings.
+# Pass a ModelProfile as the profile argument of the scalar or batch model
+# and it accumulates:
+#
+#   counters  - event counts, e.g. how often the V7V6/V5V4 overflow cycles run
+#   widths    - per metric histogram of bit widths, one sample per squaring
+#               (the widest value seen in that squaring), e.g. the widest
+#               grid entry in each compress cycle vs GRID_BIT_LEN or the
+#               widest curr_accum coefficient before each partial reduction
+#   lut       - per lookup kind histogram of LUT addresses
+#   limits    - the bit width each metric is sized against, if any
+#
+# Profiles from separate runs or worker processes are combined with merge()
+# and exported with save_json() or save_csv().
+
+import csv
+import json
+from collections import Counter, defaultdict
+
+class ModelProfile:
+   def __init__(self):
+      self.runs     = 0
+      self.counters = Counter()
+      self.widths   = defaultdict(Counter)
+      self.lut      = defaultdict(Counter)
+      self.limits   = {}
+
+   ############################################################################
+   # Recording
+   ############################################################################
+
+   def add_runs(self, n=1):
+      self.runs += n
+
+   # Zero counts are skipped so scalar and batch profiles compare equal
+   def count(self, name, n=1):
+      if n:
+         self.counters[name] += n
+
+   def set_limit(self, name, value):
+      self.limits[name] = value
+
+   # One squaring's widest value for a metric
+   def width(self, name, value):
+      self.widths[name][value.bit_length()] += 1
+
+   # Pre-binned {width: count} samples, e.g. from the batch model
+   def add_widths(self, name, hist):
+      self.widths[name].update(hist)
+
+   def lut_addr(self, kind, addr):
+      self.lut[kind][addr] += 1
+
+   def add_lut_addrs(self, kind, hist):
+      self.lut[kind].update(hist)
+
+   def merge(self, other):
+      self.runs += other.runs
+      self.counters.update(other.counters)
+      for name, hist in other.widths.items():
+         self.widths[name].update(hist)
+      for kind, hist in other.lut.items():
+         self.lut[kind].update(hist)
+      self.limits.update(other.limits)
+
+   ############################################################################
+   # Reporting
+   ############################################################################
+
+   def max_width(self, name):
+      return max(self.widths[name]) if self.widths[name] else 0
+
+   def to_dict(self):
+      return {'runs'     : self.runs,
+              'counters' : dict(self.counters),
+              'limits'   : dict(self.limits),
+              'widths'   : {n: {str(w): c for w, c in sorted(h.items())}
+                            for n, h in sorted(self.widths.items())},
+              'lut'      : {k: {str(a): c for a, c in sorted(h.items())}
+                            for k, h in sorted(self.lut.items())}}
+
+   @classmethod
+   def from_dict(cls, d):
+      profile          = cls()
+      profile.runs     = d['runs']
+      profile.counters = Counter(d['counters'])
+      profile.limits   = dict(d['limits'])
+      for n, h in d['widths'].items():
+         profile.widths[n] = Counter({int(w): c for w, c in h.items()})
+      for k, h in d['lut'].items():
+         profile.lut[k] = Counter({int(a): c for a, c in h.items()})
+      return profile
+
+   def save_json(self, filename):
+      with open(filename, 'w') as f:
+         json.dump(self.to_dict(), f, indent=1)
+
+   @classmethod
+   def load_json(cls, filename):
+      with open(filename) as f:
+         return cls.from_dict(json.load(f))
+
+   # Flat table of section, name, bucket, count
+   def save_csv(self, filename):
+      with open(filename, 'w', newline='') as f:
+         w = csv.writer(f)
+         w.writerow(['section', 'name', 'bucket', 'count'])
+         w.writerow(['runs', '', '', self.runs])
+         for name, c in sorted(self.counters.items()):
+            w.writerow(['counter', name, '', c])
+         for name, v in sorted(self.limits.items()):
+            w.writerow(['limit', name, '', v])
+         for name, h in sorted(self.widths.items()):
+            for width, c in sorted(h.items()):
+               w.writerow(['width', name, width, c])
+         for kind, h in sorted(self.lut.items()):
+            for addr, c in sorted(h.items()):
+               w.writerow(['lut', kind, addr, c])
+
+   def summary(self):
+      lines = ['Runs: %d' % self.runs]
+      for name, c in sorted(self.counters.items()):
+         rate = c / self.runs if self.runs else 0
+         lines.append('%-24s %10d  (%.6f per run)' % (name, c, rate))
+      for name in sorted(self.widths):
+         limit  = self.limits.get(name)
+         margin = '' if limit is None else \
+                  '  limit %d, margin %d' % (limit, limit-self.max_width(name))
+         lines.append('%-24s max width %3d%s' % (name, self.max_width(name),
+                                                 margin))
+      for kind in sorted(self.lut):
+         lines.append('%-24s %d distinct addresses, max %d' %
+                      ('lut ' + kind, len(self.lut[kind]),
+                       max(self.lut[kind])))
+      return '\n'.join(lines)
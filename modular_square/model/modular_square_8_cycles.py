@@ -0,0 +1,728 @@
+#!/usr/bin/python3
+
+################################################################################
+# Copyright 2019 Supranational LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+################################################################################
+# Cycle accurate 8 cycle modular square model
+################################################################################
+# Clock by clock model of modular_square/rtl/modular_square_8_cycles.sv and
+# the reduction_lut module written by gen_reduction_lut.py.  Every register
+# of the RTL is held under its RTL name and clock() advances them all by one
+# posedge, evaluating the combinational logic in between on whole words:
+#
+#   CYCLE_0 - CYCLE_4  multiplier input selects (MUL0_A etc. of the 9 cycle
+#                      model), products flopped in the multipliers
+#   CYCLE_1 - CYCLE_5  multiplier column compressor trees, Cout/S flopped
+#   CYCLE_2 - CYCLE_6  grid compression, v7v6 ... v2v0 flopped
+#   CYCLE_3 - CYCLE_8  reduction LUT addresses, LUT read flopped
+#   CYCLE_4 - CYCLE_9  accumulator compression, sq_out flopped
+#
+# CYCLE_8 and CYCLE_9 only run when v7v6_overflow or v5v4_overflow is set.
+# Once started the RTL loops sq_out back into the multipliers, so run()
+# models a squaring chain exactly as the MSU drives it.
+#
+# Compressor trees use primitives.compressor_tree_fixed and the grid
+# placement comes from the 9 cycle model's GridPlan, so all values are
+# bit-exact with the RTL.  state() returns the registers after the last
+# clock and format_state() prints them one signal per line,
+#   <clock> <signal> <element 0> <element 1> ...
+# in hex, which diffs directly against the same signals extracted from a
+# Verilator trace.  Registers start at 0 as they do in Verilator.
+#
+# Only the 17x17 bit multiplier configuration is modeled, not DSP26BITS.
+
+import getopt
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', '..', 'primitives', 'model'))
+
+import primitives as p
+import modular_square_9_cycles as ms
+import reduction_lut
+
+################################################################################
+# Parameters
+################################################################################
+
+IDLE        = 0
+CYCLE_0     = 1
+CYCLE_1     = 2
+CYCLE_2     = 3
+CYCLE_3     = 4
+CYCLE_4     = 5
+CYCLE_5     = 6
+CYCLE_6     = 7
+CYCLE_7     = 8
+CYCLE_8     = 9
+CYCLE_9     = 10
+NUM_CYCLES  = 11
+
+CYCLE_NAMES = ['IDLE'] + ['CYCLE_%d' % i for i in range (NUM_CYCLES-1)]
+
+# Cycles of the multiplier selects and of the grid placement, the multiplier
+# outputs arrive two clocks after their inputs are selected
+MUL_SELECT_CYCLE = CYCLE_0
+MUL_RESULT_CYCLE = CYCLE_2
+
+def clog2(x):
+   return (x-1).bit_length()
+
+################################################################################
+# Conversion between integers and coefficients
+################################################################################
+
+def to_coefficients(value, num_elements, word_len):
+   word_mask = (2**word_len) - 1
+   return [(value >> (i*word_len)) & word_mask for i in range (num_elements)]
+
+def from_coefficients(coeffs, word_len):
+   value = 0
+   for i in range (len(coeffs)-1, -1, -1):
+      value = (value << word_len) + coeffs[i]
+   return value
+
+################################################################################
+# Word-level RTL building blocks
+################################################################################
+
+# Carry propagate add each column and partially reduce by adding the
+# neighbor's carry, the grid_sum/reduced_grid_sum and acc_sum/reduced_acc_sum
+# blocks of the RTL
+def reduce_columns(C, S, word_len, bit_len):
+   WORD_MASK = (2**word_len) - 1
+   BIT_MASK  = (2**bit_len) - 1
+
+   col_sum = [c + s for c, s in zip(C, S)]
+   last    = len(col_sum) - 1
+
+   reduced = [col_sum[0] & WORD_MASK]
+   for k in range (1, last):
+      reduced.append(((col_sum[k] & WORD_MASK) +
+                      (col_sum[k-1] >> word_len)) & BIT_MASK)
+   reduced.append(((col_sum[last] & BIT_MASK) +
+                   (col_sum[last-1] >> word_len)) & BIT_MASK)
+   return reduced
+
+# Compress columns of terms with RTL compressor trees, columns of equal
+# length are evaluated together in lanes.  Returns the C and S lists.
+def compress_columns(columns, bit_len):
+   C = [0] * len(columns)
+   S = [0] * len(columns)
+
+   groups = {}
+   for i, column in enumerate(columns):
+      groups.setdefault(len(column), []).append(i)
+
+   for index in groups.values():
+      lanes = len(index)
+      c, s  = p.compressor_tree_fixed(p.pack_lanes([columns[i] for i in index],
+                                                   bit_len),
+                                      bit_len, lanes)
+      for i, cl, sl in zip(index, p.unpack_lanes(c, bit_len, lanes),
+                           p.unpack_lanes(s, bit_len, lanes)):
+         C[i] = cl
+         S[i] = sl
+
+   return C, S
+
+# Column sums of multiply.sv over the flopped products of each multiplier.
+# Each column only compresses the rows of the grid parallelogram it uses, the
+# first and last columns have a single entry returned in S.
+def multiply_columns(mul_results, num_elements, word_len, out_bit_len):
+   NUM_ELEMENTS = num_elements
+   WORD_MASK    = (2**word_len) - 1
+
+   columns = []
+   for mul_result in mul_results:
+      grid = [[0] * (NUM_ELEMENTS*2) for i in range (NUM_ELEMENTS*2)]
+      for i in range (NUM_ELEMENTS):
+         for j in range (NUM_ELEMENTS):
+            P                    = mul_result[(NUM_ELEMENTS*i)+j]
+            grid[i+j][2*i]       = P & WORD_MASK
+            grid[i+j+1][(2*i)+1] = P >> word_len
+
+      columns.append(grid[0][0:1])
+      for i in range (1, (NUM_ELEMENTS*2)-1):
+         if (i < NUM_ELEMENTS):
+            cur_elements = (i*2) + 1
+            grid_index   = 0
+         else:
+            cur_elements = (NUM_ELEMENTS*4) - 1 - (i*2)
+            grid_index   = ((i - NUM_ELEMENTS) * 2) + 1
+         columns.append(grid[i][grid_index:grid_index+cur_elements])
+      columns.append(grid[(NUM_ELEMENTS*2)-1][(NUM_ELEMENTS*2)-1:])
+
+   C, S = compress_columns(columns, out_bit_len)
+
+   num_cols = NUM_ELEMENTS*2
+   return ([C[k:k+num_cols] for k in range (0, len(C), num_cols)],
+           [S[k:k+num_cols] for k in range (0, len(S), num_cols)])
+
+################################################################################
+# Modular square RTL model
+################################################################################
+
+class ModularSquare8Cycles:
+   def __init__(self, mod_in, redundant_elements=2, nonredundant_elements=8,
+                num_segments=4, bit_len=17, word_len=16, redLUT=None):
+      REDUNDANT_ELEMENTS    = redundant_elements
+      NONREDUNDANT_ELEMENTS = nonredundant_elements
+      NUM_SEGMENTS          = num_segments
+      BIT_LEN               = bit_len
+      WORD_LEN              = word_len
+
+      NUM_ELEMENTS          = REDUNDANT_ELEMENTS + NONREDUNDANT_ELEMENTS
+      SEGMENT_ELEMENTS      = NONREDUNDANT_ELEMENTS // NUM_SEGMENTS
+      MUL_NUM_ELEMENTS      = REDUNDANT_ELEMENTS + SEGMENT_ELEMENTS
+
+      EXTRA_ELEMENTS        = 2
+      TWO_SEGMENTS          = (SEGMENT_ELEMENTS*2) + EXTRA_ELEMENTS + \
+                              REDUNDANT_ELEMENTS
+      THREE_SEGMENTS        = (SEGMENT_ELEMENTS*3) + EXTRA_ELEMENTS + \
+                              REDUNDANT_ELEMENTS
+
+      NUM_MULTIPLIERS       = 2
+      EXTRA_MUL_TREE_BITS   = clog2(MUL_NUM_ELEMENTS)                     \
+                              if (BIT_LEN > WORD_LEN) else                \
+                              clog2(MUL_NUM_ELEMENTS*2)
+      MUL_BIT_LEN           = ((BIT_LEN*2) - WORD_LEN) + EXTRA_MUL_TREE_BITS
+
+      MAX_VALUE             = ((2**BIT_LEN)-1)           +                \
+                              (((2**WORD_LEN)-1) << 2)   +                \
+                              (((2**(MUL_BIT_LEN-WORD_LEN))-1) << 2)
+      GRID_BIT_LEN          = clog2(MAX_VALUE)
+      GRID_SIZE             = (MUL_NUM_ELEMENTS*2) + 1 + SEGMENT_ELEMENTS
+
+      LOOK_UP_WIDTH         = WORD_LEN // 2
+      ACC_ELEMENTS          = TWO_SEGMENTS
+      ACC_EXTRA_ELEMENTS    = 3 # Prev, V3, V2V0
+      ACC_BIT_LEN           = BIT_LEN + clog2(ACC_ELEMENTS +
+                                              ACC_EXTRA_ELEMENTS)
+
+      self.mod_in                = mod_in
+      self.redundant_elements    = REDUNDANT_ELEMENTS
+      self.nonredundant_elements = NONREDUNDANT_ELEMENTS
+      self.num_segments          = NUM_SEGMENTS
+      self.bit_len               = BIT_LEN
+      self.word_len              = WORD_LEN
+      self.num_elements          = NUM_ELEMENTS
+      self.segment_elements      = SEGMENT_ELEMENTS
+      self.mul_num_elements      = MUL_NUM_ELEMENTS
+      self.three_segments        = THREE_SEGMENTS
+      self.num_multipliers       = NUM_MULTIPLIERS
+      self.mul_bit_len           = MUL_BIT_LEN
+      self.grid_bit_len          = GRID_BIT_LEN
+      self.grid_size             = GRID_SIZE
+      self.look_up_width         = LOOK_UP_WIDTH
+      self.acc_elements          = ACC_ELEMENTS
+      self.acc_bit_len           = ACC_BIT_LEN
+
+      self.plan = ms.grid_plan(REDUNDANT_ELEMENTS, NONREDUNDANT_ELEMENTS,
+                               NUM_SEGMENTS, BIT_LEN, WORD_LEN)
+
+      if redLUT is None:
+         redLUT = reduction_lut.load(mod_in, REDUNDANT_ELEMENTS,
+                                     NONREDUNDANT_ELEMENTS, NUM_SEGMENTS,
+                                     WORD_LEN)
+      self.redLUT = redLUT
+
+      # Registers, all zero as in Verilator
+      self.clocks              = 0
+      self.curr_cycle          = 0   # One hot, bit n is cycle n
+      self.start_d1            = 0
+      self.valid               = 0
+      self.sq_in_d1            = [0] * NUM_ELEMENTS
+      self.sq_out              = [0] * NUM_ELEMENTS
+      self.sq_out_d1           = [0] * (NONREDUNDANT_ELEMENTS // 2)
+      self.mul_result          = [[0] * (MUL_NUM_ELEMENTS**2)
+                                  for i in range (NUM_MULTIPLIERS)]
+      self.mul_cout            = [[0] * (MUL_NUM_ELEMENTS*2)
+                                  for i in range (NUM_MULTIPLIERS)]
+      self.mul_s               = [[0] * (MUL_NUM_ELEMENTS*2)
+                                  for i in range (NUM_MULTIPLIERS)]
+      self.v7v6                = [0] * ACC_ELEMENTS
+      self.v5_partial          = [0] * SEGMENT_ELEMENTS
+      self.v5v4_partial        = [0] * ACC_ELEMENTS
+      self.v5v4                = [0] * ACC_ELEMENTS
+      self.v3_partial          = [0] * SEGMENT_ELEMENTS
+      self.v3                  = [0] * MUL_NUM_ELEMENTS
+      self.v2_partial          = [0] * SEGMENT_ELEMENTS
+      self.v2v0                = [0] * THREE_SEGMENTS
+      self.v7v6_overflow       = 0
+      self.v5v4_overflow       = 0
+      # Read data as the NONREDUNDANT_ELEMENTS words of each LUT entry
+      self.lut_read_data       = [[0] * NONREDUNDANT_ELEMENTS
+                                  for i in range (ACC_ELEMENTS)]
+      self.shift_high_1d       = 0
+      self.shift_overflow_1d   = 0
+
+   def in_cycle(self, *cycles):
+      return any((self.curr_cycle >> c) & 1 for c in cycles)
+
+   # Number of the current state, -1 before the first reset
+   def cycle_index(self):
+      return self.curr_cycle.bit_length() - 1
+
+   def cycle_name(self):
+      if self.curr_cycle == 0:
+         return None
+      return CYCLE_NAMES[self.cycle_index()]
+
+   ##########################################################################
+   # Combinational logic
+   ##########################################################################
+
+   # Next state, out_valid and the multiplier selects as ((A0, B0), (A1, B1))
+   def state_machine(self, reset, start):
+      if reset:
+         return (1 << IDLE), 0, ((0, 0), (0, 0))
+
+      selects = ((0, 0), (0, 0))
+      if self.in_cycle(CYCLE_0, CYCLE_1, CYCLE_2, CYCLE_3, CYCLE_4):
+         selects, _ = self.plan.cycles[self.cycle_index() -
+                                       MUL_SELECT_CYCLE]
+
+      if self.in_cycle(IDLE):
+         return (1 << (CYCLE_0 if start else IDLE)), 0, selects
+      elif self.in_cycle(CYCLE_7):
+         if self.v5v4_overflow or self.v7v6_overflow:
+            return (1 << CYCLE_8), 0, selects
+         return (1 << CYCLE_0), 1, selects
+      elif self.in_cycle(CYCLE_8):
+         if self.v5v4_overflow and self.v7v6_overflow:
+            return (1 << CYCLE_9), 0, selects
+         return (1 << CYCLE_0), 1, selects
+      elif self.in_cycle(CYCLE_9):
+         return (1 << CYCLE_0), 1, selects
+      elif self.curr_cycle != 0:
+         return (self.curr_cycle << 1), 0, selects
+
+      # No state before the first reset
+      return 0, 0, selects
+
+   # Square input from external or loopback, the lower half comes from the
+   # flopped sq_out
+   def curr_sq_in(self):
+      if self.start_d1:
+         return self.sq_in_d1
+      return self.sq_out_d1 + self.sq_out[self.nonredundant_elements // 2:]
+
+   def mul_inputs(self, select, curr_sq_in):
+      SEGMENT_ELEMENTS   = self.segment_elements
+      REDUNDANT_ELEMENTS = self.redundant_elements
+
+      x = curr_sq_in[select*SEGMENT_ELEMENTS:(select+1)*SEGMENT_ELEMENTS]
+
+      # Redundant elements are only used as extension to highest element
+      if select == 3:
+         return x + curr_sq_in[self.num_elements-REDUNDANT_ELEMENTS:]
+      return x + [0] * REDUNDANT_ELEMENTS
+
+   # Multiplier results placed in the grid for the current cycle, returned
+   # as a list of GRID_SIZE columns
+   def grid(self):
+      WORD_LEN         = self.word_len
+      SEGMENT_ELEMENTS = self.segment_elements
+      GRID_MASK        = (2**self.grid_bit_len) - 1
+
+      grid = [[0] * ms.GRID_ROWS for i in range (self.grid_size)]
+
+      if not self.in_cycle(CYCLE_2, CYCLE_3, CYCLE_4, CYCLE_5, CYCLE_6):
+         return grid
+
+      _, places = self.plan.cycles[self.cycle_index() - MUL_RESULT_CYCLE]
+      for mul, output, shift, col, row in places:
+         values = self.mul_s[mul] if output else self.mul_cout[mul]
+         # Shift is required for x2 of multiply result used in square
+         split  = WORD_LEN - shift
+         for k, v in enumerate(values):
+            grid[col+k][row]     = ((v & ((2**split)-1)) << shift) & GRID_MASK
+            grid[col+k+1][row+1] = (v >> split) & GRID_MASK
+
+      # Set last grid row based on cycle
+      if self.in_cycle(CYCLE_3):
+         prev, offset = self.v5_partial, SEGMENT_ELEMENTS
+      elif self.in_cycle(CYCLE_4):
+         prev, offset = self.v5v4_partial, SEGMENT_ELEMENTS
+      elif self.in_cycle(CYCLE_5):
+         prev, offset = self.v3_partial, SEGMENT_ELEMENTS
+      elif self.in_cycle(CYCLE_6):
+         prev, offset = self.v2_partial, SEGMENT_ELEMENTS*2
+      else:
+         prev, offset = [], 0
+      for k, v in enumerate(prev):
+         grid[k+offset][ms.PREV_ROW] = v
+
+      return grid
+
+   # Compressed and partially reduced grid, reduced_grid_sum
+   def reduced_grid_sum(self):
+      C, S = compress_columns(self.grid(), self.grid_bit_len)
+      return reduce_columns(C, S, self.word_len, self.bit_len)
+
+   # Reduction LUT addresses, shift_high, shift_overflow and set_overflow
+   def lookup(self):
+      WORD_LEN      = self.word_len
+      LOOK_UP_WIDTH = self.look_up_width
+      LUT_MASK      = (2**LOOK_UP_WIDTH) - 1
+
+      v7v6_overflow = self.v7v6_overflow
+      v5v4_overflow = self.v5v4_overflow
+
+      if (self.in_cycle(CYCLE_3, CYCLE_4) or
+          (self.in_cycle(CYCLE_5) and v7v6_overflow)):
+         segment = self.v7v6
+      else:
+         segment = self.v5v4
+
+      shift          = (self.in_cycle(CYCLE_3) or
+                        (self.in_cycle(CYCLE_5) and not v7v6_overflow) or
+                        (self.in_cycle(CYCLE_6) and v7v6_overflow))
+      check_overflow = self.in_cycle(CYCLE_4, CYCLE_6)
+      upper_table    = ((self.in_cycle(CYCLE_5) and not v7v6_overflow) or
+                        self.in_cycle(CYCLE_6, CYCLE_7, CYCLE_8))
+      overflow       = ((self.in_cycle(CYCLE_5) and v7v6_overflow) or
+                        (self.in_cycle(CYCLE_7) and
+                         (v5v4_overflow and not v7v6_overflow)) or
+                        self.in_cycle(CYCLE_8))
+
+      set_overflow = 0
+      lut_addr     = []
+      for v in segment:
+         if overflow:
+            addr = v >> WORD_LEN
+         elif shift:
+            addr = (v >> LOOK_UP_WIDTH) & LUT_MASK
+         else:
+            addr = v & LUT_MASK
+
+         if check_overflow and (v >> WORD_LEN) > 0:
+            set_overflow = 1
+
+         # Upper LUT address bit selects the V5V4 half
+         lut_addr.append(addr | (int(upper_table) << LOOK_UP_WIDTH))
+
+      return lut_addr, int(shift), int(overflow), set_overflow
+
+   # Formatted LUT output, lut_data[NUM_ELEMENTS][ACC_ELEMENTS]
+   def lut_data(self):
+      NONREDUNDANT_ELEMENTS = self.nonredundant_elements
+      LOOK_UP_WIDTH         = self.look_up_width
+      LUT_MASK              = (2**LOOK_UP_WIDTH) - 1
+
+      lut_data = [[0] * self.acc_elements for i in range (self.num_elements)]
+      for k, row in enumerate(self.lut_read_data):
+         words = list(row) + [0]
+         for l in range (NONREDUNDANT_ELEMENTS+1):
+            prev = words[l-1] if l > 0 else 0
+            if self.shift_high_1d:
+               lut_data[l][k] = ((words[l] & LUT_MASK) << LOOK_UP_WIDTH) | \
+                                (prev >> LOOK_UP_WIDTH)
+            elif self.shift_overflow_1d:
+               lut_data[l][k] = prev
+            else:
+               lut_data[l][k] = words[l]
+      return lut_data
+
+   # Accumulated LUT values with the running total, reduced_acc_sum
+   def reduced_acc_sum(self):
+      SEGMENT_ELEMENTS = self.segment_elements
+
+      add_prev  = self.in_cycle(CYCLE_5, CYCLE_6, CYCLE_7, CYCLE_8, CYCLE_9)
+      add_v3v0  = self.in_cycle(CYCLE_7)
+      v3_offset = SEGMENT_ELEMENTS*3
+
+      columns = []
+      for k, terms in enumerate(self.lut_data()):
+         prev = self.sq_out[k] if add_prev else 0
+         v2v0 = 0
+         v3   = 0
+         # Add in V3 - V0
+         if add_v3v0:
+            if k < self.three_segments:
+               v2v0 = self.v2v0[k]
+            if v3_offset <= k < v3_offset + len(self.v3):
+               v3 = self.v3[k-v3_offset]
+         columns.append(terms + [prev, v2v0, v3])
+
+      C, S = compress_columns(columns, self.acc_bit_len)
+      return reduce_columns(C, S, self.word_len, self.bit_len)
+
+   ##########################################################################
+   # Clock
+   ##########################################################################
+
+   # Advance every register by one posedge.  sq_in is a list of NUM_ELEMENTS
+   # coefficients, only sampled when start is set.
+   def clock(self, reset=0, start=0, sq_in=None):
+      SEGMENT_ELEMENTS      = self.segment_elements
+      NONREDUNDANT_ELEMENTS = self.nonredundant_elements
+      MUL_NUM_ELEMENTS      = self.mul_num_elements
+
+      next_cycle, out_valid, selects = self.state_machine(reset, start)
+
+      # Multipliers, products then column sums are flopped
+      curr_sq_in = self.curr_sq_in()
+      mul_result = []
+      for a, b in selects:
+         A = self.mul_inputs(a, curr_sq_in)
+         B = self.mul_inputs(b, curr_sq_in)
+         mul_result.append([x * y for x in A for y in B])
+      mul_cout, mul_s = multiply_columns(self.mul_result, MUL_NUM_ELEMENTS,
+                                         self.word_len, self.mul_bit_len)
+
+      # Flop segments out of grid accumulator based on cycle
+      if self.in_cycle(CYCLE_2, CYCLE_3, CYCLE_4, CYCLE_5, CYCLE_6):
+         reduced = self.reduced_grid_sum()
+         upper   = reduced[SEGMENT_ELEMENTS:]
+         if self.in_cycle(CYCLE_2):
+            self.v7v6         = upper[:self.acc_elements]
+            self.v5_partial   = reduced[:SEGMENT_ELEMENTS]
+         elif self.in_cycle(CYCLE_3):
+            self.v5v4_partial = reduced[:self.acc_elements]
+         elif self.in_cycle(CYCLE_4):
+            self.v5v4         = upper[:self.acc_elements]
+            self.v3_partial   = reduced[:SEGMENT_ELEMENTS]
+         elif self.in_cycle(CYCLE_5):
+            self.v3           = upper[:MUL_NUM_ELEMENTS]
+            self.v2_partial   = reduced[:SEGMENT_ELEMENTS]
+         else:
+            self.v2v0         = reduced[:self.three_segments]
+
+      # Reduction LUT read, the shift controls are delayed to match
+      lut_addr, shift_high, shift_overflow, set_overflow = self.lookup()
+
+      if self.in_cycle(CYCLE_4):
+         self.v7v6_overflow = set_overflow
+      if self.in_cycle(CYCLE_6):
+         self.v5v4_overflow = set_overflow
+
+      sq_out = self.sq_out
+      if self.in_cycle(CYCLE_4, CYCLE_5, CYCLE_6, CYCLE_7, CYCLE_8, CYCLE_9):
+         sq_out = self.reduced_acc_sum()
+
+      self.lut_read_data     = [self.redLUT.row(k, addr)
+                                for k, addr in enumerate(lut_addr)]
+      self.shift_high_1d     = shift_high
+      self.shift_overflow_1d = shift_overflow
+
+      self.sq_out_d1  = self.sq_out[:NONREDUNDANT_ELEMENTS // 2]
+      self.sq_out     = sq_out
+      self.mul_result = mul_result
+      self.mul_cout   = mul_cout
+      self.mul_s      = mul_s
+
+      if reset:
+         self.valid    = 0
+         self.start_d1 = 0
+      else:
+         self.valid    = out_valid
+         # Keep start high once set until sq_out is valid for loopback
+         self.start_d1 = int(start or (self.start_d1 and not out_valid))
+
+      if start:
+         self.sq_in_d1 = list(sq_in)
+
+      self.curr_cycle  = next_cycle
+      self.clocks     += 1
+
+   ##########################################################################
+   # State dumps
+   ##########################################################################
+
+   # Registers as (signal name, value) pairs, arrays as lists
+   def state(self):
+      state = [('curr_cycle',        self.curr_cycle),
+               ('start_d1',          self.start_d1),
+               ('valid',             self.valid),
+               ('sq_in_d1',          self.sq_in_d1),
+               ('sq_out',            self.sq_out),
+               ('sq_out_d1',         self.sq_out_d1)]
+      for k in range (self.num_multipliers):
+         state.append(('mul[%d].multiply.mul_result' % k, self.mul_result[k]))
+      for k in range (self.num_multipliers):
+         state.append(('mul_cout[%d]' % k, self.mul_cout[k]))
+         state.append(('mul_s[%d]' % k,    self.mul_s[k]))
+      state += [('v7v6',                           self.v7v6),
+                ('v5_partial',                     self.v5_partial),
+                ('v5v4_partial',                   self.v5v4_partial),
+                ('v5v4',                           self.v5v4),
+                ('v3_partial',                     self.v3_partial),
+                ('v3',                             self.v3),
+                ('v2_partial',                     self.v2_partial),
+                ('v2v0',                           self.v2v0),
+                ('v7v6_overflow',                  self.v7v6_overflow),
+                ('v5v4_overflow',                  self.v5v4_overflow),
+                ('reduction_lut.lut_read_data',
+                 [from_coefficients(row, self.word_len)
+                  for row in self.lut_read_data]),
+                ('reduction_lut.shift_high_1d',    self.shift_high_1d),
+                ('reduction_lut.shift_overflow_1d',self.shift_overflow_1d)]
+      return state
+
+   # One line per signal, optionally only the named signals
+   def format_state(self, signals=None):
+      lines = []
+      for name, value in self.state():
+         if signals is not None and name not in signals:
+            continue
+         if isinstance(value, list):
+            value = ' '.join(['%x' % v for v in value])
+         else:
+            value = '%x' % value
+         lines.append('%d %s %s\n' % (self.clocks, name, value))
+      return ''.join(lines)
+
+   ##########################################################################
+   # Squaring chains
+   ##########################################################################
+
+   # Resets, starts on sq_in and returns the first num_squarings outputs of
+   # the chain as integers.  The state is written to dump after every clock
+   # and the clocks spent in each state are added to stats.
+   def run(self, sq_in, num_squarings, dump=None, signals=None, stats=None):
+      coeffs  = to_coefficients(sq_in, self.num_elements, self.word_len)
+      results = []
+
+      self.clock(reset=1)
+      self.clock(start=1, sq_in=coeffs)
+
+      # Longest squaring is CYCLE_0 to CYCLE_9
+      max_clocks = self.clocks + (num_squarings * (NUM_CYCLES-1)) + 1
+      while len(results) < num_squarings:
+         if self.clocks > max_clocks:
+            raise RuntimeError('modular square stopped producing results')
+
+         if stats is not None:
+            name        = self.cycle_name()
+            stats[name] = stats.get(name, 0) + 1
+
+         self.clock()
+
+         if dump is not None:
+            dump.write(self.format_state(signals))
+
+         if self.valid:
+            results.append(from_coefficients(self.sq_out, self.word_len))
+
+      return results
+
+################################################################################
+# Command line
+################################################################################
+
+def usage():
+   print('modular_square_8_cycles.py -M <modulus> -n <num chains>',
+         '-c <chain length> -r <num redundant> -e <num nonredundant>',
+         '-w <word len> -s <seed> [-d <dump file>] [-g <signal,...>]')
+   print('  -d  write the state after every clock, the first chain only')
+   print('  -g  only dump the named signals')
+
+if __name__ == "__main__":
+   mod_in        = None
+   num_chains    = 1
+   chain_len     = 1000
+   num_segments  = 4
+   redundant     = 2
+   nonredundant  = 8
+   word_len      = 16
+   seed          = 0
+   dump_file     = None
+   signals       = None
+
+   try:
+      opts, args = getopt.getopt(sys.argv[1:], "hM:n:c:r:e:w:s:d:g:")
+   except getopt.GetoptError:
+      usage()
+      sys.exit(2)
+
+   for opt, arg in opts:
+      if opt == '-h':
+         usage()
+         sys.exit()
+      elif opt == '-M':
+         mod_in = int(arg, 0)
+      elif opt == '-n':
+         num_chains = int(arg)
+      elif opt == '-c':
+         chain_len = int(arg)
+      elif opt == '-r':
+         redundant = int(arg)
+      elif opt == '-e':
+         nonredundant = int(arg)
+      elif opt == '-w':
+         word_len = int(arg)
+      elif opt == '-s':
+         seed = int(arg)
+      elif opt == '-d':
+         dump_file = arg
+      elif opt == '-g':
+         signals = set(arg.split(','))
+
+   random.seed(seed)
+
+   if mod_in is None:
+      mod_in = random.getrandbits(nonredundant*word_len)
+
+   model = ModularSquare8Cycles(mod_in, redundant, nonredundant, num_segments,
+                                word_len+1, word_len)
+
+   dump_f = open(dump_file, 'w') if dump_file is not None else None
+   dump   = dump_f
+
+   tests_run    = 0
+   tests_failed = 0
+   stats        = {}
+   start        = time.time()
+
+   for c in range (num_chains):
+      sqr_in  = random.getrandbits(nonredundant*word_len)
+      results = model.run(sqr_in, chain_len, dump, signals, stats)
+
+      # Each redundant output is the input of the next squaring
+      for sqr_out in results:
+         tests_run += 1
+         if (sqr_out % mod_in) != ((sqr_in * sqr_in) % mod_in):
+            tests_failed += 1
+            print("Failure input:", hex(sqr_in))
+         sqr_in = sqr_out
+
+      dump = None
+
+   elapsed = time.time() - start
+
+   if dump_f is not None:
+      dump_f.close()
+      print("Wrote", dump_file)
+
+   print("Testing num elements", nonredundant, "+", redundant,
+         "with word len", word_len)
+   print("Clocks per state:",
+         ' '.join(['%s %d' % (name, stats[name]) for name in CYCLE_NAMES
+                   if name in stats]))
+   print("%.2f clocks per squaring" %
+         (sum([stats[name] for name in CYCLE_NAMES[CYCLE_0:]
+               if name in stats]) / tests_run))
+   print("%.1f squarings per second" % (tests_run / elapsed))
+   print("Passed", tests_run-tests_failed, "out of", tests_run, "tests")
+
+   result_str = "FAILED" if (tests_failed > 0) else "PASSED"
+   print(result_str)
@@ -15,13 +15,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 ################################################################################
+import getopt
 import math
+import os
 import random
 
 import sys
-sys.path.append('../../primitives/model')
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', '..', 'primitives', 'model'))
 
 import primitives as p
+import model_stats
+import reduction_lut
 
 def print_poly_hex(name, p_v):
     print(name, "len %d: " % len(p_v), end='')
@@ -34,7 +39,7 @@ def print_poly_hex(name, p_v):
 def print_grid(grid, grid_size, grid_num_elements):
    for x in range (grid_num_elements):
       for y in range (grid_size):
-         print('{0:06x} '.format(p.bits_to_int(grid[y][x])), end='')
+         print('{0:06x} '.format(grid[(y*GRID_ROWS)+x]), end='')
       print('')
 
 def print_compressed_grid(subtotal):
@@ -49,154 +54,225 @@ def partial_reduction(p_v, offset, elements, word_len):
         p_v[i+offset]  += p_v[i+offset-1] >> word_len 
         p_v[i+offset-1] = p_v[i+offset-1] & (2**word_len- 1)
 
+################################################################################
+# Multiplier grid placement
+################################################################################
+# Which segments are multiplied in each of the five multiply cycles, and where
+# the results land in the grid, depend only on the parameters.  A GridPlan
+# works this out once per parameter set, grid_plan() caches the plans.
+#
+# Grids are flat lists of GRID_SIZE columns by GRID_ROWS rows, entry
+# grid[(col*GRID_ROWS)+row].
+#
+# Grid rows
+# 0 - mul0 carry low
+# 1 - mul0 carry high
+# 2 - mul0 sum   low
+# 3 - mul0 sum   high
+# 4 - mul1 carry low
+# 5 - mul1 carry high
+# 6 - mul1 sum   low
+# 7 - mul1 sum   high
+# 8 - previous cycle result
+
+GRID_ROWS         = 9
+PREV_ROW          = 8
+
+# Input mux select for multiply factors
+MUL0_A            = [3, 2, 3, 2, 0]
+MUL0_B            = [2, 2, 0, 0, 0]
+MUL1_A            = [3, 3, 2, 1, 1]
+MUL1_B            = [3, 1, 1, 1, 0]
+
+MUL0_RESULT_SHIFT = [1, 0, 1, 1, 0]  # Shift mul0 result
+MUL1_RESULT_SHIFT = [0, 1, 1, 0, 1]  # Shift mul1 result
+MUL1_FIRST        = [0, 1, 1, 1, 0]  # mul1 result in first or second segment
+
+class GridPlan:
+   def __init__(self, redundant_elements, nonredundant_elements, num_segments,
+                bit_len, word_len, use_square=False):
+      REDUNDANT_ELEMENTS    = redundant_elements
+      NONREDUNDANT_ELEMENTS = nonredundant_elements
+      NUM_SEGMENTS          = num_segments
+      BIT_LEN               = bit_len
+      WORD_LEN              = word_len
+
+      NUM_ELEMENTS          = REDUNDANT_ELEMENTS + NONREDUNDANT_ELEMENTS
+      SEGMENT_ELEMENTS      = (NONREDUNDANT_ELEMENTS // NUM_SEGMENTS)
+      MUL_NUM_ELEMENTS      = SEGMENT_ELEMENTS + REDUNDANT_ELEMENTS
+
+      GRID_SIZE             = ((MUL_NUM_ELEMENTS*2) + SEGMENT_ELEMENTS + 1)
+
+      EXTRA_MUL_TREE_BITS   = math.ceil(math.log2(MUL_NUM_ELEMENTS))     \
+                              if (BIT_LEN > WORD_LEN) else               \
+                              math.ceil(math.log2(NUM_ELEMENTS*2))
+      MUL_BIT_LEN           = ((BIT_LEN*2) - WORD_LEN)     +             \
+                              EXTRA_MUL_TREE_BITS
+
+      # Accumulator coefficients sum the LUT outputs of every V7V6/V5V4
+      # element plus the previous value, V3 and V2V0, as in
+      # modular_square_8_cycles.py
+      ACC_ELEMENTS          = (SEGMENT_ELEMENTS*2) + REDUNDANT_ELEMENTS + 2
+      ACC_BIT_LEN           = BIT_LEN + math.ceil(math.log2(ACC_ELEMENTS + 3))
+
+      #TODO - need better method here, not using large conditionals though
+      MAX_VALUE             = ((2**BIT_LEN)-1)           +               \
+                              (((2**WORD_LEN)-1) << 2)   +               \
+                              (((2**(MUL_BIT_LEN-WORD_LEN))-1) << 2)
+
+      self.word_len         = WORD_LEN
+      self.word_mask        = (2**WORD_LEN) - 1
+      self.segment_elements = SEGMENT_ELEMENTS
+      self.mul_num_elements = MUL_NUM_ELEMENTS
+      self.mul_bit_len      = MUL_BIT_LEN
+      self.grid_size        = GRID_SIZE
+      self.grid_bit_len     = math.ceil(math.log2(MAX_VALUE))
+      self.acc_bit_len      = ACC_BIT_LEN
+      self.look_up_width    = WORD_LEN // 2
+      self.use_square       = use_square
+
+      # Per cycle: the two pairs of input segments and where each multiplier
+      # output goes as (multiplier, 0 carry / 1 sum, shift, column, row).
+      # Word j of an output is split into its low word at (column+j, row)
+      # and its high bits at (column+j+1, row+1).
+      #
+      # Shift is required for x2 of multiply result used in square operation.
+      # Number of grid columns is based on the number of multiplier elements.
+      # Most elements of the grid are 0.  Based on the number of redundant
+      # elements required, the upper elements are used only for one cycle.
+      self.cycles = []
+      for cycle in range (len(MUL0_A)):
+         mul1_col = 0 if (MUL1_FIRST[cycle] == 1) else SEGMENT_ELEMENTS
+         inputs   = ((MUL0_A[cycle], MUL0_B[cycle]),
+                     (MUL1_A[cycle], MUL1_B[cycle]))
+         places   = ((0, 0, MUL0_RESULT_SHIFT[cycle], 0,        0),
+                     (0, 1, MUL0_RESULT_SHIFT[cycle], 0,        2),
+                     (1, 0, MUL1_RESULT_SHIFT[cycle], mul1_col, 4),
+                     (1, 1, MUL1_RESULT_SHIFT[cycle], mul1_col, 6))
+         self.cycles.append((inputs, places))
+
+   # With use_square, segments multiplied by themselves go through the
+   # squaring multiply.  The column totals are the same with about half the
+   # products, but the carry and sum split differs from multiply.sv so the
+   # result is only congruent to, not bit-exact with, the RTL.
+   def multiply(self, cycle, sqr_in_seg):
+      inputs, _ = self.cycles[cycle]
+      return [p.square(sqr_in_seg[a], self.mul_num_elements,
+                       self.mul_bit_len, self.word_len)
+              if (self.use_square and a == b) else
+              p.multiply(sqr_in_seg[a], sqr_in_seg[b], self.mul_num_elements,
+                         self.mul_bit_len, self.word_len)
+              for a, b in inputs]
+
+   # New flat grid holding the two multiplier results of the cycle
+   def fill(self, cycle, sqr_in_seg):
+      WORD_LEN  = self.word_len
+      WORD_MASK = self.word_mask
+
+      results   = self.multiply(cycle, sqr_in_seg)
+      _, places = self.cycles[cycle]
+
+      # Entries are truncated to GRID_BIT_LEN by the compressor tree
+      grid = [0] * (self.grid_size * GRID_ROWS)
+      for mul, output, shift, col, row in places:
+         i = (col * GRID_ROWS) + row
+         for v in results[mul][output]:
+            v                   <<= shift
+            grid[i]               = v & WORD_MASK
+            grid[i+GRID_ROWS+1]   = v >> WORD_LEN
+            i                    += GRID_ROWS
+
+      return grid
+
+   # Number of grid rows that can be non-zero in each column over all the
+   # cycles, the terms the column's compressor tree needs.  Both end carry
+   # outputs of a multiply are always 0 and its lowest sum output is a
+   # single word unless shifted.  The previous cycle row is filled over the
+   # (offset, length) column spans modular_square adds it to.
+   def column_rows(self):
+      SEGMENT_ELEMENTS = self.segment_elements
+      TWO_SEGMENTS     = (SEGMENT_ELEMENTS*2) + (self.mul_num_elements -
+                                                 SEGMENT_ELEMENTS) + 2
+      prev_spans       = [(SEGMENT_ELEMENTS, SEGMENT_ELEMENTS),
+                          (SEGMENT_ELEMENTS, TWO_SEGMENTS),
+                          (SEGMENT_ELEMENTS, SEGMENT_ELEMENTS),
+                          (SEGMENT_ELEMENTS*2, SEGMENT_ELEMENTS)]
+
+      used    = set()
+      outputs = self.mul_num_elements*2
+      for _, places in self.cycles:
+         for mul, output, shift, col, row in places:
+            for j in range (outputs):
+               if output == 0 and j in (0, outputs-1):
+                  continue
+               used.add((col+j, row))
+               if output == 0 or j > 0 or shift:
+                  used.add((col+j+1, row+1))
+      for offset, length in prev_spans:
+         for col in range (offset, offset+length):
+            used.add((col, PREV_ROW))
+
+      return [sum(1 for row in range (GRID_ROWS) if (col, row) in used)
+              for col in range (self.grid_size)]
+
+_grid_plans = {}
+
+def grid_plan(redundant_elements, nonredundant_elements, num_segments,
+              bit_len, word_len, use_square=False):
+   key = (redundant_elements, nonredundant_elements, num_segments, bit_len,
+          word_len, use_square)
+   if key not in _grid_plans:
+      _grid_plans[key] = GridPlan(*key)
+   return _grid_plans[key]
+
 def set_grid_5_cycle(cycle, sqr_in_seg, redundant_elements, 
                      nonredundant_elements, num_segments, bit_len, word_len):
-   #############################################################################
-   # Parameters
-   #############################################################################
-   REDUNDANT_ELEMENTS    = redundant_elements
-   NONREDUNDANT_ELEMENTS = nonredundant_elements
-   NUM_SEGMENTS          = num_segments
-   BIT_LEN               = bit_len
-   WORD_LEN              = word_len
-
-   NUM_MULTIPLIERS       = 2;
-
-   NUM_ELEMENTS          = REDUNDANT_ELEMENTS + NONREDUNDANT_ELEMENTS
-   COL_BIT_LEN           = (BIT_LEN*2)-WORD_LEN
-   SEGMENT_ELEMENTS      = (NONREDUNDANT_ELEMENTS // NUM_SEGMENTS)
-   MUL_NUM_ELEMENTS      = SEGMENT_ELEMENTS + REDUNDANT_ELEMENTS
-
-   GRID_SIZE             = ((MUL_NUM_ELEMENTS*2) + SEGMENT_ELEMENTS + 1)
-
-   EXTRA_MUL_TREE_BITS   = math.ceil(math.log2(MUL_NUM_ELEMENTS))     \
-                           if (BIT_LEN > WORD_LEN) else               \
-                           math.ceil(math.log2(NUM_ELEMENTS*2))
-   MUL_BIT_LEN           = ((BIT_LEN*2) - WORD_LEN)     +             \
-                           EXTRA_MUL_TREE_BITS
-
-   #TODO - need better method here, not using large conditionals though
-   MAX_VALUE             = ((2**BIT_LEN)-1)           +               \
-                           (((2**WORD_LEN)-1) << 2)   +               \
-                           (((2**(MUL_BIT_LEN-WORD_LEN))-1) << 2)
-
-   GRID_BIT_LEN          = math.ceil(math.log2(MAX_VALUE))
-
-   WORD_MASK             = (2**WORD_LEN) - 1
-
-   # Input mux select for multiply factors
-   mul0_A = [3, 2, 3, 2, 0]
-   mul0_B = [2, 2, 0, 0, 0]
-   mul1_A = [3, 3, 2, 1, 1]
-   mul1_B = [3, 1, 1, 1, 0]
-
-   mul0_result_shift = [1, 0, 1, 1, 0]  # Shift mul0 result
-   mul1_result_shift = [0, 1, 1, 0, 1]  # Shift mul0 result
-   mul1_first        = [0, 1, 1, 1, 0]  # mul1 result in first or second segment
-
-   # select factors to multiply
-   c0, s0 = p.multiply(sqr_in_seg[mul0_A[cycle]], sqr_in_seg[mul0_B[cycle]],
-                       MUL_NUM_ELEMENTS, MUL_BIT_LEN, WORD_LEN)
-   c1, s1 = p.multiply(sqr_in_seg[mul1_A[cycle]], sqr_in_seg[mul1_B[cycle]],
-                       MUL_NUM_ELEMENTS, MUL_BIT_LEN, WORD_LEN)
-
-   # reset grid
-   grid   = [[[0 for z in range (GRID_BIT_LEN)] for x in range (9)]
-             for y in range (GRID_SIZE)]
-
-   # Grid rows
-   # 0 - mul0 carry low
-   # 1 - mul0 carry high
-   # 2 - mul0 sum   low
-   # 3 - mul0 sum   high
-   # 4 - mul1 carry low
-   # 5 - mul1 carry high
-   # 6 - mul1 sum   low
-   # 7 - mul1 sum   high
-   # 8 - previous cycle result
-
-   # Shift is required for x2 of multiply result used in square operation
-
-   # Number of grid columns is based on the number of multiplier elements.
-   # Most elements of the grid are 0.  Based on the number of redundant 
-   #  elements required, the upper elements are used only for one cycle.
-
-   for j in range (MUL_NUM_ELEMENTS*2):
-      if (mul0_result_shift[cycle] == 1):
-         grid[j][0]   = p.int_to_bits(((c0[j]<<1) & WORD_MASK), GRID_BIT_LEN)
-         grid[j+1][1] = p.int_to_bits(((c0[j]<<1) >> WORD_LEN), GRID_BIT_LEN)
-         grid[j][2]   = p.int_to_bits(((s0[j]<<1) & WORD_MASK), GRID_BIT_LEN)
-         grid[j+1][3] = p.int_to_bits(((s0[j]<<1) >> WORD_LEN), GRID_BIT_LEN)
-      else: # No shift
-         grid[j][0]   = p.int_to_bits((c0[j] & WORD_MASK), GRID_BIT_LEN)
-         grid[j+1][1] = p.int_to_bits((c0[j] >> WORD_LEN), GRID_BIT_LEN)
-         grid[j][2]   = p.int_to_bits((s0[j] & WORD_MASK), GRID_BIT_LEN)
-         grid[j+1][3] = p.int_to_bits((s0[j] >> WORD_LEN), GRID_BIT_LEN)
-
-      if (mul1_first[cycle] == 1):
-         if (mul1_result_shift[cycle] == 1):
-            grid[j][4]   = p.int_to_bits(((c1[j]<<1)&WORD_MASK),GRID_BIT_LEN)
-            grid[j+1][5] = p.int_to_bits(((c1[j]<<1)>>WORD_LEN),GRID_BIT_LEN)
-            grid[j][6]   = p.int_to_bits(((s1[j]<<1)&WORD_MASK),GRID_BIT_LEN)
-            grid[j+1][7] = p.int_to_bits(((s1[j]<<1)>>WORD_LEN),GRID_BIT_LEN)
-         else: # No shift
-            grid[j][4]   = p.int_to_bits((c1[j] & WORD_MASK), GRID_BIT_LEN)
-            grid[j+1][5] = p.int_to_bits((c1[j] >> WORD_LEN), GRID_BIT_LEN)
-            grid[j][6]   = p.int_to_bits((s1[j] & WORD_MASK), GRID_BIT_LEN)
-            grid[j+1][7] = p.int_to_bits((s1[j] >> WORD_LEN), GRID_BIT_LEN)
-      else:
-         if (mul1_result_shift[cycle] == 1):
-            grid[j+SEGMENT_ELEMENTS][4]          = \
-               p.int_to_bits(((c1[j] << 1) & WORD_MASK), GRID_BIT_LEN)
-            grid[j+1+SEGMENT_ELEMENTS][5]        = \
-               p.int_to_bits(((c1[j] << 1) >> WORD_LEN), GRID_BIT_LEN)
-            grid[j+SEGMENT_ELEMENTS][6]          = \
-               p.int_to_bits(((s1[j] << 1) & WORD_MASK), GRID_BIT_LEN)
-            grid[j+1+SEGMENT_ELEMENTS][7]        = \
-               p.int_to_bits(((s1[j] << 1) >> WORD_LEN), GRID_BIT_LEN)
-         else: # No shift
-            grid[j+SEGMENT_ELEMENTS][4]          = \
-               p.int_to_bits((c1[j] & WORD_MASK), GRID_BIT_LEN)
-            grid[j+1+SEGMENT_ELEMENTS][5]        = \
-               p.int_to_bits((c1[j] >> WORD_LEN), GRID_BIT_LEN)
-            grid[j+SEGMENT_ELEMENTS][6]          = \
-               p.int_to_bits((s1[j] & WORD_MASK), GRID_BIT_LEN)
-            grid[j+1+SEGMENT_ELEMENTS][7]        = \
-               p.int_to_bits((s1[j] >> WORD_LEN), GRID_BIT_LEN)
-
-   return grid
+   plan = grid_plan(redundant_elements, nonredundant_elements, num_segments,
+                    bit_len, word_len)
+   return plan.fill(cycle, sqr_in_seg)
 
 def add_prev_to_grid(grid, p_v, grid_offset, length, grid_bit_len):
-   GRID_BIT_LEN = grid_bit_len
-
-   for i in range (length):
-      grid[i + grid_offset][8] = p.int_to_bits(p_v[i], GRID_BIT_LEN)
+   grid[(grid_offset*GRID_ROWS)+PREV_ROW:(grid_offset+length)*GRID_ROWS:
+        GRID_ROWS] = p_v[0:length]
 
    return grid
 
-def compress_grid(grid, grid_size, grid_bit_len, word_len):
+def compress_grid(grid, grid_size, grid_bit_len, word_len, profile=None,
+                  name=None, reduce=True):
    GRID_SIZE    = grid_size
    GRID_BIT_LEN = grid_bit_len
    WORD_LEN     = word_len
 
+   if profile is not None:
+      # Grid entries wider than GRID_BIT_LEN are truncated by the tree
+      widest = max(grid)
+      profile.width('grid_entry_' + name, widest)
+      profile.set_limit('grid_entry_' + name, GRID_BIT_LEN)
+      if (widest >> GRID_BIT_LEN) != 0:
+         profile.count('grid_truncated')
+
    cg = GRID_SIZE*[0]
    sg = GRID_SIZE*[0]
    for j in range (GRID_SIZE):
-      result = p.compressor_tree(grid[j], GRID_BIT_LEN)
-      cg[j]  = p.bits_to_int(result[0])
-      sg[j]  = p.bits_to_int(result[1])
+      cg[j], sg[j] = p.compressor_tree_word(grid[j*GRID_ROWS:(j+1)*GRID_ROWS],
+                                            GRID_BIT_LEN)
 
    sub_totals = GRID_SIZE*[0]
    for j in range (GRID_SIZE):
       sub_totals[j] = cg[j] + sg[j]
 
-   partial_reduction(sub_totals, 0, GRID_SIZE, WORD_LEN)
+   if profile is not None:
+      profile.width('grid_column_' + name, max(sub_totals))
+
+   if reduce:
+      partial_reduction(sub_totals, 0, GRID_SIZE, WORD_LEN)
 
    return sub_totals
 
 def modular_square(sqr_in, mod_in, redLUT, redundant_elements, 
                    nonredundant_elements, num_segments, bit_len, word_len, 
-                   stats):
+                   stats, profile=None, use_square=False, lazy=False,
+                   points=None):
 
    #############################################################################
    # Parameters
@@ -222,26 +298,37 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
    THREE_SEGMENTS        = (SEGMENT_ELEMENTS*3) + REDUNDANT_ELEMENTS + \
                            EXTRA_ELEMENTS
 
-   GRID_SIZE             = ((MUL_NUM_ELEMENTS*2) + SEGMENT_ELEMENTS + 1)
-
-   EXTRA_MUL_TREE_BITS   = math.ceil(math.log2(MUL_NUM_ELEMENTS))     \
-                           if (BIT_LEN > WORD_LEN) else               \
-                           math.ceil(math.log2(NUM_ELEMENTS*2))
-   MUL_BIT_LEN           = ((BIT_LEN*2) - WORD_LEN)     +             \
-                           EXTRA_MUL_TREE_BITS
-
-   #TODO - need better method here, not using large conditionals though
-   MAX_VALUE             = ((2**BIT_LEN)-1)           +               \
-                           (((2**WORD_LEN)-1) << 2)   +               \
-                           (((2**(MUL_BIT_LEN-WORD_LEN))-1) << 2)
-
-   GRID_BIT_LEN          = math.ceil(math.log2(MAX_VALUE))
+   # Grid geometry and multiplier placement, built once per parameter set
+   plan                  = grid_plan(REDUNDANT_ELEMENTS,
+                                     NONREDUNDANT_ELEMENTS, NUM_SEGMENTS,
+                                     BIT_LEN, WORD_LEN, use_square)
+   GRID_SIZE             = plan.grid_size
+   GRID_BIT_LEN          = plan.grid_bit_len
 
    WORD_MASK             = (2**WORD_LEN) - 1
    LOOK_UP_WIDTH         = WORD_LEN // 2
    LUT_SIZE              = 2**LOOK_UP_WIDTH 
    LUT_MASK              = (2**LOOK_UP_WIDTH)-1
 
+   if profile is not None:
+      profile.add_runs()
+
+   # Widest accumulator coefficient ahead of each partial reduction
+   def profile_accum(name):
+      if profile is not None:
+         profile.width('accum_' + name, max(curr_accum))
+
+   # Partial reduction of curr_accum at a normalization point.  Nothing reads
+   # curr_accum before the output, so with lazy the coefficients are left
+   # unnormalized until then.  points collects the accumulator at every
+   # point for check_lazy().
+   def reduce_accum(name):
+      profile_accum(name)
+      if points is not None:
+         points[name] = list(curr_accum)
+      if not lazy:
+         partial_reduction(curr_accum, 0, NUM_ELEMENTS, WORD_LEN)
+
    #############################################################################
    # Input
    #############################################################################
@@ -274,8 +361,7 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
    #  x2      |   |      W3*W2      |
    #          |---|-----------------|
 
-   grid_cycle_0 = set_grid_5_cycle(cycle, sqr_in_seg, redundant_elements, 
-                        nonredundant_elements, num_segments, bit_len, word_len)
+   grid_cycle_0 = plan.fill(cycle, sqr_in_seg)
 
    #############################################################################
    # Cycle 1
@@ -289,8 +375,7 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
    #  x2               |   |      W3*W1      |
    #                   |---|-----------------|
 
-   grid_cycle_1 = set_grid_5_cycle(cycle, sqr_in_seg, redundant_elements, 
-                        nonredundant_elements, num_segments, bit_len, word_len)
+   grid_cycle_1 = plan.fill(cycle, sqr_in_seg)
 
    #############################################################################
    # Cycle 2
@@ -304,8 +389,7 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
    #  x2                        |   |      W3*W0      |
    #                            |---|-----------------|
 
-   grid_cycle_2 = set_grid_5_cycle(cycle, sqr_in_seg, redundant_elements, 
-                        nonredundant_elements, num_segments, bit_len, word_len)
+   grid_cycle_2 = plan.fill(cycle, sqr_in_seg)
 
    # |---|-----------------|
    # |   |      W3*W3      |
@@ -320,7 +404,7 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
    # |---|--------|--------|--------|
 
    sub_totals_cycle_0 = compress_grid(grid_cycle_0, GRID_SIZE, 
-                                      GRID_BIT_LEN, WORD_LEN)
+                                      GRID_BIT_LEN, WORD_LEN, profile, 'c0')
 
    #print('C0 grid')
    #print_grid(grid_cycle_0, GRID_SIZE, 9)
@@ -356,8 +440,7 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
    #  x2                                     |      W2*W0      |
    #                                         |-----------------|
 
-   grid_cycle_3 = set_grid_5_cycle(cycle, sqr_in_seg, redundant_elements, 
-                        nonredundant_elements, num_segments, bit_len, word_len)
+   grid_cycle_3 = plan.fill(cycle, sqr_in_seg)
 
    #                       |-----------------|
    #                       |      W2*W2      |
@@ -378,7 +461,7 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
                     SEGMENT_ELEMENTS, GRID_BIT_LEN)
 
    sub_totals_cycle_1 = compress_grid(grid_cycle_1, GRID_SIZE, 
-                                      GRID_BIT_LEN, WORD_LEN)
+                                      GRID_BIT_LEN, WORD_LEN, profile, 'c1')
 
    #print('C1 grid')
    #print_grid(grid_cycle_1, GRID_SIZE, 9)
@@ -409,6 +492,8 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
    for i in range (TWO_SEGMENTS):
       v7v6_high     = (v7v6[i] >> LOOK_UP_WIDTH) & LUT_MASK
       v7v6_upper[i] = redLUT[i][v7v6_high]
+      if profile is not None:
+         profile.lut_addr('v7v6_upper', v7v6_high)
       #print("v7v6 high   ", hex(v7v6_high))
       #print_poly_hex("v7v6 upper  ", v7v6_upper[i])
 
@@ -424,8 +509,7 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
    #  x2                                            |      W1*W0      |
    #                                                |-----------------|
 
-   grid_cycle_4 = set_grid_5_cycle(cycle, sqr_in_seg, redundant_elements, 
-                        nonredundant_elements, num_segments, bit_len, word_len)
+   grid_cycle_4 = plan.fill(cycle, sqr_in_seg)
 
    #                                |-----------------|
    #  x2                            |      W2*W1      |
@@ -446,7 +530,7 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
                     TWO_SEGMENTS, GRID_BIT_LEN)
 
    sub_totals_cycle_2 = compress_grid(grid_cycle_2, GRID_SIZE, 
-                                      GRID_BIT_LEN, WORD_LEN)
+                                      GRID_BIT_LEN, WORD_LEN, profile, 'c2')
 
    #print('C2 grid')
    #print_grid(grid_cycle_2, GRID_SIZE, 9)
@@ -479,6 +563,8 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
    for i in range (TWO_SEGMENTS):
       v7v6_low      = v7v6[i] & LUT_MASK
       v7v6_lower[i] = redLUT[i][v7v6_low]
+      if profile is not None:
+         profile.lut_addr('v7v6_lower', v7v6_low)
 
    #                                  |-----------------------------------|
    #                                  |                                   |
@@ -504,7 +590,7 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
 
    #print_poly_hex("C4 pre accum", curr_accum)
 
-   partial_reduction(curr_accum, 0, NUM_ELEMENTS, WORD_LEN)
+   reduce_accum('c4')
 
    #print_poly_hex("C4 accum    ", curr_accum)
 
@@ -532,7 +618,7 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
                     SEGMENT_ELEMENTS, GRID_BIT_LEN)
 
    sub_totals_cycle_3 = compress_grid(grid_cycle_3, GRID_SIZE, 
-                                      GRID_BIT_LEN, WORD_LEN)
+                                      GRID_BIT_LEN, WORD_LEN, profile, 'c3')
 
    #print('C3 grid')
    #print_grid(grid_cycle_3, GRID_SIZE, 9)
@@ -567,6 +653,8 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
    for i in range (TWO_SEGMENTS):
       v7v6_top      = (v7v6[i] >> WORD_LEN) 
       v7v6_over[i]  = redLUT[i][v7v6_top]
+      if profile is not None:
+         profile.lut_addr('v7v6_over', v7v6_top)
       if (v7v6_top != 0):
          v7v6_overflow = 1
 
@@ -585,6 +673,8 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
    for i in range (TWO_SEGMENTS):
       v5v4_high     = (v5v4[i] >> LOOK_UP_WIDTH) & LUT_MASK
       v5v4_upper[i] = redLUT[i][v5v4_high + LUT_SIZE]
+      if profile is not None:
+         profile.lut_addr('v5v4_upper', v5v4_high)
 
    #                                  |-----------------------------------|
    #                                  |     Accumulation V7,V6 upper      |
@@ -606,7 +696,7 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
       for j in range (NONREDUNDANT_ELEMENTS):
          curr_accum[j] += v7v6_lower[i][j]
 
-   partial_reduction(curr_accum, 0, NUM_ELEMENTS, WORD_LEN)
+   reduce_accum('c5')
 
    #print_poly_hex("C5 accum    ", curr_accum)
 
@@ -633,8 +723,11 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
    add_prev_to_grid(grid_cycle_4, v2_partial, (SEGMENT_ELEMENTS*2), 
                     SEGMENT_ELEMENTS, GRID_BIT_LEN)
 
+   # v2v0 only goes to the accumulator, so with lazy it is not reduced.
+   # The earlier grids feed LUT addresses or the next grid and must be.
    sub_totals_cycle_4 = compress_grid(grid_cycle_4, GRID_SIZE, 
-                                      GRID_BIT_LEN, WORD_LEN)
+                                      GRID_BIT_LEN, WORD_LEN, profile, 'c4',
+                                      not lazy)
 
    #print('C4 grid')
    #print_grid(grid_cycle_4, GRID_SIZE, 9)
@@ -647,6 +740,9 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
 
    #print_poly_hex("v2v0        ", v2v0)
 
+   if points is not None:
+      points['grid_c4'] = list(v2v0)
+
    #                                  |-----------------------------------|
    #                                  |              ...                  |
    # |---|--------|--------|       |-----------------------------------|  |
@@ -660,6 +756,8 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
    for i in range (TWO_SEGMENTS):
       v5v4_low      = v5v4[i] & LUT_MASK
       v5v4_lower[i] = redLUT[i][v5v4_low + LUT_SIZE]
+      if profile is not None:
+         profile.lut_addr('v5v4_lower', v5v4_low)
 
    # Either accumulate V5V4 upper of V7V6 overflow 
 
@@ -681,18 +779,20 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
 
    if (v7v6_overflow != 0):
       #print("DOING OVERFLOW V7V6")
+      if profile is not None:
+         profile.count('v7v6_overflow')
       for i in range (TWO_SEGMENTS):
          for j in range (NONREDUNDANT_ELEMENTS):
             curr_accum[j+1] += v7v6_over[i][j]
 
-      partial_reduction(curr_accum, 0, NUM_ELEMENTS, WORD_LEN)
+      reduce_accum('c6_overflow')
 
    for i in range (TWO_SEGMENTS):
       for j in range (NONREDUNDANT_ELEMENTS):
          curr_accum[j]   += (v5v4_upper[i][j] << LOOK_UP_WIDTH) & WORD_MASK
          curr_accum[j+1] += (v5v4_upper[i][j] >> LOOK_UP_WIDTH)
 
-   partial_reduction(curr_accum, 0, NUM_ELEMENTS, WORD_LEN)
+   reduce_accum('c6')
 
    #print_poly_hex("C6 accum    ", curr_accum)
 
@@ -718,6 +818,8 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
    for i in range (TWO_SEGMENTS):
       v5v4_top      = (v5v4[i] >> WORD_LEN) 
       v5v4_over[i]  = redLUT[i][v5v4_top + LUT_SIZE]
+      if profile is not None:
+         profile.lut_addr('v5v4_over', v5v4_top)
       if (v5v4_top != 0):
          v5v4_overflow = 1
 
@@ -752,7 +854,7 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
    for i in range (SEGMENT_ELEMENTS+REDUNDANT_ELEMENTS):
       curr_accum[i+(SEGMENT_ELEMENTS*3)] += v3[i]
 
-   partial_reduction(curr_accum, 0, NUM_ELEMENTS, WORD_LEN)
+   reduce_accum('c7')
 
    #print_poly_hex("C7 accum    ", curr_accum)
 
@@ -763,14 +865,26 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
 
    if (v5v4_overflow != 0):
       #print("DOING OVERFLOW V5V4")
+      if profile is not None:
+         profile.count('v5v4_overflow')
       for i in range (TWO_SEGMENTS):
          for j in range (NONREDUNDANT_ELEMENTS):
             curr_accum[j+1] += v5v4_over[i][j]
 
-      partial_reduction(curr_accum, 0, NUM_ELEMENTS, WORD_LEN)
+      reduce_accum('c8_overflow')
 
       #print_poly_hex("C8 accum    ", curr_accum)
 
+   # The one reduction the lazy accumulator needs, the output coefficients
+   # are BIT_LEN wide
+   if lazy:
+      partial_reduction(curr_accum, 0, NUM_ELEMENTS, WORD_LEN)
+
+   profile_accum('out')
+
+   if points is not None:
+      points['out'] = list(curr_accum)
+
    sqr_out = 0
    for i in range (NUM_ELEMENTS):
       sqr_out += (curr_accum[i] << (i * WORD_LEN))
@@ -785,66 +899,24 @@ def modular_square(sqr_in, mod_in, redLUT, redundant_elements,
 # Generate reduction LUTs
 ################################################################################
 
+# Tables are held in a reduction_lut.ReductionLUT, indexed as redLUT[z][y][x]
+# where:
+#  z - Number of memories
+#  y - Reduction address taken from the squared result coefficients
+#  x - Precomputed reduction polynomial
+# They are loaded from the on-disk LUT cache when available.
+
 def generate_reduction_luts(mod_in, nonredundant_elements, redundant_elements, 
                             num_segments, word_len):
-   REDUNDANT_ELEMENTS    = redundant_elements
-   NONREDUNDANT_ELEMENTS = nonredundant_elements
-   NUM_SEGMENTS          = num_segments
-   WORD_LEN              = word_len
-
-   WORD_MASK             = (2**WORD_LEN) - 1
-   LOOK_UP_WIDTH         = WORD_LEN // 2
-   LUT_SIZE              = (2**LOOK_UP_WIDTH)
-   SEGMENT_ELEMENTS      = (NONREDUNDANT_ELEMENTS // NUM_SEGMENTS)
-
-   EXTRA_ELEMENTS        = 2;
-   TWO_SEGMENTS          = (SEGMENT_ELEMENTS*2) + REDUNDANT_ELEMENTS + \
-                           EXTRA_ELEMENTS
-
-    #Generate tables in redLUT[z][y][x] where:
-    # z - Number of memories
-    # y - Reduction address taken from the squared result coefficients
-    # x - Precomputed reduction polynomial
-
-   redLUT = [[[0 for x in range (NONREDUNDANT_ELEMENTS)]
-              for y in range (LUT_SIZE * 2)]
-             for z in range (TWO_SEGMENTS)]
-
-   #print("X Y X", NONREDUNDANT_ELEMENTS, (LUT_SIZE * 2), TWO_SEGMENTS)
-
-   # Compute the reduction tables
-   for i in range (TWO_SEGMENTS):
-      # Polynomial degree offset for V7V6
-      offset = (SEGMENT_ELEMENTS*2)
-
-      # Compute base reduction value for the coefficient degree
-      t_v7v6 = (2**((i + NONREDUNDANT_ELEMENTS + offset) * WORD_LEN)) % mod_in
-      t_v5v4 = (2**((i + NONREDUNDANT_ELEMENTS) * WORD_LEN)) % mod_in
-
-      # Each address represents a different value stored in the coefficient
-      for j in range (LUT_SIZE):
-         cur_v7v6 = (t_v7v6 * j) % mod_in
-         cur_v5v4 = (t_v5v4 * j) % mod_in
-
-         #print(i, hex(j), "cur_v7v6", hex(cur_v7v6))
-
-         # Break the precomputed result into polynomial coefficients
-         for k in range (NONREDUNDANT_ELEMENTS):
-            redLUT[i][j][k] = cur_v7v6 & WORD_MASK
-            cur_v7v6 = cur_v7v6 >> WORD_LEN
-
-            redLUT[i][j + LUT_SIZE][k] = cur_v5v4 & WORD_MASK
-            cur_v5v4 = cur_v5v4 >> WORD_LEN
-      #print()
-
-   return redLUT
+   return reduction_lut.load(mod_in, redundant_elements, nonredundant_elements,
+                             num_segments, word_len)
 
 ################################################################################
 # Comparison checking
 ################################################################################
 
 def check(mod_sqr_in, mod_in, mod_sqr_out_to_check):
-   expected = (sqr_in * sqr_in) % mod_in
+   expected = (mod_sqr_in * mod_sqr_in) % mod_in
 
    debug = 0;
 
@@ -865,6 +937,66 @@ def check(mod_sqr_in, mod_in, mod_sqr_out_to_check):
 
    return 1
 
+# Squares sqr_in with eager and lazy normalization and checks the lazy run
+# against the hardware at every normalization point.  Dropping a partial
+# reduction never changes the value, only the widths, so what can go wrong
+# is a coefficient outgrowing its register or a LUT being read at a
+# different address.  Returns the lazy result, the violations found as
+# strings, and whether the output coefficients are the same (if not, the RTL
+# could only drop those carry propagate steps with a wider sq_out).
+#
+#   accumulator points  widest coefficient vs ACC_BIT_LEN
+#   out                 widest output coefficient vs BIT_LEN
+#   grid entries        widest compress_grid entry vs GRID_BIT_LEN
+#   LUT addresses       widest address vs the LUT address width, and the
+#                       same addresses read as in the eager run
+def check_lazy(sqr_in, mod_in, redLUT, redundant_elements,
+               nonredundant_elements, num_segments, bit_len, word_len, stats,
+               profile=None, use_square=False):
+   plan          = grid_plan(redundant_elements, nonredundant_elements,
+                             num_segments, bit_len, word_len, use_square)
+   eager_points  = {}
+   lazy_points   = {}
+   eager_profile = model_stats.ModelProfile()
+   lazy_profile  = model_stats.ModelProfile()
+
+   modular_square(sqr_in, mod_in, redLUT, redundant_elements,
+                  nonredundant_elements, num_segments, bit_len, word_len, {},
+                  eager_profile, use_square=use_square, points=eager_points)
+   sqr_out = modular_square(sqr_in, mod_in, redLUT, redundant_elements,
+                            nonredundant_elements, num_segments, bit_len,
+                            word_len, stats, lazy_profile,
+                            use_square=use_square, lazy=True,
+                            points=lazy_points)
+   if profile is not None:
+      profile.merge(lazy_profile)
+
+   violations = []
+   for name, coeffs in lazy_points.items():
+      limit = bit_len if name == 'out' else plan.acc_bit_len
+      width = max(coeffs).bit_length()
+      if width > limit:
+         violations.append('%s width %d > %d' % (name, width, limit))
+
+   for name in sorted(lazy_profile.widths):
+      if name.startswith('grid_entry_'):
+         width = lazy_profile.max_width(name)
+         if width > plan.grid_bit_len:
+            violations.append('%s width %d > %d' % (name, width,
+                                                    plan.grid_bit_len))
+
+   for kind in sorted(lazy_profile.lut):
+      width = max(lazy_profile.lut[kind]).bit_length()
+      if width > plan.look_up_width:
+         violations.append('%s address width %d > %d' %
+                           (kind, width, plan.look_up_width))
+      if lazy_profile.lut[kind] != eager_profile.lut[kind]:
+         violations.append('%s addresses differ' % kind)
+
+   same_out = eager_points['out'] == lazy_points['out']
+
+   return sqr_out, violations, same_out
+
 def checkLUTS(a, b, x, y, z):
    for i in range (x):
       for j in range (y):
@@ -876,63 +1008,144 @@ def checkLUTS(a, b, x, y, z):
 # Testing loops
 ################################################################################
 
-random.seed(0)
-
-num_tests     = 10
-tests_run     = 0
-tests_failed  = 0
-
-# Test Parameters
-num_segments   = 4                    # Fixed
-num_redundants = [1, 2]               # Number of extra redundant elements
-nonredundants  = [8, 16, 32, 64, 128] # number of elements list
-word_lens      = [4, 8, 16]           # bit length of each element
-
-num_redundants = [2]
-nonredundants  = [128]
-word_lens      = [16]
-
-for l in word_lens:
-   for k in nonredundants:
-      for j in num_redundants:
-         #mod_in = 0xe3e70682c2094cac629f6fbed82c07cd
-         #mod_in = (2**(k*l))-1
-         mod_in = random.getrandbits(k*l)
-
-         redLUT = generate_reduction_luts(mod_in, k, j, num_segments, l)
-         #s_redLUT = precompute_reduction_tables()
-         #checkLUTS(redLUT, s_redLUT, k, 2*(2**(l//2)), ((k//4)*2)+j)
-
-         #sqr_in = 0xf728b4fa42485e3a0a5d2f346baa9455
-         #sqr_in = random.getrandbits((k+j)*l)
-         #sqr_in = (2**2048)-1
-         #sqr_in = (2**((k+j)*l))-1
-         sqr_in = random.getrandbits(k*l)
+# Squares a random input num_tests times for every configuration, feeding
+# each redundant output back in.  Returns (tests_run, tests_failed), a test
+# counting as failed once however many of its checks fail.  Moduli and
+# inputs come from rng (the random module by default), stat_counts if given
+# counts the squarings that set each statistic, and verbose prints the
+# progress and statistics of every squaring.
+def run_tests(word_lens, nonredundants, num_redundants, num_tests=10,
+              num_segments=4, use_square=False, lazy=False,
+              lazy_check=False, rng=None, verbose=True, stat_counts=None):
+   tests_run     = 0
+   tests_failed  = 0
+
+   if rng is None:
+      rng = random
+
+   for l in word_lens:
+      for k in nonredundants:
+         for j in num_redundants:
+            #mod_in = 0xe3e70682c2094cac629f6fbed82c07cd
+            #mod_in = (2**(k*l))-1
+            mod_in = rng.getrandbits(k*l)
+
+            redLUT = generate_reduction_luts(mod_in, k, j, num_segments, l)
+            #s_redLUT = precompute_reduction_tables()
+            #checkLUTS(redLUT, s_redLUT, k, 2*(2**(l//2)), ((k//4)*2)+j)
+
+            #sqr_in = 0xf728b4fa42485e3a0a5d2f346baa9455
+            #sqr_in = random.getrandbits((k+j)*l)
+            #sqr_in = (2**2048)-1
+            #sqr_in = (2**((k+j)*l))-1
+            sqr_in = rng.getrandbits(k*l)
+
+            stats = {}
+
+            if verbose:
+               print("Testing num elements", k, "+", j, "with word len", l)
+            for i in range (num_tests):
+               tests_run += 1
+               lazy_ok    = True
+
+               if lazy_check:
+                  mod_sqr_out, violations, same_out = \
+                     check_lazy(sqr_in, mod_in, redLUT, j, k, num_segments,
+                                (l+1), l, stats, use_square=use_square)
+                  if violations:
+                     lazy_ok = False
+                     print("Lazy violations:", ', '.join(violations))
+                  if not same_out:
+                     print("Lazy output coefficients differ")
+               else:
+                  mod_sqr_out = modular_square(sqr_in, mod_in, redLUT, j,
+                                               k, num_segments, (l+1), l,
+                                               stats, use_square=use_square,
+                                               lazy=lazy)
+
+               if verbose:
+                  print('Statistics:')
+                  print(stats)
+               if stat_counts is not None:
+                  stat_counts.update(stats.keys())
+
+               check_mod_sqr_out = mod_sqr_out % mod_in
+
+               result = check(sqr_in, mod_in, check_mod_sqr_out)
+
+               if (result == 0 or not lazy_ok):
+                  tests_failed += 1
+                  print("Failure parameters:", j, k, l)
+
+               sqr_in = mod_sqr_out
+
+   return tests_run, tests_failed
 
-         stats = {}
-         
-         print("Testing num elements", k, "+", j, "with word len", l)
-         for i in range (num_tests):
-            tests_run += 1
-
-            mod_sqr_out = modular_square(sqr_in, mod_in, redLUT, j, 
-                                         k, num_segments, (l+1), l, stats)
-
-            print('Statistics:')
-            print(stats)
-
-            check_mod_sqr_out = mod_sqr_out % mod_in
-
-            result = check(sqr_in, mod_in, check_mod_sqr_out)
-
-            if (result == 0):
-               tests_failed += 1
-               print("Failure parameters:", j, k, l)
-
-            sqr_in = mod_sqr_out
-
-print("Passed", tests_run-tests_failed, "out of", tests_run, "tests")
-
-result_str = "FAILED" if (tests_failed > 0) else "PASSED"
-print(result_str)
+################################################################################
+# Command line
+################################################################################
 
+def usage():
+   print('modular_square_9_cycles.py -i <iterations> -w <word lens>',
+         '-n <nonredundants> -r <redundants> [-S] [-L] [-C]')
+   print('  lists are comma separated, e.g. -w 4,8,16')
+   print('  -S  square segments with the squaring multiply')
+   print('  -L  lazy accumulator normalization')
+   print('  -C  check lazy normalization against the hardware widths')
+
+if __name__ == "__main__":
+   random.seed(0)
+
+   num_tests     = 10
+
+   # Test Parameters
+   num_segments   = 4                    # Fixed
+   num_redundants = [1, 2]               # Number of extra redundant elements
+   nonredundants  = [8, 16, 32, 64, 128] # number of elements list
+   word_lens      = [4, 8, 16]           # bit length of each element
+
+   # Single configuration by default, modular_square_sweep.py runs the full
+   # sweep in parallel
+   num_redundants = [2]
+   nonredundants  = [128]
+   word_lens      = [16]
+
+   use_square     = False
+   lazy           = False
+   lazy_check     = False
+
+   try:
+      opts, args = getopt.getopt(sys.argv[1:], "hi:w:n:r:SLC")
+   except getopt.GetoptError:
+      usage()
+      sys.exit(2)
+
+   for opt, arg in opts:
+      if opt == '-h':
+         usage()
+         sys.exit()
+      elif opt == '-i':
+         num_tests = int(arg)
+      elif opt == '-w':
+         word_lens = [int(x) for x in arg.split(',')]
+      elif opt == '-n':
+         nonredundants = [int(x) for x in arg.split(',')]
+      elif opt == '-r':
+         num_redundants = [int(x) for x in arg.split(',')]
+      elif opt == '-S':
+         use_square = True
+      elif opt == '-L':
+         lazy = True
+      elif opt == '-C':
+         lazy_check = True
+
+   tests_run, tests_failed = run_tests(word_lens, nonredundants,
+                                       num_redundants, num_tests,
+                                       num_segments, use_square, lazy,
+                                       lazy_check)
+
+   print("Passed", tests_run-tests_failed, "out of", tests_run, "tests")
+
+   result_str = "FAILED" if (tests_failed > 0) else "PASSED"
+   print(result_str)
+   sys.exit(1 if result_str == "FAILED" else 0)
@@ -0,0 +1,555 @@
+#!/usr/bin/python3
+
+################################################################################
+# Copyright 2019 Supranational LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+################################################################################
+# Batched 9 cycle modular square model
+################################################################################
+# Evaluates modular_square() from modular_square_9_cycles.py for many inputs
+# at once.  Polynomials are held as NumPy arrays of shape
+# (batch, num coefficients) and every step of the scalar model (multiplier
+# compressor trees, grid compression, partial reductions, LUT lookups and the
+# conditional overflow cycles) is applied across the whole batch.  The results
+# are bit-exact with the scalar model, coefficient by coefficient.
+#
+# All intermediate values fit comfortably in 64 bits for the supported word
+# lengths (up to 16), so int64 arrays are used throughout.
+
+import getopt
+import math
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', '..', 'primitives', 'model'))
+
+import primitives as p
+import modular_square_9_cycles as ms
+import model_stats
+import reduction_lut
+
+################################################################################
+# Conversion between integers and coefficient arrays
+################################################################################
+
+def to_coefficients(values, num_elements, word_len):
+   coeffs    = np.zeros((len(values), num_elements), dtype=np.int64)
+   word_mask = (2**word_len) - 1
+
+   # Byte aligned words can be unpacked straight from the integer bytes
+   if word_len in (8, 16, 32):
+      num_bytes = (num_elements * word_len) // 8
+      dtype     = np.dtype('<u%d' % (word_len // 8))
+      buf       = b''.join((v & ((1 << (num_bytes*8)) - 1)).to_bytes(
+                              num_bytes, 'little') for v in values)
+      coeffs[:] = np.frombuffer(buf, dtype=dtype).reshape(len(values),
+                                                           num_elements)
+   else:
+      for i, v in enumerate(values):
+         for j in range (num_elements):
+            coeffs[i][j] = (v >> (word_len * j)) & word_mask
+
+   return coeffs
+
+def from_coefficients(coeffs, word_len):
+   values = []
+   for row in coeffs.tolist():
+      v = 0
+      for i in range (len(row)-1, -1, -1):
+         v = (v << word_len) + row[i]
+      values.append(v)
+   return values
+
+# Fully carry propagate the polynomials and drop anything above the top
+# coefficient.  Equivalent to from_coefficients followed by to_coefficients,
+# which is how the scalar model feeds one output into the next input.
+def normalize(coeffs, word_len):
+   word_mask = (2**word_len) - 1
+   coeffs    = coeffs.copy()
+   for i in range (coeffs.shape[1]-1):
+      coeffs[:, i+1] += coeffs[:, i] >> word_len
+      coeffs[:, i]   &= word_mask
+   coeffs[:, -1] &= word_mask
+   return coeffs
+
+################################################################################
+# Batched building blocks
+################################################################################
+
+# Partially reduce the polynomials by adding the high bits into
+# the next coefficient.  Same single high to low pass as the scalar version.
+def partial_reduction(p_v, offset, elements, word_len):
+   word_mask = (2**word_len) - 1
+   for i in range (elements-1, 0, -1):
+      p_v[:, i+offset]   += p_v[:, i+offset-1] >> word_len
+      p_v[:, i+offset-1] &= word_mask
+
+def multiply(A, B, NUM_ELEMENTS, COL_BIT_LEN, WORD_LEN):
+   batch = A.shape[0]
+
+   mul_result = A[:, :, np.newaxis] * B[:, np.newaxis, :]
+
+   # grid[batch][col][row]
+   grid = np.zeros((batch, NUM_ELEMENTS*2, NUM_ELEMENTS*2), dtype=np.int64)
+   i, j = np.meshgrid(np.arange(NUM_ELEMENTS), np.arange(NUM_ELEMENTS),
+                      indexing='ij')
+   grid[:, i+j, 2*i]       = mul_result & ((2**WORD_LEN)-1)
+   grid[:, i+j+1, (2*i)+1] = (mul_result >> WORD_LEN) & \
+                             ((2**COL_BIT_LEN)-1)
+
+   # The first and last columns only hold a single term, which passes
+   # through the tree unchanged as the sum with a zero carry.
+   cout, s = p.compressor_tree_word([grid[:, :, r] for r in
+                                     range(NUM_ELEMENTS*2)], COL_BIT_LEN)
+
+   return cout, s
+
+# Placement comes from the scalar model's GridPlan so both models share one
+# description of the multiply cycles
+def set_grid_5_cycle(cycle, sqr_in_seg, redundant_elements,
+                     nonredundant_elements, num_segments, bit_len, word_len):
+   plan = ms.grid_plan(redundant_elements, nonredundant_elements,
+                       num_segments, bit_len, word_len)
+
+   inputs, places = plan.cycles[cycle]
+   results = [multiply(sqr_in_seg[:, a], sqr_in_seg[:, b],
+                       plan.mul_num_elements, plan.mul_bit_len, word_len)
+              for a, b in inputs]
+
+   # grid[batch][col][row], rows as in the scalar model
+   grid = np.zeros((sqr_in_seg.shape[0], plan.grid_size, ms.GRID_ROWS),
+                   dtype=np.int64)
+
+   n = plan.mul_num_elements*2
+   for mul, output, shift, col, row in places:
+      v = results[mul][output] << shift
+      grid[:, col:col+n, row]         = v & plan.word_mask
+      grid[:, col+1:col+n+1, row+1]   = v >> word_len
+
+   return grid
+
+def add_prev_to_grid(grid, p_v, grid_offset, length):
+   grid[:, grid_offset:grid_offset+length, ms.PREV_ROW] = p_v[:, 0:length]
+   return grid
+
+def compress_grid(grid, grid_size, grid_bit_len, word_len, profile=None,
+                  name=None):
+   if profile is not None:
+      widest = grid.max(axis=(1, 2))
+      profile.add_widths('grid_entry_' + name, width_hist(widest))
+      profile.set_limit('grid_entry_' + name, grid_bit_len)
+      profile.count('grid_truncated',
+                    int(((widest >> grid_bit_len) != 0).sum()))
+
+   cg, sg = p.compressor_tree_word([grid[:, :, r]
+                                    for r in range(ms.GRID_ROWS)],
+                                   grid_bit_len)
+
+   sub_totals = cg + sg
+
+   if profile is not None:
+      profile.add_widths('grid_column_' + name,
+                         width_hist(sub_totals.max(axis=1)))
+
+   partial_reduction(sub_totals, 0, grid_size, word_len)
+
+   return sub_totals
+
+################################################################################
+# Profiling helpers, see model_stats.py
+################################################################################
+
+# {bit width: count} of a 1-D array of non-negative values below 2^53
+def width_hist(values):
+   widths = np.frexp(values.astype(np.float64))[1]
+   w, c   = np.unique(widths, return_counts=True)
+   return dict(zip(w.tolist(), c.tolist()))
+
+def addr_hist(addr):
+   a, c = np.unique(addr, return_counts=True)
+   return dict(zip(a.tolist(), c.tolist()))
+
+# Look up one table row per LUT for every polynomial in the batch.
+# addr is (batch, num LUTs), the result is (batch, num LUTs, nonredundant).
+def lut_lookup(redLUT, addr):
+   return redLUT[np.arange(redLUT.shape[0]), addr]
+
+# Add the looked up rows, optionally shifted up by LOOK_UP_WIDTH bits, into
+# the accumulator as the scalar model does coefficient by coefficient.
+def accumulate(curr_accum, rows, look_up_width, word_mask, shift, offset=0):
+   elements = rows.shape[2]
+   if shift:
+      curr_accum[:, 0:elements]   += ((rows << look_up_width) &
+                                      word_mask).sum(axis=1)
+      curr_accum[:, 1:elements+1] += (rows >> look_up_width).sum(axis=1)
+   else:
+      curr_accum[:, offset:elements+offset] += rows.sum(axis=1)
+
+################################################################################
+# Modular square
+################################################################################
+
+# Gather friendly (num LUTs, entries, nonredundant) copy of the tables
+def lut_array(redLUT):
+   if isinstance(redLUT, reduction_lut.ReductionLUT):
+      return np.frombuffer(redLUT.data, dtype=redLUT.typecode).reshape(
+                redLUT.shape).astype(np.int64)
+   return np.asarray(redLUT, dtype=np.int64)
+
+def modular_square(sqr_in_v, redLUT, redundant_elements,
+                   nonredundant_elements, num_segments, bit_len, word_len,
+                   stats=None, profile=None):
+   #############################################################################
+   # Parameters
+   #############################################################################
+   REDUNDANT_ELEMENTS    = redundant_elements
+   NONREDUNDANT_ELEMENTS = nonredundant_elements
+   NUM_SEGMENTS          = num_segments
+   BIT_LEN               = bit_len
+   WORD_LEN              = word_len
+
+   NUM_ELEMENTS          = REDUNDANT_ELEMENTS + NONREDUNDANT_ELEMENTS
+   SEGMENT_ELEMENTS      = (NONREDUNDANT_ELEMENTS // NUM_SEGMENTS)
+   MUL_NUM_ELEMENTS      = SEGMENT_ELEMENTS + REDUNDANT_ELEMENTS
+
+   EXTRA_ELEMENTS        = 2;
+   TWO_SEGMENTS          = (SEGMENT_ELEMENTS*2) + REDUNDANT_ELEMENTS + \
+                           EXTRA_ELEMENTS
+   THREE_SEGMENTS        = (SEGMENT_ELEMENTS*3) + REDUNDANT_ELEMENTS + \
+                           EXTRA_ELEMENTS
+
+   GRID_SIZE             = ((MUL_NUM_ELEMENTS*2) + SEGMENT_ELEMENTS + 1)
+
+   EXTRA_MUL_TREE_BITS   = math.ceil(math.log2(MUL_NUM_ELEMENTS))     \
+                           if (BIT_LEN > WORD_LEN) else               \
+                           math.ceil(math.log2(NUM_ELEMENTS*2))
+   MUL_BIT_LEN           = ((BIT_LEN*2) - WORD_LEN)     +             \
+                           EXTRA_MUL_TREE_BITS
+
+   MAX_VALUE             = ((2**BIT_LEN)-1)           +               \
+                           (((2**WORD_LEN)-1) << 2)   +               \
+                           (((2**(MUL_BIT_LEN-WORD_LEN))-1) << 2)
+
+   GRID_BIT_LEN          = math.ceil(math.log2(MAX_VALUE))
+
+   WORD_MASK             = (2**WORD_LEN) - 1
+   LOOK_UP_WIDTH         = WORD_LEN // 2
+   LUT_SIZE              = 2**LOOK_UP_WIDTH
+   LUT_MASK              = (2**LOOK_UP_WIDTH)-1
+
+   grid_args = (REDUNDANT_ELEMENTS, NONREDUNDANT_ELEMENTS, NUM_SEGMENTS,
+                BIT_LEN, WORD_LEN)
+
+   #############################################################################
+   # Input
+   #############################################################################
+   batch = sqr_in_v.shape[0]
+
+   if profile is not None:
+      profile.add_runs(batch)
+
+   def profile_accum(name, accum):
+      if profile is not None:
+         profile.add_widths('accum_' + name, width_hist(accum.max(axis=1)))
+
+   def profile_lut(kind, addr):
+      if profile is not None:
+         profile.add_lut_addrs(kind, addr_hist(addr))
+
+   sqr_in_seg = np.zeros((batch, NUM_SEGMENTS, MUL_NUM_ELEMENTS),
+                         dtype=np.int64)
+   sqr_in_seg[:, :, 0:SEGMENT_ELEMENTS] = \
+      sqr_in_v[:, 0:NONREDUNDANT_ELEMENTS].reshape(batch, NUM_SEGMENTS,
+                                                   SEGMENT_ELEMENTS)
+
+   # Last cycle holds the extra redundant elements for overflow
+   for i in range (REDUNDANT_ELEMENTS, 0, -1):
+      sqr_in_seg[:, NUM_SEGMENTS-1, MUL_NUM_ELEMENTS-i] = \
+         sqr_in_v[:, NUM_ELEMENTS-i]
+
+   #############################################################################
+   # Cycles 0 - 3, square and compress the first segments
+   #############################################################################
+   grid_cycle_0 = set_grid_5_cycle(0, sqr_in_seg, *grid_args)
+   grid_cycle_1 = set_grid_5_cycle(1, sqr_in_seg, *grid_args)
+   grid_cycle_2 = set_grid_5_cycle(2, sqr_in_seg, *grid_args)
+
+   sub_totals_cycle_0 = compress_grid(grid_cycle_0, GRID_SIZE,
+                                      GRID_BIT_LEN, WORD_LEN, profile, 'c0')
+
+   v5_partial = sub_totals_cycle_0[:, 0:SEGMENT_ELEMENTS]
+   v7v6       = sub_totals_cycle_0[:, SEGMENT_ELEMENTS:
+                                      SEGMENT_ELEMENTS+TWO_SEGMENTS]
+
+   grid_cycle_3 = set_grid_5_cycle(3, sqr_in_seg, *grid_args)
+
+   add_prev_to_grid(grid_cycle_1, v5_partial, SEGMENT_ELEMENTS,
+                    SEGMENT_ELEMENTS)
+
+   sub_totals_cycle_1 = compress_grid(grid_cycle_1, GRID_SIZE,
+                                      GRID_BIT_LEN, WORD_LEN, profile, 'c1')
+
+   v5v4_partial = sub_totals_cycle_1[:, 0:TWO_SEGMENTS]
+
+   v7v6_high  = (v7v6 >> LOOK_UP_WIDTH) & LUT_MASK
+   v7v6_upper = lut_lookup(redLUT, v7v6_high)
+   profile_lut('v7v6_upper', v7v6_high)
+
+   #############################################################################
+   # Cycle 4
+   #############################################################################
+   grid_cycle_4 = set_grid_5_cycle(4, sqr_in_seg, *grid_args)
+
+   add_prev_to_grid(grid_cycle_2, v5v4_partial, SEGMENT_ELEMENTS,
+                    TWO_SEGMENTS)
+
+   sub_totals_cycle_2 = compress_grid(grid_cycle_2, GRID_SIZE,
+                                      GRID_BIT_LEN, WORD_LEN, profile, 'c2')
+
+   v3_partial = sub_totals_cycle_2[:, 0:SEGMENT_ELEMENTS]
+   v5v4       = sub_totals_cycle_2[:, SEGMENT_ELEMENTS:
+                                      SEGMENT_ELEMENTS+TWO_SEGMENTS]
+
+   v7v6_low   = v7v6 & LUT_MASK
+   v7v6_lower = lut_lookup(redLUT, v7v6_low)
+   profile_lut('v7v6_lower', v7v6_low)
+
+   curr_accum = np.zeros((batch, NUM_ELEMENTS), dtype=np.int64)
+
+   accumulate(curr_accum, v7v6_upper, LOOK_UP_WIDTH, WORD_MASK, True)
+   profile_accum('c4', curr_accum)
+   partial_reduction(curr_accum, 0, NUM_ELEMENTS, WORD_LEN)
+
+   #############################################################################
+   # Cycle 5
+   #############################################################################
+   add_prev_to_grid(grid_cycle_3, v3_partial, SEGMENT_ELEMENTS,
+                    SEGMENT_ELEMENTS)
+
+   sub_totals_cycle_3 = compress_grid(grid_cycle_3, GRID_SIZE,
+                                      GRID_BIT_LEN, WORD_LEN, profile, 'c3')
+
+   v3         = sub_totals_cycle_3[:, SEGMENT_ELEMENTS:
+                                      (SEGMENT_ELEMENTS*2)+REDUNDANT_ELEMENTS]
+   v2_partial = sub_totals_cycle_3[:, 0:SEGMENT_ELEMENTS]
+
+   v7v6_top      = v7v6 >> WORD_LEN
+   v7v6_over     = lut_lookup(redLUT, v7v6_top)
+   v7v6_overflow = (v7v6_top != 0).any(axis=1)
+   profile_lut('v7v6_over', v7v6_top)
+
+   v5v4_high  = (v5v4 >> LOOK_UP_WIDTH) & LUT_MASK
+   v5v4_upper = lut_lookup(redLUT, v5v4_high + LUT_SIZE)
+   profile_lut('v5v4_upper', v5v4_high)
+
+   accumulate(curr_accum, v7v6_lower, LOOK_UP_WIDTH, WORD_MASK, False)
+   profile_accum('c5', curr_accum)
+   partial_reduction(curr_accum, 0, NUM_ELEMENTS, WORD_LEN)
+
+   #############################################################################
+   # Cycle 6
+   #############################################################################
+   add_prev_to_grid(grid_cycle_4, v2_partial, (SEGMENT_ELEMENTS*2),
+                    SEGMENT_ELEMENTS)
+
+   sub_totals_cycle_4 = compress_grid(grid_cycle_4, GRID_SIZE,
+                                      GRID_BIT_LEN, WORD_LEN, profile, 'c4')
+
+   v2v0 = sub_totals_cycle_4[:, 0:THREE_SEGMENTS]
+
+   v5v4_low   = v5v4 & LUT_MASK
+   v5v4_lower = lut_lookup(redLUT, v5v4_low + LUT_SIZE)
+   profile_lut('v5v4_lower', v5v4_low)
+
+   # Only the polynomials with a V7V6 overflow take the extra accumulation
+   if v7v6_overflow.any():
+      over_accum = curr_accum[v7v6_overflow]
+      accumulate(over_accum, v7v6_over[v7v6_overflow], LOOK_UP_WIDTH,
+                 WORD_MASK, False, 1)
+      profile_accum('c6_overflow', over_accum)
+      partial_reduction(over_accum, 0, NUM_ELEMENTS, WORD_LEN)
+      curr_accum[v7v6_overflow] = over_accum
+
+   accumulate(curr_accum, v5v4_upper, LOOK_UP_WIDTH, WORD_MASK, True)
+   profile_accum('c6', curr_accum)
+   partial_reduction(curr_accum, 0, NUM_ELEMENTS, WORD_LEN)
+
+   #############################################################################
+   # Cycle 7
+   #############################################################################
+   v5v4_top      = v5v4 >> WORD_LEN
+   v5v4_over     = lut_lookup(redLUT, v5v4_top + LUT_SIZE)
+   v5v4_overflow = (v5v4_top != 0).any(axis=1)
+   profile_lut('v5v4_over', v5v4_top)
+
+   accumulate(curr_accum, v5v4_lower, LOOK_UP_WIDTH, WORD_MASK, False)
+
+   curr_accum[:, 0:THREE_SEGMENTS] += v2v0
+   curr_accum[:, (SEGMENT_ELEMENTS*3):
+                 (SEGMENT_ELEMENTS*4)+REDUNDANT_ELEMENTS] += v3
+
+   profile_accum('c7', curr_accum)
+   partial_reduction(curr_accum, 0, NUM_ELEMENTS, WORD_LEN)
+
+   #############################################################################
+   # Cycle 8
+   #############################################################################
+   if v5v4_overflow.any():
+      over_accum = curr_accum[v5v4_overflow]
+      accumulate(over_accum, v5v4_over[v5v4_overflow], LOOK_UP_WIDTH,
+                 WORD_MASK, False, 1)
+      profile_accum('c8_overflow', over_accum)
+      partial_reduction(over_accum, 0, NUM_ELEMENTS, WORD_LEN)
+      curr_accum[v5v4_overflow] = over_accum
+
+   if profile is not None:
+      profile.count('v7v6_overflow', int(v7v6_overflow.sum()))
+      profile.count('v5v4_overflow', int(v5v4_overflow.sum()))
+   profile_accum('out', curr_accum)
+
+   if stats is not None:
+      stats['v7v6_overflow'] = v7v6_overflow
+      stats['v5v4_overflow'] = v5v4_overflow
+
+   return curr_accum
+
+################################################################################
+# Fuzz testing
+################################################################################
+
+def usage():
+   print('modular_square_batch.py -n <num inputs> -b <batch size>',
+         '-c <chain length> -r <num redundant> -e <num nonredundant>',
+         '-w <word len> -s <seed> -x <num scalar cross checks>',
+         '[-p <profile file>]')
+   print('  -p  write a per cycle profile, CSV if the name ends in .csv,',
+         'JSON otherwise')
+
+if __name__ == "__main__":
+   num_inputs    = 4096
+   batch_size    = 1024
+   chain_len     = 10
+   num_segments  = 4
+   redundant     = 2
+   nonredundant  = 128
+   word_len      = 16
+   seed          = 0
+   cross_checks  = 4
+   profile_file  = None
+
+   try:
+      opts, args = getopt.getopt(sys.argv[1:], "hn:b:c:r:e:w:s:x:p:")
+   except getopt.GetoptError:
+      usage()
+      sys.exit(2)
+
+   for opt, arg in opts:
+      if opt == '-h':
+         usage()
+         sys.exit()
+      elif opt == '-n':
+         num_inputs = int(arg)
+      elif opt == '-b':
+         batch_size = int(arg)
+      elif opt == '-c':
+         chain_len = int(arg)
+      elif opt == '-r':
+         redundant = int(arg)
+      elif opt == '-e':
+         nonredundant = int(arg)
+      elif opt == '-w':
+         word_len = int(arg)
+      elif opt == '-s':
+         seed = int(arg)
+      elif opt == '-x':
+         cross_checks = int(arg)
+      elif opt == '-p':
+         profile_file = arg
+
+   random.seed(seed)
+
+   num_elements = redundant + nonredundant
+   bit_len      = word_len + 1
+
+   mod_in = random.getrandbits(nonredundant*word_len)
+   redLUT = ms.generate_reduction_luts(mod_in, nonredundant, redundant,
+                                       num_segments, word_len)
+   lut    = lut_array(redLUT)
+
+   profile = model_stats.ModelProfile() if profile_file is not None else None
+
+   tests_run    = 0
+   tests_failed = 0
+   v7v6_count   = 0
+   v5v4_count   = 0
+   start        = time.time()
+
+   for b in range (0, num_inputs, batch_size):
+      count  = min(batch_size, num_inputs - b)
+      sqr_in = [random.getrandbits(nonredundant*word_len)
+                for i in range (count)]
+      coeffs = to_coefficients(sqr_in, num_elements, word_len)
+
+      # Feed the redundant outputs back in as the scalar test loop does
+      for c in range (chain_len):
+         stats  = {}
+         coeffs = modular_square(normalize(coeffs, word_len), lut, redundant,
+                                 nonredundant, num_segments, bit_len, word_len,
+                                 stats, profile)
+         v7v6_count += int(stats['v7v6_overflow'].sum())
+         v5v4_count += int(stats['v5v4_overflow'].sum())
+
+         sqr_out = from_coefficients(coeffs, word_len)
+         for i in range (count):
+            tests_run += 1
+            if (sqr_out[i] % mod_in) != ((sqr_in[i] * sqr_in[i]) % mod_in):
+               tests_failed += 1
+               print("Failure input:", hex(sqr_in[i]))
+
+         # Confirm the batch matches the scalar model coefficient for
+         # coefficient on the first few inputs
+         for i in range (min(cross_checks, count)):
+            expected = ms.modular_square(sqr_in[i], mod_in, redLUT,
+                                         redundant, nonredundant, num_segments,
+                                         bit_len, word_len, {})
+            if expected != sqr_out[i]:
+               tests_failed += 1
+               print("Scalar mismatch input:", hex(sqr_in[i]))
+
+         sqr_in = sqr_out
+
+   elapsed = time.time() - start
+
+   print("Testing num elements", nonredundant, "+", redundant,
+         "with word len", word_len)
+   print("V7V6 overflows", v7v6_count, "V5V4 overflows", v5v4_count)
+   print("%.1f squarings per second" % (tests_run / elapsed))
+
+   if profile is not None:
+      print(profile.summary())
+      if profile_file.endswith('.csv'):
+         profile.save_csv(profile_file)
+      else:
+         profile.save_json(profile_file)
+   print("Passed", tests_run-tests_failed, "out of", tests_run, "tests")
+
+   result_str = "FAILED" if (tests_failed > 0) else "PASSED"
+   print(result_str)
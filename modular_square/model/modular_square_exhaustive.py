@@ -0,0 +1,345 @@
+#!/usr/bin/python3
+
+################################################################################
+# Copyright 2019 Supranational LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+################################################################################
+# Exhaustive verification for small parameterizations
+################################################################################
+# Instead of random inputs, walks whole input classes through the batched
+# model and checks every result against (x*x) % M.  The rare carry cases the
+# V7V6/V5V4 overflow cycles exist for are hit deliberately rather than by
+# luck.
+#
+# Input classes, each input is a full coefficient vector including the
+# redundant elements:
+#   all      every nonredundant value 0 .. 2^(nonredundant*word_len)-1
+#   corners  every vector with each nonredundant coefficient 0, 2^word_len-1
+#            or 2^bit_len-1 and each redundant coefficient 0, 1 or
+#            2^word_len-1, covering all ones and maximally redundant inputs.
+#            Chained squarings never carry past word_len bits in the
+#            redundant elements (see chain_tracker.py), and inputs with a
+#            wider one can be 2^(num_elements*word_len) or more, which the
+#            hardware cannot produce.  Each vector is checked for the value
+#            of its coefficients; those at or above that bound are counted
+#            in the 'over' column.
+#   below_m  the count values just below M, 2M, 2^(nonredundant*word_len)
+#            and 2^(num_elements*word_len)
+#
+# Every class is split into chunks of consecutive indices that worker
+# processes generate and check on their own, so nothing large is pickled.
+# The moduli are all ones, 2^(n-1)+1 and a number of random ones, where n is
+# nonredundant*word_len.  Mismatches are reported with the input, the output
+# and the overflow flags of that squaring.
+
+import getopt
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', '..', 'primitives', 'model'))
+
+import modular_square_9_cycles as ms
+import modular_square_batch as msb
+
+NUM_SEGMENTS     = 4
+CLASSES          = ['all', 'corners', 'below_m']
+
+# 'all' is only in the default class list when it is at most this many inputs
+MAX_ALL_INPUTS   = 2**24
+
+# Mismatches kept per chunk, the rest are only counted
+MAX_MISMATCHES   = 16
+
+################################################################################
+# Input classes
+################################################################################
+# Each class is indexed 0 .. class_size()-1, class_inputs() builds the
+# coefficient rows for a range of indices.
+
+def below_m_bases(mod_in, nonredundant, redundant, word_len):
+   num_elements = nonredundant + redundant
+   bases = [mod_in, mod_in*2, 2**(nonredundant*word_len),
+            2**(num_elements*word_len)]
+   return [b for b in bases if b <= 2**(num_elements*word_len)]
+
+def class_size(cls, mod_in, nonredundant, redundant, word_len, count):
+   if cls == 'all':
+      return 2**(nonredundant*word_len)
+   elif cls == 'corners':
+      return 3**(nonredundant+redundant)
+   elif cls == 'below_m':
+      return len(below_m_bases(mod_in, nonredundant, redundant,
+                               word_len)) * count
+   raise ValueError('unknown input class ' + cls)
+
+def class_inputs(cls, start, num, mod_in, nonredundant, redundant, word_len,
+                 count):
+   num_elements = nonredundant + redundant
+   word_mask    = (2**word_len) - 1
+   index        = np.arange(start, start+num, dtype=np.int64)
+
+   if cls == 'all':
+      coeffs = np.zeros((num, num_elements), dtype=np.int64)
+      for j in range (nonredundant):
+         coeffs[:, j] = (index >> (word_len*j)) & word_mask
+      return coeffs
+
+   elif cls == 'corners':
+      levels           = np.array([0, word_mask, (2**(word_len+1))-1],
+                                  dtype=np.int64)
+      redundant_levels = np.array([0, 1, word_mask], dtype=np.int64)
+      coeffs = np.zeros((num, num_elements), dtype=np.int64)
+      for j in range (num_elements):
+         coeffs[:, j] = (levels if j < nonredundant else
+                         redundant_levels)[index % 3]
+         index        = index // 3
+      return coeffs
+
+   elif cls == 'below_m':
+      bases  = below_m_bases(mod_in, nonredundant, redundant, word_len)
+      values = [bases[i // count] - 1 - (i % count)
+                for i in range (start, start+num)]
+      return msb.to_coefficients([v % (2**(num_elements*word_len))
+                                  for v in values], num_elements, word_len)
+
+   raise ValueError('unknown input class ' + cls)
+
+################################################################################
+# Checking one chunk
+################################################################################
+
+# Reduction LUT per modulus, built once per worker process
+_luts = {}
+
+def chunk_lut(mod_in, nonredundant, redundant, word_len):
+   key = (mod_in, nonredundant, redundant, word_len)
+   if key not in _luts:
+      redLUT     = ms.generate_reduction_luts(mod_in, nonredundant, redundant,
+                                              NUM_SEGMENTS, word_len)
+      _luts[key] = msb.lut_array(redLUT)
+   return _luts[key]
+
+def run_chunk(job):
+   (word_len, nonredundant, redundant, mod_in, cls, start, num,
+    count) = job
+
+   result = {'word_len'     : word_len,
+             'nonredundant' : nonredundant,
+             'redundant'    : redundant,
+             'mod_in'       : mod_in,
+             'class'        : cls,
+             'inputs'       : num,
+             'over'         : 0,
+             'failed'       : 0,
+             'v7v6'         : 0,
+             'v5v4'         : 0,
+             'mismatches'   : [],
+             'error'        : None}
+
+   try:
+      lut    = chunk_lut(mod_in, nonredundant, redundant, word_len)
+      coeffs = class_inputs(cls, start, num, mod_in, nonredundant, redundant,
+                            word_len, count)
+      index  = np.arange(start, start+num)
+
+      # The value of the coefficients, not truncated to num_elements words
+      sqr_in   = msb.from_coefficients(coeffs, word_len)
+      result['over'] = sum(1 for v in sqr_in
+                           if v >= 2**((nonredundant+redundant)*word_len))
+
+      stats   = {}
+      out     = msb.modular_square(coeffs, lut, redundant, nonredundant,
+                                   NUM_SEGMENTS, word_len+1, word_len, stats)
+      v7v6    = stats['v7v6_overflow']
+      v5v4    = stats['v5v4_overflow']
+
+      result['v7v6'] = int(v7v6.sum())
+      result['v5v4'] = int(v5v4.sum())
+
+      sqr_out = msb.from_coefficients(out, word_len)
+      for i in range (len(sqr_in)):
+         if (sqr_out[i] % mod_in) != ((sqr_in[i] * sqr_in[i]) % mod_in):
+            result['failed'] += 1
+            if len(result['mismatches']) < MAX_MISMATCHES:
+               result['mismatches'].append(
+                  {'index'         : int(index[i]),
+                   'sqr_in'        : sqr_in[i],
+                   'coeffs'        : coeffs[i].tolist(),
+                   'sqr_out'       : sqr_out[i],
+                   'expected'      : (sqr_in[i] * sqr_in[i]) % mod_in,
+                   'v7v6_overflow' : bool(v7v6[i]),
+                   'v5v4_overflow' : bool(v5v4[i])})
+   except Exception as e:
+      result['inputs'] = 0
+      result['error']  = '%s: %s' % (type(e).__name__, e)
+
+   return result
+
+################################################################################
+# Jobs and summary
+################################################################################
+
+def moduli(nonredundant, word_len, num_random, seed):
+   n   = nonredundant*word_len
+   rng = random.Random('%d:%d:%d' % (nonredundant, word_len, seed))
+   mods = [(2**n)-1, (2**(n-1))+1]
+   for i in range (num_random):
+      # Keep the top bit set so M uses every nonredundant element
+      mods.append(rng.getrandbits(n) | (1 << (n-1)))
+   return mods
+
+def make_jobs(word_len, nonredundant, redundant, mods, classes, count, limit,
+              chunk_size):
+   jobs = []
+   for mod_in in mods:
+      for cls in classes:
+         size = class_size(cls, mod_in, nonredundant, redundant, word_len,
+                           count)
+         if limit is not None:
+            size = min(size, limit)
+         for start in range (0, size, chunk_size):
+            jobs.append((word_len, nonredundant, redundant, mod_in, cls,
+                         start, min(chunk_size, size-start), count))
+   return jobs
+
+def summary_table(results):
+   totals = {}
+   for r in results:
+      key = (r['mod_in'], r['class'])
+      t   = totals.setdefault(key, {'inputs' : 0, 'over'   : 0, 'failed' : 0,
+                                    'v7v6'   : 0, 'v5v4'   : 0, 'errors' : 0})
+      for k in ('inputs', 'over', 'failed', 'v7v6', 'v5v4'):
+         t[k] += r[k]
+      t['errors'] += 1 if r['error'] is not None else 0
+
+   lines = []
+   lines.append('%-20s %-8s %12s %9s %9s %10s %10s %6s' %
+                ('modulus', 'class', 'inputs', 'over', 'failed', 'v7v6',
+                 'v5v4', 'errors'))
+   for (mod_in, cls), t in sorted(totals.items()):
+      lines.append('%-20s %-8s %12d %9d %9d %10d %10d %6d' %
+                   (hex(mod_in), cls, t['inputs'], t['over'], t['failed'],
+                    t['v7v6'], t['v5v4'], t['errors']))
+   return '\n'.join(lines) + '\n'
+
+def usage():
+   print('modular_square_exhaustive.py -w <word len> -e <num nonredundant>',
+         '-r <num redundant> -c <classes> -M <moduli> -m <num random moduli>',
+         '-k <count> -l <limit> -b <chunk size> -j <processes> -s <seed>')
+   print('  -c  comma separated classes from', ','.join(CLASSES))
+   print('  -M  comma separated hex moduli, replaces the default moduli')
+   print('  -k  values below each base in the below_m class')
+   print('  -l  only the first limit inputs of each class')
+
+if __name__ == "__main__":
+   word_len      = 4
+   nonredundant  = 8
+   redundant     = 2
+   classes       = None
+   mods          = None
+   num_random    = 2
+   count         = 4096
+   limit         = None
+   chunk_size    = 65536
+   processes     = None
+   seed          = 0
+
+   try:
+      opts, args = getopt.getopt(sys.argv[1:], "hw:e:r:c:M:m:k:l:b:j:s:")
+   except getopt.GetoptError:
+      usage()
+      sys.exit(2)
+
+   for opt, arg in opts:
+      if opt == '-h':
+         usage()
+         sys.exit()
+      elif opt == '-w':
+         word_len = int(arg)
+      elif opt == '-e':
+         nonredundant = int(arg)
+      elif opt == '-r':
+         redundant = int(arg)
+      elif opt == '-c':
+         classes = arg.split(',')
+      elif opt == '-M':
+         mods = [int(x, 16) for x in arg.split(',')]
+      elif opt == '-m':
+         num_random = int(arg)
+      elif opt == '-k':
+         count = int(arg)
+      elif opt == '-l':
+         limit = int(arg)
+      elif opt == '-b':
+         chunk_size = int(arg)
+      elif opt == '-j':
+         processes = int(arg)
+      elif opt == '-s':
+         seed = int(arg)
+
+   if mods is None:
+      mods = moduli(nonredundant, word_len, num_random, seed)
+
+   if classes is None:
+      classes = [c for c in CLASSES
+                 if c != 'all' or limit is not None or
+                    2**(nonredundant*word_len) <= MAX_ALL_INPUTS]
+
+   jobs   = make_jobs(word_len, nonredundant, redundant, mods, classes, count,
+                      limit, chunk_size)
+   inputs = sum(job[6] for job in jobs)
+
+   print("Testing num elements", nonredundant, "+", redundant,
+         "with word len", word_len)
+   print("Checking", inputs, "inputs in", len(jobs), "chunks over",
+         len(mods), "moduli, classes", ','.join(classes))
+
+   results = []
+   start   = time.time()
+   with multiprocessing.Pool(processes) as pool:
+      for r in pool.imap_unordered(run_chunk, jobs):
+         results.append(r)
+         if r['error'] is not None:
+            print("ERROR", hex(r['mod_in']), r['class'], r['error'],
+                  flush=True)
+         for m in r['mismatches']:
+            print("Mismatch modulus", hex(r['mod_in']), "class", r['class'],
+                  "index", m['index'], "input", hex(m['sqr_in']),
+                  "coefficients", m['coeffs'], "output", hex(m['sqr_out']),
+                  "expected", hex(m['expected']),
+                  "v7v6_overflow", int(m['v7v6_overflow']),
+                  "v5v4_overflow", int(m['v5v4_overflow']), flush=True)
+   elapsed = time.time() - start
+
+   print()
+   print(summary_table(results), end='')
+
+   tests_run    = sum(r['inputs'] for r in results)
+   tests_failed = sum(r['failed'] for r in results)
+   errors       = sum(1 for r in results if r['error'] is not None)
+
+   print("%.1f squarings per second" % (tests_run / elapsed))
+   print("Passed", tests_run-tests_failed, "out of", tests_run, "tests")
+
+   result_str = "FAILED" if (tests_failed > 0 or errors > 0) else "PASSED"
+   print(result_str)
+   sys.exit(1 if result_str == "FAILED" else 0)
@@ -0,0 +1,200 @@
+#!/usr/bin/python3
+
+################################################################################
+# Copyright 2019 Supranational LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+################################################################################
+# Parameter sweep for the 9 cycle model
+################################################################################
+# Runs the modular_square_9_cycles.py test loop for every
+# (word_len, nonredundant, redundant, seed) configuration in a process pool.
+# Results are printed as each configuration finishes and a summary table is
+# written at the end.  With -S the multipliers of segments multiplied by
+# themselves use the squaring multiply (primitives.square).
+
+import getopt
+import multiprocessing
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', '..', 'primitives', 'model'))
+
+import modular_square_9_cycles as ms
+
+# Test Parameters
+NUM_SEGMENTS   = 4                    # Fixed
+NUM_REDUNDANTS = [1, 2]               # Number of extra redundant elements
+NONREDUNDANTS  = [8, 16, 32, 64, 128] # number of elements list
+WORD_LENS      = [4, 8, 16]           # bit length of each element
+
+################################################################################
+# Running one configuration
+################################################################################
+
+def run_config(config):
+   (word_len, nonredundant, redundant, seed, num_tests, use_square, lazy,
+    lazy_check) = config
+
+   result = {'word_len'     : word_len,
+             'nonredundant' : nonredundant,
+             'redundant'    : redundant,
+             'seed'         : seed,
+             'tests_run'    : 0,
+             'tests_failed' : 0,
+             'error'        : None,
+             'stat_counts'  : Counter()}
+
+   start = time.time()
+
+   # The scalar test loop for this one configuration.  Its moduli and inputs
+   # come from a generator seeded per configuration, so results do not
+   # depend on scheduling but differ from a modular_square_9_cycles.py run.
+   rng = random.Random('%d:%d:%d:%d' % (word_len, nonredundant, redundant,
+                                        seed))
+
+   try:
+      result['tests_run'], result['tests_failed'] = \
+         ms.run_tests([word_len], [nonredundant], [redundant], num_tests,
+                      NUM_SEGMENTS, use_square, lazy, lazy_check, rng=rng,
+                      verbose=False, stat_counts=result['stat_counts'])
+   except Exception as e:
+      result['error'] = '%s: %s' % (type(e).__name__, e)
+
+   result['elapsed'] = time.time() - start
+
+   return result
+
+def status(result):
+   if result['error'] is not None:
+      return 'ERROR'
+   return 'FAILED' if (result['tests_failed'] > 0) else 'PASSED'
+
+################################################################################
+# Summary
+################################################################################
+
+def summary_table(results):
+   results = sorted(results, key=lambda r: (r['word_len'], r['nonredundant'],
+                                            r['redundant'], r['seed']))
+
+   lines = []
+   lines.append('%8s %12s %9s %6s %7s %7s %8s  %-6s %s' %
+                ('word_len', 'nonredundant', 'redundant', 'seed', 'run',
+                 'failed', 'seconds', 'result', 'stats'))
+   for r in results:
+      detail = r['error'] if r['error'] is not None else \
+               ' '.join('%s=%d' % (k, v) for k, v in
+                        sorted(r['stat_counts'].items()))
+      lines.append('%8d %12d %9d %6d %7d %7d %8.2f  %-6s %s' %
+                   (r['word_len'], r['nonredundant'], r['redundant'],
+                    r['seed'], r['tests_run'], r['tests_failed'],
+                    r['elapsed'], status(r), detail))
+   return '\n'.join(lines) + '\n'
+
+def usage():
+   print('modular_square_sweep.py -i <iterations> -s <num seeds>',
+         '-j <processes> -o <summary file>',
+         '[-w <word lens>] [-n <nonredundants>] [-r <redundants>] [-S]',
+         '[-L] [-C]')
+   print('  lists are comma separated, e.g. -w 4,8,16')
+   print('  -S  square segments with the squaring multiply')
+   print('  -L  lazy accumulator normalization')
+   print('  -C  check lazy normalization against the hardware widths')
+
+if __name__ == "__main__":
+   num_tests     = 10
+   num_seeds     = 1
+   processes     = None
+   summary_file  = 'sweep_summary.txt'
+   word_lens     = WORD_LENS
+   nonredundants = NONREDUNDANTS
+   redundants    = NUM_REDUNDANTS
+   use_square    = False
+   lazy          = False
+   lazy_check    = False
+
+   try:
+      opts, args = getopt.getopt(sys.argv[1:], "hi:s:j:o:w:n:r:SLC")
+   except getopt.GetoptError:
+      usage()
+      sys.exit(2)
+
+   for opt, arg in opts:
+      if opt == '-h':
+         usage()
+         sys.exit()
+      elif opt == '-i':
+         num_tests = int(arg)
+      elif opt == '-s':
+         num_seeds = int(arg)
+      elif opt == '-j':
+         processes = int(arg)
+      elif opt == '-o':
+         summary_file = arg
+      elif opt == '-w':
+         word_lens = [int(x) for x in arg.split(',')]
+      elif opt == '-n':
+         nonredundants = [int(x) for x in arg.split(',')]
+      elif opt == '-r':
+         redundants = [int(x) for x in arg.split(',')]
+      elif opt == '-S':
+         use_square = True
+      elif opt == '-L':
+         lazy = True
+      elif opt == '-C':
+         lazy_check = True
+
+   configs = [(l, k, j, seed, num_tests, use_square, lazy, lazy_check)
+              for l in word_lens
+              for k in nonredundants
+              for j in redundants
+              for seed in range (num_seeds)]
+
+   # Larger configurations first so they are not left running alone at the
+   # end of the sweep
+   configs.sort(key=lambda c: c[0] * c[1], reverse=True)
+
+   print("Running", len(configs), "configurations")
+
+   results = []
+   with multiprocessing.Pool(processes) as pool:
+      for r in pool.imap_unordered(run_config, configs):
+         results.append(r)
+         print("%-6s word len %2d elements %3d + %d seed %d: %d/%d passed" %
+               (status(r), r['word_len'], r['nonredundant'], r['redundant'],
+                r['seed'], r['tests_run']-r['tests_failed'], r['tests_run']),
+               flush=True)
+
+   table = summary_table(results)
+   with open(summary_file, 'w') as f:
+      f.write(table)
+
+   print()
+   print(table, end='')
+
+   tests_run    = sum(r['tests_run'] for r in results)
+   tests_failed = sum(r['tests_failed'] for r in results)
+   errors       = sum(1 for r in results if r['error'] is not None)
+
+   print("Passed", tests_run-tests_failed, "out of", tests_run, "tests")
+
+   result_str = "FAILED" if (tests_failed > 0 or errors > 0) else "PASSED"
+   print(result_str)
+   sys.exit(1 if result_str == "FAILED" else 0)
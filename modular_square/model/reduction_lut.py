@@ -0,0 +1,489 @@
+################################################################################
+# Copyright 2019 Supranational LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+################################################################################
+# Reduction lookup tables
+################################################################################
+# The reduction tables used by the model (generate_reduction_luts) and by the
+# RTL generator (gen_reduction_lut.py).  There is one table per coefficient
+# that gets reduced (TWO_SEGMENTS of them) and each table holds LUT_SIZE V7V6
+# entries followed by LUT_SIZE V5V4 entries.  Every entry is a precomputed
+# reduction value split into NONREDUNDANT_ELEMENTS coefficients.
+#
+# All entries are stored in a single contiguous array.array, indexed as
+#   data[((table * NUM_ENTRIES) + address) * NONREDUNDANT_ELEMENTS + coeff]
+#
+# Tables are cached on disk keyed by the modulus and geometry so repeated
+# runs load them instead of recomputing.  The cache directory is taken from
+# VDF_LUT_CACHE (default ~/.cache/vdf-fpga/lut), set it empty to disable.
+# Cache files use the packed binary format below and are memory mapped
+# rather than read.
+#
+# Packed binary format, all integers little endian:
+#   magic         8 bytes  b'VDFLUT01'
+#   word_len      uint32
+#   redundant     uint32
+#   nonredundant  uint32
+#   num_segments  uint32
+#   num_tables    uint32
+#   num_entries   uint32   LUT_SIZE*2
+#   entry_bytes   uint32   (WORD_LEN*NONREDUNDANT_ELEMENTS+7)//8
+#   modulus_bytes uint32
+#   data_offset   uint64   start of the entries, BIN_ALIGN byte aligned
+#   modulus       modulus_bytes
+#   entries       num_tables * num_entries * entry_bytes
+#
+# Entries are stored table by table in address order, each as the
+# little endian bytes of the same WORD_LEN*NONREDUNDANT_ELEMENTS bit value
+# written to the .dat files.  For 8, 16 and 32 bit words the entries section
+# is also the coefficient array, so it can be viewed in place (numpy_view).
+# Tables 0 to NUM_URAM-1 come first, so the start of the entries section is
+# the stream of XFERS_PER_URAM * DIN_LEN bits per URAM that the generated
+# reduction_lut module takes on din while we is high, provided uram_wide
+# fills each entry from its least significant bits.
+#
+# rtl_files() produces the reduction_lut_NNN.dat $readmemh files for the RTL,
+# one per table and optionally in parallel, along with reduction_lut.bin.
+# The set is kept in the generated file cache (build_cache.py).
+
+import array
+import hashlib
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+
+import build_cache
+
+EXTRA_ELEMENTS = 2
+FORMAT_VERSION = 2
+
+BIN_MAGIC      = b'VDFLUT01'
+BIN_HEADER_FMT = '<8s8IQ'
+BIN_HEADER_LEN = struct.calcsize(BIN_HEADER_FMT)
+BIN_ALIGN      = 64
+
+def default_cache_dir():
+   return os.environ.get('VDF_LUT_CACHE',
+                         os.path.join(os.path.expanduser('~'), '.cache',
+                                      'vdf-fpga', 'lut'))
+
+# Smallest array type code that holds one coefficient
+def coeff_typecode(word_len):
+   if word_len <= 8:
+      return 'B'
+   elif word_len <= 16:
+      return 'H'
+   return 'I'
+
+class ReductionLUT:
+   def __init__(self, mod_in, redundant_elements, nonredundant_elements,
+                num_segments, word_len, data=None):
+      self.mod_in                = mod_in
+      self.redundant_elements    = redundant_elements
+      self.nonredundant_elements = nonredundant_elements
+      self.num_segments          = num_segments
+      self.word_len              = word_len
+
+      segment_elements           = nonredundant_elements // num_segments
+      self.look_up_width         = word_len // 2
+      self.lut_size              = 2**self.look_up_width
+      self.num_tables            = (segment_elements*2) + \
+                                   redundant_elements + EXTRA_ELEMENTS
+      self.num_entries           = self.lut_size * 2
+      self.shape                 = (self.num_tables, self.num_entries,
+                                    nonredundant_elements)
+      self.entry_bytes           = ((word_len * nonredundant_elements) + 7) // 8
+
+      # data is an array.array or, when memory mapped, a memoryview of the
+      # same type code
+      self.typecode              = coeff_typecode(word_len)
+      if data is None:
+         data = array.array(self.typecode)
+      self.data = data
+
+   # True when the array bytes of an entry are exactly the little endian
+   # bytes of its value
+   def _packed(self):
+      return (self.word_len == self.data.itemsize * 8 and
+              sys.byteorder == 'little')
+
+   def key(self):
+      return cache_key(self.mod_in, self.redundant_elements,
+                       self.nonredundant_elements, self.num_segments,
+                       self.word_len)
+
+   def row(self, table, addr):
+      if not (0 <= table < self.num_tables and 0 <= addr < self.num_entries):
+         raise IndexError('reduction LUT entry (%d, %d) out of range %s' %
+                          (table, addr, (self.num_tables, self.num_entries)))
+      start = ((table * self.num_entries) + addr) * self.nonredundant_elements
+      return self.data[start:start + self.nonredundant_elements]
+
+   # Precomputed reduction value of an entry as an integer
+   def value(self, table, addr):
+      row = self.row(table, addr)
+      if self._packed():
+         return int.from_bytes(row.tobytes(), 'little')
+
+      value = 0
+      for k in range (len(row)-1, -1, -1):
+         value = (value << self.word_len) | row[k]
+      return value
+
+   # redLUT[table][addr][coeff] indexing as used by modular_square
+   def __getitem__(self, table):
+      return _Table(self, table)
+
+   def __len__(self):
+      return self.num_tables
+
+   def tolist(self):
+      return [[list(self.row(i, j)) for j in range (self.num_entries)]
+              for i in range (self.num_tables)]
+
+class _Table:
+   def __init__(self, lut, table):
+      self.lut   = lut
+      self.table = table
+
+   def __getitem__(self, addr):
+      return self.lut.row(self.table, addr)
+
+   def __len__(self):
+      return self.lut.num_entries
+
+################################################################################
+# Computing the tables
+################################################################################
+
+def append_value(lut, value):
+   if lut._packed():
+      lut.data.frombytes(value.to_bytes(lut.nonredundant_elements *
+                                        lut.data.itemsize, 'little'))
+   else:
+      word_mask = (2**lut.word_len) - 1
+      for k in range (lut.nonredundant_elements):
+         lut.data.append(value & word_mask)
+         value = value >> lut.word_len
+
+def compute(mod_in, redundant_elements, nonredundant_elements, num_segments,
+            word_len):
+   lut = ReductionLUT(mod_in, redundant_elements, nonredundant_elements,
+                      num_segments, word_len)
+
+   bases = table_bases(mod_in, lut.num_tables, nonredundant_elements,
+                       num_segments, word_len)
+   for i in range (lut.num_tables):
+      for value in table_values(mod_in, i, nonredundant_elements,
+                                num_segments, word_len, bases[i]):
+         append_value(lut, value)
+
+   return lut
+
+# (V7V6, V5V4) base reduction value of every table.  The V5V4 base of table
+# i is 2^((i + NONREDUNDANT_ELEMENTS) * WORD_LEN) mod M and the V7V6 base is
+# the V5V4 base of table i + offset, so all of them are one run of powers of
+# 2^WORD_LEN, each a single modular multiplication from the one before.
+def table_bases(mod_in, num_tables, nonredundant_elements, num_segments,
+                word_len):
+   offset = (nonredundant_elements // num_segments) * 2
+   step   = pow(2, word_len, mod_in)
+
+   powers = [pow(2, nonredundant_elements * word_len, mod_in)]
+   for k in range (1, num_tables + offset):
+      powers.append((powers[-1] * step) % mod_in)
+
+   return [(powers[i + offset], powers[i]) for i in range (num_tables)]
+
+# Entry values of one table, LUT_SIZE V7V6 entries then LUT_SIZE V5V4 entries.
+# bases is the table's entry from table_bases, computed here if not given.
+def table_values(mod_in, table, nonredundant_elements, num_segments, word_len,
+                 bases=None):
+   lut_size = 2**(word_len // 2)
+
+   if bases is None:
+      # Polynomial degree offset for V7V6
+      offset = (nonredundant_elements // num_segments) * 2
+
+      # Compute base reduction value for the coefficient degree
+      bases  = (pow(2, (table + nonredundant_elements + offset) * word_len,
+                    mod_in),
+                pow(2, (table + nonredundant_elements) * word_len, mod_in))
+
+   t_v7v6, t_v5v4 = bases
+
+   # Each address represents a different value stored in the coefficient.
+   # Entry j is (t * j) % M, built by adding t to the previous entry.
+   for t in (t_v7v6, t_v5v4):
+      cur = 0
+      for j in range (lut_size):
+         yield cur
+         cur += t
+         if cur >= mod_in:
+            cur -= mod_in
+
+################################################################################
+# Disk cache
+################################################################################
+
+def cache_key(mod_in, redundant_elements, nonredundant_elements, num_segments,
+              word_len):
+   desc = 'v%d:%x:%d:%d:%d:%d' % (FORMAT_VERSION, mod_in, redundant_elements,
+                                  nonredundant_elements, num_segments,
+                                  word_len)
+   return hashlib.sha256(desc.encode()).hexdigest()
+
+def _cache_filename(cache_dir, mod_in, redundant_elements,
+                    nonredundant_elements, num_segments, word_len):
+   return os.path.join(cache_dir,
+                       cache_key(mod_in, redundant_elements,
+                                 nonredundant_elements, num_segments,
+                                 word_len) + '.bin')
+
+# Cached LUT, or None if the cache has no readable entry for it
+def lookup(mod_in, redundant_elements, nonredundant_elements, num_segments,
+           word_len, cache_dir=None):
+   if cache_dir is None:
+      cache_dir = default_cache_dir()
+   if not cache_dir:
+      return None
+
+   try:
+      return read_bin(_cache_filename(cache_dir, mod_in, redundant_elements,
+                                      nonredundant_elements, num_segments,
+                                      word_len))
+   except (OSError, ValueError):
+      return None
+
+def store(lut, cache_dir=None):
+   if cache_dir is None:
+      cache_dir = default_cache_dir()
+   if not cache_dir:
+      return
+
+   # Write to a temporary name first so concurrent readers never see a
+   # partial table.  The cache is only an optimization, a table that
+   # cannot be written is still used.
+   filename     = _cache_filename(cache_dir, lut.mod_in,
+                                  lut.redundant_elements,
+                                  lut.nonredundant_elements,
+                                  lut.num_segments, lut.word_len)
+   tmp_filename = '%s.%d.tmp' % (filename, os.getpid())
+   try:
+      os.makedirs(cache_dir, exist_ok=True)
+      with open(tmp_filename, 'wb') as f:
+         f.write(bin_image(lut))
+      os.replace(tmp_filename, filename)
+   except OSError:
+      try:
+         os.remove(tmp_filename)
+      except OSError:
+         pass
+
+def load(mod_in, redundant_elements, nonredundant_elements, num_segments,
+         word_len, cache_dir=None):
+   lut = lookup(mod_in, redundant_elements, nonredundant_elements,
+                num_segments, word_len, cache_dir)
+   if lut is None:
+      lut = compute(mod_in, redundant_elements, nonredundant_elements,
+                    num_segments, word_len)
+      store(lut, cache_dir)
+   return lut
+
+################################################################################
+# Packed binary format
+################################################################################
+
+def bin_image(lut):
+   modulus_bytes = (lut.mod_in.bit_length() + 7) // 8
+   data_offset   = BIN_HEADER_LEN + modulus_bytes
+   data_offset   = ((data_offset + BIN_ALIGN - 1) // BIN_ALIGN) * BIN_ALIGN
+
+   header  = struct.pack(BIN_HEADER_FMT, BIN_MAGIC, lut.word_len,
+                         lut.redundant_elements, lut.nonredundant_elements,
+                         lut.num_segments, lut.num_tables, lut.num_entries,
+                         lut.entry_bytes, modulus_bytes, data_offset)
+   header += lut.mod_in.to_bytes(modulus_bytes, 'little')
+   header += bytes(data_offset - len(header))
+
+   if lut._packed():
+      return header + lut.data.tobytes()
+
+   return header + b''.join([lut.value(i, j).to_bytes(lut.entry_bytes,
+                                                      'little')
+                             for i in range (lut.num_tables)
+                             for j in range (lut.num_entries)])
+
+def write_bin(lut, filename):
+   with open(filename, 'wb') as f:
+      f.write(bin_image(lut))
+
+# Header fields as a dict, checks the magic and the file size
+def _bin_header(buf, filename):
+   if len(buf) < BIN_HEADER_LEN:
+      raise ValueError('%s is not a reduction LUT file' % filename)
+
+   (magic, word_len, redundant, nonredundant, num_segments, num_tables,
+    num_entries, entry_bytes, modulus_bytes, data_offset) = \
+      struct.unpack_from(BIN_HEADER_FMT, buf)
+
+   if magic != BIN_MAGIC:
+      raise ValueError('%s is not a reduction LUT file' % filename)
+   if len(buf) != data_offset + (num_tables * num_entries * entry_bytes):
+      raise ValueError('%s is truncated' % filename)
+
+   mod_in = int.from_bytes(buf[BIN_HEADER_LEN:BIN_HEADER_LEN+modulus_bytes],
+                           'little')
+
+   return {'mod_in'                : mod_in,
+           'word_len'              : word_len,
+           'redundant_elements'    : redundant,
+           'nonredundant_elements' : nonredundant,
+           'num_segments'          : num_segments,
+           'num_tables'            : num_tables,
+           'num_entries'           : num_entries,
+           'entry_bytes'           : entry_bytes,
+           'data_offset'           : data_offset}
+
+def _map(filename):
+   with open(filename, 'rb') as f:
+      return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+# ReductionLUT backed by the mapped file for 8, 16 and 32 bit words, other
+# word lengths are unpacked into an array
+def read_bin(filename):
+   buf    = _map(filename)
+   header = _bin_header(buf, filename)
+
+   lut = ReductionLUT(header['mod_in'], header['redundant_elements'],
+                      header['nonredundant_elements'], header['num_segments'],
+                      header['word_len'])
+   if (lut.num_tables, lut.num_entries, lut.entry_bytes) != \
+      (header['num_tables'], header['num_entries'], header['entry_bytes']):
+      raise ValueError('%s has an inconsistent geometry' % filename)
+
+   entries = memoryview(buf)[header['data_offset']:]
+   if lut._packed():
+      lut.data = entries.cast(lut.typecode)
+      return lut
+
+   for e in range (lut.num_tables * lut.num_entries):
+      append_value(lut, int.from_bytes(entries[e * lut.entry_bytes:
+                                               (e+1) * lut.entry_bytes],
+                                       'little'))
+   return lut
+
+# Read only NumPy view of the coefficients, shape
+# (num_tables, num_entries, NONREDUNDANT_ELEMENTS), without copying
+def numpy_view(filename):
+   import numpy as np
+
+   buf    = _map(filename)
+   header = _bin_header(buf, filename)
+
+   word_len = header['word_len']
+   if word_len not in (8, 16, 32):
+      raise ValueError('%d bit coefficients are not byte aligned, use '
+                       'read_bin' % word_len)
+
+   return np.frombuffer(buf, dtype='<u%d' % (word_len // 8),
+                        offset=header['data_offset']).reshape(
+                           header['num_tables'], header['num_entries'],
+                           header['nonredundant_elements'])
+
+################################################################################
+# $readmemh files for the RTL
+################################################################################
+
+DAT_FILENAME      = 'reduction_lut_{0:03d}.dat'
+BIN_FILENAME      = 'reduction_lut.bin'
+
+# Text of a .dat file holding values, one hex entry of
+# WORD_LEN*NONREDUNDANT_ELEMENTS bits per line
+def dat_text(values, nonredundant_elements, word_len):
+   digits = (word_len * nonredundant_elements) // 4
+   return ''.join(['%0*x\n' % (digits, value) for value in values])
+
+# Text of one .dat file
+def dat_contents(mod_in, table, nonredundant_elements, num_segments,
+                 word_len, bases=None):
+   return dat_text(table_values(mod_in, table, nonredundant_elements,
+                                num_segments, word_len, bases),
+                   nonredundant_elements, word_len)
+
+# Pool worker, computes one table and builds its file in a single buffer.
+# Returns the table's values with the file so they are computed only once.
+def _table_file(job):
+   mod_in, table, nonredundant_elements, num_segments, word_len, bases = job
+   values = list(table_values(mod_in, table, nonredundant_elements,
+                              num_segments, word_len, bases))
+   return (values, dat_text(values, nonredundant_elements,
+                            word_len).encode())
+
+# {filename: bytes} of every .dat file plus reduction_lut.bin, from the
+# generated file cache when available.  On a LUT cache hit the files are
+# formatted from the cached tables, otherwise each table is computed once,
+# in parallel with processes > 1, and the results fill the .dat files,
+# reduction_lut.bin and the LUT cache.
+def rtl_files(mod_in, redundant_elements, nonredundant_elements, num_segments,
+              word_len, processes=1):
+   key   = build_cache.cache_key(__file__,
+                                 {'mod_in'       : mod_in,
+                                  'redundant'    : redundant_elements,
+                                  'nonredundant' : nonredundant_elements,
+                                  'num_segments' : num_segments,
+                                  'word_len'     : word_len})
+   files = build_cache.lookup(key)
+   if files is not None:
+      return files
+
+   files = {}
+   lut   = lookup(mod_in, redundant_elements, nonredundant_elements,
+                  num_segments, word_len)
+   if lut is not None:
+      for i in range (lut.num_tables):
+         files[DAT_FILENAME.format(i)] = \
+            dat_text([lut.value(i, j) for j in range (lut.num_entries)],
+                     nonredundant_elements, word_len).encode()
+   else:
+      lut   = ReductionLUT(mod_in, redundant_elements, nonredundant_elements,
+                           num_segments, word_len)
+      bases = table_bases(mod_in, lut.num_tables, nonredundant_elements,
+                          num_segments, word_len)
+      jobs  = [(mod_in, i, nonredundant_elements, num_segments, word_len,
+                bases[i])
+               for i in range (lut.num_tables)]
+
+      if processes > 1:
+         with multiprocessing.Pool(processes) as pool:
+            tables = pool.map(_table_file, jobs)
+      else:
+         tables = list(map(_table_file, jobs))
+
+      # pool.map keeps the table order the entries are appended in
+      for i, (values, dat) in enumerate(tables):
+         files[DAT_FILENAME.format(i)] = dat
+         for value in values:
+            append_value(lut, value)
+
+      store(lut)
+
+   files[BIN_FILENAME] = bin_image(lut)
+
+   build_cache.store(key, files)
+   return files
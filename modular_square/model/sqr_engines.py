@@ -0,0 +1,138 @@
+################################################################################
+# Copyright 2019 Supranational LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+################################################################################
+# Repeated modular squaring engines
+################################################################################
+# Software references for x^(2^t) mod M, the computation the MSU performs.
+# Every engine takes and returns plain Python integers in the range [0, M).
+#
+#   python     - x = (x * x) % M
+#   barrett    - Barrett reduction with a precomputed reciprocal of M
+#   montgomery - squaring in Montgomery form, no division in the loop.
+#                Requires an odd modulus.
+#   gmpy2      - GMP arithmetic, used when the gmpy2 package is installed
+#
+# get_engine(M, 'auto') picks gmpy2 when available and plain Python otherwise.
+# CPython's own big integer division is implemented in C, so the pure Python
+# Barrett and Montgomery loops are not faster than the plain loop for 1024 bit
+# moduli.  They are kept as independent cross checks of the plain loop and as
+# references for division free hardware reductions.
+
+try:
+   import gmpy2
+except ImportError:
+   gmpy2 = None
+
+class PythonEngine:
+   name = 'python'
+
+   def __init__(self, modulus):
+      self.modulus = modulus
+
+   def square(self, x, t):
+      M = self.modulus
+      x = x % M
+      for _ in range(t):
+         x = (x * x) % M
+      return x
+
+class BarrettEngine:
+   name = 'barrett'
+
+   def __init__(self, modulus):
+      self.modulus = modulus
+      self.k       = modulus.bit_length()
+
+      # mu = floor(4^k / M), the precomputed reciprocal
+      self.mu      = (1 << (2 * self.k)) // modulus
+
+   def square(self, x, t):
+      M, k, mu = self.modulus, self.k, self.mu
+
+      x = x % M
+      for _ in range(t):
+         T = x * x
+         # Estimate of T // M, low by at most 2
+         q = ((T >> (k - 1)) * mu) >> (k + 1)
+         x = T - (q * M)
+         while x >= M:
+            x -= M
+      return x
+
+class MontgomeryEngine:
+   name = 'montgomery'
+
+   def __init__(self, modulus):
+      if modulus % 2 == 0:
+         raise ValueError('Montgomery squaring requires an odd modulus')
+
+      self.modulus = modulus
+
+      # R = 2^k > 4M lets intermediate values stay in [0, 2M) without a
+      # conditional subtraction per step
+      self.k       = modulus.bit_length() + 2
+      self.mask    = (1 << self.k) - 1
+      self.m_prime = (-pow(modulus, -1, 1 << self.k)) & self.mask
+
+   def to_mont(self, x):
+      return (x << self.k) % self.modulus
+
+   def from_mont(self, x):
+      M = self.modulus
+      x = (x + (((x & self.mask) * self.m_prime) & self.mask) * M) >> self.k
+      return x - M if x >= M else x
+
+   def square(self, x, t):
+      M, k, mask, m_prime = self.modulus, self.k, self.mask, self.m_prime
+
+      x = self.to_mont(x)
+      for _ in range(t):
+         T = x * x
+         x = (T + (((T & mask) * m_prime) & mask) * M) >> k
+      return self.from_mont(x)
+
+class Gmpy2Engine:
+   name = 'gmpy2'
+
+   # Squarings per powmod call, bounds the size of the 2^n exponent
+   CHUNK = 4096
+
+   def __init__(self, modulus):
+      if gmpy2 is None:
+         raise ImportError('gmpy2 is not installed')
+      self.modulus = gmpy2.mpz(modulus)
+
+   def square(self, x, t):
+      x = gmpy2.mpz(x)
+      while t > 0:
+         n  = min(t, self.CHUNK)
+         x  = gmpy2.powmod(x, gmpy2.mpz(1) << n, self.modulus)
+         t -= n
+      return int(x % self.modulus)
+
+ENGINES = {'python'     : PythonEngine,
+           'barrett'    : BarrettEngine,
+           'montgomery' : MontgomeryEngine,
+           'gmpy2'      : Gmpy2Engine}
+
+def get_engine(modulus, name='auto'):
+   if name == 'auto':
+      name = 'gmpy2' if gmpy2 is not None else 'python'
+   if name not in ENGINES:
+      raise ValueError('unknown engine %s, expected one of %s' %
+                       (name, ', '.join(['auto'] + list(ENGINES))))
+   return ENGINES[name](modulus)
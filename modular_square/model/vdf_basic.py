@@ -1,12 +1,70 @@
 #!/usr/bin/python3
 
+import getopt
+import os
+import sys
 from random import getrandbits
 
+import sqr_engines
+import vdf_index
+import vdf_proof
+
 # Competition is for 1024 bits
 NUM_BITS       = 1024
 
 NUM_ITERATIONS = 1000
 
+# Squaring engine, see sqr_engines.py
+ENGINE         = 'python'
+
+# Number of iterations to cross check against the naive loop
+VERIFY         = 0
+
+# Long runs record intermediate values every INTERVAL iterations in an
+# index file (see vdf_index.py) and resume from it when restarted
+INDEX_FILE     = None
+INTERVAL       = 1 << 20
+
+# Iteration to look up in the index file instead of running
+LOOKUP         = None
+
+# Wesolowski proof written alongside the squaring (see vdf_proof.py), built
+# in PROOF_WORKERS worker processes
+PROOF_FILE     = None
+PROOF_WORKERS  = 1
+
+def usage():
+   print('vdf_basic.py [-t <iterations>]',
+         '[-e <%s>]' % '|'.join(['auto'] + list(sqr_engines.ENGINES)),
+         '[-v <iterations to verify>]',
+         '[-i <index file> [-p <record interval>] [-k <lookup iteration>]]',
+         '[-w <proof file>]')
+
+try:
+   opts, args = getopt.getopt(sys.argv[1:], "ht:e:v:i:p:k:w:")
+except getopt.GetoptError:
+   usage()
+   sys.exit(2)
+
+for opt, arg in opts:
+   if opt == '-h':
+      usage()
+      sys.exit()
+   elif opt == '-t':
+      NUM_ITERATIONS = int(arg)
+   elif opt == '-e':
+      ENGINE = arg
+   elif opt == '-v':
+      VERIFY = int(arg)
+   elif opt == '-i':
+      INDEX_FILE = arg
+   elif opt == '-p':
+      INTERVAL = int(arg)
+   elif opt == '-k':
+      LOOKUP = int(arg)
+   elif opt == '-w':
+      PROOF_FILE = arg
+
 # Rather than being random each time, we will provide randomly generated values
 x = getrandbits(NUM_BITS)
 N = 124066695684124741398798927404814432744698427125735684128131855064976895337309138910015071214657674309443149407457493434579063840841220334555160125016331040933690674569571217337630239191517205721310197608387239846364360850220896772964978569683229449266819903414117058030106528073928633017118689826625594484331
@@ -15,10 +73,48 @@ N = 1240666956841247413987989274048144327446984271257356841281318550649768953373
 # For the final FPGA runs, t will be 2^30
 t = NUM_ITERATIONS
 
-# Iterative modular squaring t times
-# This is the function that needs to be optimized on FPGA
-for _ in range(t):
-   x = (x * x) % N
+engine = sqr_engines.get_engine(N, ENGINE)
+
+# Check the selected engine against the naive loop over the first
+# VERIFY iterations
+if VERIFY > 0:
+   v = min(VERIFY, t)
+   expected = x
+   for _ in range(v):
+      expected = (expected * expected) % N
+   if engine.square(x, v) != expected:
+      print("Engine", engine.name, "does not match the naive loop after",
+            v, "iterations")
+      sys.exit(1)
+
+def progress(t_done, x_done):
+   print("%d / %d iterations" % (t_done, t), file=sys.stderr)
+
+if PROOF_FILE is not None:
+   # Same squaring, proven segment by segment as it goes
+   prover   = vdf_proof.Prover(N, x, workers=PROOF_WORKERS,
+                               engine_name=engine.name)
+   x        = prover.run(t, engine)
+   vdf_proof.save_proof(PROOF_FILE, N, prover.x, prover.finish())
+elif INDEX_FILE is None:
+   # Iterative modular squaring t times
+   # This is the function that needs to be optimized on FPGA
+   x = engine.square(x, t)
+else:
+   if os.path.exists(INDEX_FILE):
+      index = vdf_index.VDFIndex(INDEX_FILE)
+      if index.modulus != N:
+         print("Index file", INDEX_FILE, "is for a different modulus")
+         sys.exit(1)
+      print("Resuming from iteration", index.last()[0], file=sys.stderr)
+   else:
+      index = vdf_index.VDFIndex.create(INDEX_FILE, N, x, INTERVAL)
+
+   if LOOKUP is not None:
+      x = index.lookup(LOOKUP, engine)
+   else:
+      x = index.run(t, engine, progress)
+   index.close()
 
 # Final result is a 1024b value
 h = x
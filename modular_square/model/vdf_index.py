@@ -0,0 +1,111 @@
+################################################################################
+# Copyright 2019 Supranational LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+################################################################################
+# Intermediate value index for long squaring runs
+################################################################################
+# Records x^(2^t) mod N every INTERVAL iterations in a compact binary file so
+# a long run can be resumed after an interruption and the value at any
+# iteration k can be recovered by replaying from the nearest record.
+#
+# File layout, all integers little endian:
+#   header  magic       8 bytes  b'VDFIDX01'
+#           value_bytes uint32   bytes per stored value
+#           reserved    uint32
+#           interval    uint64   iterations between records
+#           modulus     value_bytes
+#   record  iteration   uint64   always record_number * interval
+#           value       value_bytes
+#
+# Record 0 is the starting value at iteration 0.  A record cut short by an
+# interruption is dropped when the file is reopened.
+
+import os
+import struct
+
+MAGIC       = b'VDFIDX01'
+HEADER_FMT  = '<8sIIQ'
+HEADER_LEN  = struct.calcsize(HEADER_FMT)
+
+class VDFIndex:
+   def __init__(self, filename):
+      self.filename = filename
+      self.f        = open(filename, 'r+b')
+
+      magic, self.value_bytes, _, self.interval = \
+         struct.unpack(HEADER_FMT, self.f.read(HEADER_LEN))
+      if magic != MAGIC:
+         raise ValueError('%s is not a VDF index file' % filename)
+
+      self.modulus     = int.from_bytes(self.f.read(self.value_bytes),
+                                        'little')
+      self.data_start  = HEADER_LEN + self.value_bytes
+      self.record_len  = 8 + self.value_bytes
+
+      # Drop any partially written record
+      size             = self.f.seek(0, os.SEEK_END)
+      self.num_records = (size - self.data_start) // self.record_len
+      self.f.truncate(self.data_start + (self.num_records * self.record_len))
+
+   @classmethod
+   def create(cls, filename, modulus, x, interval):
+      value_bytes = (modulus.bit_length() + 7) // 8
+      with open(filename, 'wb') as f:
+         f.write(struct.pack(HEADER_FMT, MAGIC, value_bytes, 0, interval))
+         f.write(modulus.to_bytes(value_bytes, 'little'))
+      index = cls(filename)
+      index.append(0, x % modulus)
+      return index
+
+   def close(self):
+      self.f.close()
+
+   def append(self, t, x):
+      if t != self.num_records * self.interval:
+         raise ValueError('iteration %d is not the next record, expected %d' %
+                          (t, self.num_records * self.interval))
+      self.f.seek(self.data_start + (self.num_records * self.record_len))
+      self.f.write(struct.pack('<Q', t) + x.to_bytes(self.value_bytes,
+                                                     'little'))
+      self.f.flush()
+      self.num_records += 1
+
+   def record(self, n):
+      self.f.seek(self.data_start + (n * self.record_len))
+      buf = self.f.read(self.record_len)
+      t,  = struct.unpack('<Q', buf[0:8])
+      return (t, int.from_bytes(buf[8:], 'little'))
+
+   def last(self):
+      return self.record(self.num_records - 1)
+
+   # Value at iteration k, replaying from the nearest record at or below k
+   def lookup(self, k, engine):
+      n    = min(k // self.interval, self.num_records - 1)
+      t, x = self.record(n)
+      return engine.square(x, k - t)
+
+   # Extend the run to t_final, adding a record every interval.  Calls
+   # progress(t, x) after each record if given.
+   def run(self, t_final, engine, progress=None):
+      t, x = self.last()
+      while t + self.interval <= t_final:
+         x  = engine.square(x, self.interval)
+         t += self.interval
+         self.append(t, x)
+         if progress is not None:
+            progress(t, x)
+      return self.lookup(t_final, engine)
@@ -0,0 +1,482 @@
+#!/usr/bin/python3
+
+################################################################################
+# Copyright 2019 Supranational LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+################################################################################
+# Streaming Wesolowski proofs
+################################################################################
+# Proves y = x^(2^T) mod N while the squaring chain is being computed.
+#
+# A Wesolowski proof for (x, y, T) is pi = x^floor(2^T / l) with l a 128 bit
+# prime hashed from (N, x, y, T).  It is checked with
+#
+#   pi^l * x^(2^T mod l) == y  (mod N)
+#
+# which takes two short exponentiations.  l is only known once y is, so
+# instead of one proof over all T squarings the chain is cut into segments
+# of about SEGMENT_LEN squarings, each proven on its own from the previous
+# segment's output.  A segment's proof is built in a worker process as soon
+# as the chain reaches its end, while the squaring continues, so once the
+# chain is done only the last segment's proof is left to finish.
+#
+# Within a segment the chain is kept every k squarings (checkpoints
+# C_i = x^(2^(k*i))).  floor(2^T / l) in base 2^k has digits b_i, so
+#
+#   pi = prod_i C_i^b_i
+#
+# The checkpoints are multiplied into 2^k buckets by digit and the buckets
+# are combined with a two level window, about T/k + 2^(k+1) multiplications
+# in all rather than T squarings.  Memory is T/k checkpoints plus 2^k
+# buckets per segment in flight.
+#
+# The chain is fed as (t, x^(2^t)) pairs, from squaring here (Prover.run,
+# with any sqr_engines engine) or from the MSU host output (main.cpp -t
+# <intermediate iters>).  Where the given values are further apart than k
+# the checkpoints between them are filled in by squaring, which also checks
+# each given value against the one before it.
+#
+#   vdf_proof.py -t 1000000 -o proof.txt
+#   ./Vtb -t 4096 ... | vdf_proof.py -m - -x 2 -o proof.txt
+#   vdf_proof.py -v proof.txt -t 1000000
+
+import concurrent.futures
+import getopt
+import hashlib
+import re
+import sys
+import time
+
+import sqr_engines
+
+# Squarings per proven segment
+SEGMENT_LEN    = 1 << 20
+
+CHALLENGE_BITS = 128
+
+# First primes, the Miller-Rabin bases without gmpy2
+SMALL_PRIMES   = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53,
+                  59, 61, 67, 71]
+
+# MSU host output, as in check_intermediates.py
+MODULUS_RE      = re.compile(r'^Modulus is (\d+)')
+INTERMEDIATE_RE = re.compile(r'^(\d+) [\d.]+ ns/sq: (\d+)')
+
+################################################################################
+# Challenge
+################################################################################
+
+def is_prime(n):
+   if sqr_engines.gmpy2 is not None:
+      return bool(sqr_engines.gmpy2.is_prime(n, 25))
+
+   for p in SMALL_PRIMES:
+      if n % p == 0:
+         return n == p
+
+   d = n - 1
+   s = 0
+   while d % 2 == 0:
+      d //= 2
+      s  += 1
+
+   for a in SMALL_PRIMES:
+      x = pow(a, d, n)
+      if x == 1 or x == n - 1:
+         continue
+      for r in range (s - 1):
+         x = (x * x) % n
+         if x == n - 1:
+            break
+      else:
+         return False
+   return True
+
+# Prime l from the hash of (N, x, y, T)
+def challenge(N, x, y, T, bits=CHALLENGE_BITS):
+   value_bytes = (N.bit_length() + 7) // 8
+   seed        = b''.join([N.to_bytes(value_bytes, 'little'),
+                           x.to_bytes(value_bytes, 'little'),
+                           y.to_bytes(value_bytes, 'little'),
+                           T.to_bytes(8, 'little')])
+   counter = 0
+   while True:
+      h = hashlib.sha256(seed + counter.to_bytes(8, 'little')).digest()
+      l = int.from_bytes(h[:bits // 8], 'little') | (1 << (bits - 1)) | 1
+      if is_prime(l):
+         return l
+      counter += 1
+
+################################################################################
+# Proving
+################################################################################
+
+# Window width for a segment of T squarings, balancing T/k bucket
+# multiplications against the 2^k buckets
+def window_len(T):
+   return max(1, T.bit_length() // 2)
+
+# x^floor(2^T / l) from the checkpoints C_i = x^(2^(k*i)), i = 0..T//k
+def proof_from_checkpoints(N, checkpoints, T, k, l):
+   buckets = [1] * (1 << k)
+
+   # Digit i of floor(2^T / l) is floor(2^k * (2^(T - k*(i+1)) mod l) / l)
+   # while k*(i+1) <= T, the top digit is floor(2^(T - k*i) / l)
+   top = T // k
+   if T - (k * top) > 0:
+      b = (1 << (T - (k * top))) // l
+      buckets[b] = (buckets[b] * checkpoints[top]) % N
+   # 2^(T - k*(i+1)) mod l, starting from i = top-1
+   r     = pow(2, T - (k * top), l)
+   two_k = pow(2, k, l)
+   for i in range (top - 1, -1, -1):
+      b = (r << k) // l
+      if b:
+         buckets[b] = (buckets[b] * checkpoints[i]) % N
+      r = (r * two_k) % l
+
+   # prod_b buckets[b]^b with b = (b1 << k0) | b0
+   k1 = k // 2
+   k0 = k - k1
+   pi = 1
+   for b1 in range (1, 1 << k1):
+      z = 1
+      for b0 in range (1 << k0):
+         z = (z * buckets[(b1 << k0) | b0]) % N
+      pi = (pi * pow(z, b1 << k0, N)) % N
+   for b0 in range (1, 1 << k0):
+      z = 1
+      for b1 in range (1 << k1):
+         z = (z * buckets[(b1 << k0) | b0]) % N
+      pi = (pi * pow(z, b0, N)) % N
+   return pi
+
+# Pool worker, proves one segment.  points holds the fed values as
+# {t: x^(2^t)} relative to the segment start x at iteration t0, ending at T.
+# Checkpoints missing between them are filled in by squaring, and a fed
+# value reached that way must match.  Returns (T, y, pi, error).
+def prove_segment(job):
+   N, t0, x, points, T, k, engine_name = job
+   engine = sqr_engines.get_engine(N, engine_name)
+
+   targets     = sorted(set(list(range (0, T+1, k)) + list(points)))
+   checkpoints = []
+   cur_t       = 0
+   cur         = x
+   computed    = False
+   last_point  = 0
+   for t in targets:
+      if t in points:
+         if computed:
+            value = engine.square(cur, t - cur_t)
+            if value != points[t]:
+               return (T, points[T], None,
+                       'value at %d does not follow from %d' %
+                       (t0 + t, t0 + last_point))
+         value      = points[t]
+         computed   = False
+         last_point = t
+      elif t > 0:
+         value    = engine.square(cur, t - cur_t)
+         computed = True
+      else:
+         value    = x
+      if t % k == 0:
+         checkpoints.append(value)
+      cur_t = t
+      cur   = value
+
+   y = points[T]
+   l = challenge(N, x, y, T)
+   return (T, y, proof_from_checkpoints(N, checkpoints, T, k, l), None)
+
+class Prover:
+   def __init__(self, modulus, x, segment_len=SEGMENT_LEN, k=None,
+                workers=0, engine_name='auto'):
+      self.modulus     = modulus
+      self.x           = x % modulus
+      self.segment_len = segment_len
+      self.k           = window_len(segment_len) if k is None else k
+      self.engine_name = engine_name
+
+      self.executor    = None
+      if workers > 0:
+         self.executor = concurrent.futures.ProcessPoolExecutor(workers)
+
+      # Current segment
+      self.t0          = 0
+      self.x0          = self.x
+      self.points      = {}
+
+      self.t           = 0
+      self.y           = self.x
+      self.segments    = []   # futures or results, in chain order
+
+   # Adds y = x^(2^t), t past the last value fed
+   def feed(self, t, y):
+      if t <= self.t:
+         raise ValueError('iteration %d is not after %d' % (t, self.t))
+      self.t = t
+      self.y = y
+      self.points[t - self.t0] = y
+      if t - self.t0 >= self.segment_len:
+         self.close_segment()
+
+   def close_segment(self):
+      job = (self.modulus, self.t0, self.x0, self.points, self.t - self.t0,
+             self.k, self.engine_name)
+      if self.executor is not None:
+         self.segments.append(self.executor.submit(prove_segment, job))
+      else:
+         self.segments.append(prove_segment(job))
+      self.t0     = self.t
+      self.x0     = self.y
+      self.points = {}
+
+   # Squares from the last value fed up to t_final with engine, feeding
+   # every checkpoint.  Returns x^(2^t_final).
+   def run(self, t_final, engine):
+      while self.t < t_final:
+         n = min(self.k - ((self.t - self.t0) % self.k), t_final - self.t)
+         self.feed(self.t + n, engine.square(self.y, n))
+      return self.y
+
+   # Waits for every segment, returns [(T, y, pi)] in chain order
+   def finish(self):
+      if self.t > self.t0:
+         self.close_segment()
+
+      try:
+         segments = []
+         for s in self.segments:
+            T, y, pi, error = s.result() if self.executor is not None else s
+            if error is not None:
+               raise ValueError(error)
+            segments.append((T, y, pi))
+      finally:
+         if self.executor is not None:
+            self.executor.shutdown()
+      return segments
+
+################################################################################
+# Verification
+################################################################################
+
+def verify_segment(N, x, y, T, pi):
+   if not (0 < pi < N and 0 <= y < N):
+      return False
+   l = challenge(N, x, y, T)
+   r = pow(2, T, l)
+   return (pow(pi, l, N) * pow(x, r, N)) % N == y
+
+# Checks that the segments chain from x through exactly T squarings in
+# all, each segment at least one.  Returns (ok, y, error) with y the end of
+# the last segment that verified.
+def verify(N, x, T, segments):
+   t = 0
+   y = x % N
+   for T_seg, y_next, pi in segments:
+      if T_seg <= 0:
+         return False, y, 'segment at %d has %d squarings' % (t, T_seg)
+      if not verify_segment(N, y, y_next, T_seg, pi):
+         return False, y, 'segment at %d does not verify' % t
+      t += T_seg
+      y  = y_next
+   if t != T:
+      return False, y, 'segments cover %d squarings, expected %d' % (t, T)
+   return True, y, None
+
+################################################################################
+# Proof file
+################################################################################
+# Text, all values hex:
+#   modulus <N>
+#   x <x>
+#   <T> <y> <pi>      one line per segment
+
+def save_proof(filename, N, x, segments):
+   with open(filename, 'w') as f:
+      f.write('modulus %x\n' % N)
+      f.write('x %x\n' % x)
+      for T, y, pi in segments:
+         f.write('%d %x %x\n' % (T, y, pi))
+
+def load_proof(filename):
+   with open(filename) as f:
+      N = int(f.readline().split()[1], 16)
+      x = int(f.readline().split()[1], 16)
+      segments = []
+      for line in f:
+         fields = line.split()
+         if fields:
+            segments.append((int(fields[0]), int(fields[1], 16),
+                             int(fields[2], 16)))
+   return N, x, segments
+
+################################################################################
+# Command line
+################################################################################
+
+def read_lines(filename):
+   f = sys.stdin if filename == '-' else open(filename)
+   for line in f:
+      yield line
+
+def usage():
+   print('vdf_proof.py [-t <iterations>] [-x <start hex>] [-M <modulus>]',
+         '[-s <segment len>] [-k <window>] [-j <workers>] [-e <engine>]',
+         '[-m <msu output>] [-o <proof file>]')
+   print('vdf_proof.py -v <proof file> [-t <iterations>] [-x <start hex>]',
+         '[-M <modulus>]')
+   print('  -v  verify a proof of the given iterations, start and modulus')
+   print('  -m  prove the intermediate values from the MSU host output,',
+         '- for stdin')
+
+if __name__ == "__main__":
+   N           = 124066695684124741398798927404814432744698427125735684128131855064976895337309138910015071214657674309443149407457493434579063840841220334555160125016331040933690674569571217337630239191517205721310197608387239846364360850220896772964978569683229449266819903414117058030106528073928633017118689826625594484331
+   t_final     = 100000
+   x           = None
+   segment_len = SEGMENT_LEN
+   k           = None
+   workers     = 1
+   engine_name = 'auto'
+   msu_file    = None
+   proof_file  = None
+   verify_file = None
+
+   try:
+      opts, args = getopt.getopt(sys.argv[1:], "ht:x:M:s:k:j:e:m:o:v:")
+   except getopt.GetoptError:
+      usage()
+      sys.exit(2)
+
+   for opt, arg in opts:
+      if opt == '-h':
+         usage()
+         sys.exit()
+      elif opt == '-t':
+         t_final = int(arg)
+      elif opt == '-x':
+         x = int(arg, 16)
+      elif opt == '-M':
+         N = int(arg)
+      elif opt == '-s':
+         segment_len = int(arg)
+      elif opt == '-k':
+         k = int(arg)
+      elif opt == '-j':
+         workers = int(arg)
+      elif opt == '-e':
+         engine_name = arg
+      elif opt == '-m':
+         msu_file = arg
+      elif opt == '-o':
+         proof_file = arg
+      elif opt == '-v':
+         verify_file = arg
+
+   if verify_file is not None:
+      if x is None:
+         x = 2
+      file_N, file_x, segments = load_proof(verify_file)
+      if file_N != N or file_x != x % N:
+         print("Proof is for a different", "modulus" if file_N != N else "x")
+         print("FAILED")
+         sys.exit(1)
+
+      start        = time.time()
+      ok, y, error = verify(N, x, t_final, segments)
+      print("Verified", len(segments), "segments in",
+            "%.3f seconds" % (time.time() - start))
+      if error is not None:
+         print(error)
+      print(y)
+      print("PASSED" if ok else "FAILED")
+      sys.exit(0 if ok else 1)
+
+   start = time.time()
+   if msu_file is None:
+      if x is None:
+         x = 2
+      engine = sqr_engines.get_engine(N, engine_name)
+      prover = Prover(N, x, segment_len, k, workers, engine.name)
+      y      = prover.run(t_final, engine)
+   else:
+      prover = None
+      # The host restarts the iteration count for every test (main.cpp -i)
+      # while the chain continues from the last sq_out, so a count going
+      # backwards adds the previous test's final iteration as an offset
+      offset = 0
+      prev_t = 0
+      for line in read_lines(msu_file):
+         m = MODULUS_RE.match(line)
+         if m:
+            N = int(m.group(1))
+            continue
+         m = INTERMEDIATE_RE.match(line)
+         if not m:
+            continue
+         t, value = int(m.group(1)), int(m.group(2))
+         if t <= prev_t:
+            offset += prev_t
+         prev_t = t
+         t     += offset
+         if prover is None:
+            if x is None:
+               # The first value reported is the start of the chain
+               prover = Prover(N, value, segment_len, k, workers, engine_name)
+               base_t = t
+               continue
+            prover = Prover(N, x, segment_len, k, workers, engine_name)
+            base_t = 0
+         try:
+            prover.feed(t - base_t, value)
+         except ValueError as e:
+            print("Chain", e)
+            print("FAILED")
+            sys.exit(1)
+      if prover is None:
+         print("No intermediate values in", msu_file)
+         sys.exit(1)
+      x = prover.x
+      y = prover.y
+   evaluated = time.time()
+
+   try:
+      segments = prover.finish()
+   except ValueError as e:
+      print("Chain", e)
+      print("FAILED")
+      sys.exit(1)
+   proven   = time.time()
+
+   ok, h, error = verify(N, x, prover.t, segments)
+   verified     = time.time()
+
+   if proof_file is not None:
+      save_proof(proof_file, N, x, segments)
+
+   print("Squarings", "%.3f seconds," % (evaluated - start),
+         "proof finished", "%.3f seconds later," % (proven - evaluated),
+         len(segments), "segments verified in",
+         "%.3f seconds" % (verified - proven))
+   if error is not None:
+      print(error)
+   print(h)
+
+   ok = ok and h == y
+   print("PASSED" if ok else "FAILED")
+   sys.exit(0 if ok else 1)
@@ -16,9 +16,17 @@
 # limitations under the License.
 ################################################################################
 
+import io
+import os
 import sys
 import getopt
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', 'model'))
+
+import build_cache
+import reduction_lut
+
 ################################################################################
 # Parameters to set
 ################################################################################
@@ -29,95 +37,69 @@ WORD_LEN              = 16
 EXTRA_ELEMENTS        = 2
 NUM_URAM              = 0
 
+# Processes used to generate the .dat files, and whether to rewrite files
+# that are already up to date
+PROCESSES             = 1
+FORCE                 = False
+
 # TODO - we probably don't need these hardcoded values anymore
 if (NONREDUNDANT_ELEMENTS == 128):
    M = 6314466083072888893799357126131292332363298818330841375588990772701957128924885547308446055753206513618346628848948088663500368480396588171361987660521897267810162280557475393838308261759713218926668611776954526391570120690939973680089721274464666423319187806830552067951253070082020241246233982410737753705127344494169501180975241890667963858754856319805507273709904397119733614666701543905360152543373982524579313575317653646331989064651402133985265800341991903982192844710212464887459388853582070318084289023209710907032396934919962778995323320184064522476463966355937367009369212758092086293198727008292431243681
 else:
    M = 302934307671667531413257853548643485645
 
-try:
-   opts, args = getopt.getopt(sys.argv[1:],"hM:r:n:w:",           \
-                              ["modulus=","redundant=",           \
-                               "nonredundant=", "wordlen=", "urams="])
-except getopt.GetoptError:
-   print ('gen_reduction_lut.py -M <modulus> -r <num redundant>', \
-         '-nr <num nonredundant> -wl <word length> -u <num_uram>')
-   sys.exit(2)
-
-for opt, arg in opts:
-   if opt == '-h':
-      print ('gen_reduction_lut.py -M <modulus> -r <num redundant>', \
-            '-nr <num nonredundant> -wl <word length> -u <num_uram>')
-      sys.exit()
-   elif opt in ("-M", "--modulus"):
-      M = int(arg)
-   elif opt in ("-r", "--redundant"):
-      REDUNDANT_ELEMENTS = int(arg)
-   elif opt in ("-n", "--nonredundant"):
-      NONREDUNDANT_ELEMENTS = int(arg)
-   elif opt in ("-w", "--wordlen"):
-      WORD_LEN = int(arg)
-   elif opt in ("-u", "--urams"):
-      NUM_URAM = int(arg)
-
-print ()
-print ('Parameter Values')
-print ('---------------------')
-print ('REDUNDANT_ELEMENTS   ', REDUNDANT_ELEMENTS)
-print ('NONREDUNDANT_ELEMENTS', NONREDUNDANT_ELEMENTS)
-print ('WORD_LEN             ', WORD_LEN)
-print ('NUM_SEGMENTS         ', NUM_SEGMENTS)
-print ('EXTRA_ELEMENTS       ', EXTRA_ELEMENTS)
-print ('M                    ', hex(M))
-print ()
-
 ################################################################################
 # Calculated parameters
 ################################################################################
-SEGMENT_ELEMENTS      = (NONREDUNDANT_ELEMENTS // NUM_SEGMENTS)
-LUT_NUM_ELEMENTS      = REDUNDANT_ELEMENTS + (SEGMENT_ELEMENTS*2) + \
-                        EXTRA_ELEMENTS
-LOOK_UP_WIDTH         = WORD_LEN // 2
-LUT_SIZE              = 2**LOOK_UP_WIDTH
-LUT_WIDTH             = WORD_LEN * NONREDUNDANT_ELEMENTS;
-
-# Sanitize URAM and BRAM counts
-if NUM_URAM > LUT_NUM_ELEMENTS - 1:
-   NUM_URAM           = LUT_NUM_ELEMENTS - 1
-NUM_BRAM              = LUT_NUM_ELEMENTS - NUM_URAM
+
+def lut_num_elements(redundant_elements, nonredundant_elements,
+                     num_segments=NUM_SEGMENTS):
+   SEGMENT_ELEMENTS = (nonredundant_elements // num_segments)
+   return redundant_elements + (SEGMENT_ELEMENTS*2) + EXTRA_ELEMENTS
+
+# Sanitize URAM and BRAM counts, returns (NUM_URAM, NUM_BRAM)
+def memory_counts(num_uram, lut_num_elements):
+   if num_uram > lut_num_elements - 1:
+      num_uram = lut_num_elements - 1
+   return num_uram, lut_num_elements - num_uram
 
 ################################################################################
 # Compute the reduction tables
 ################################################################################
-
-print ('Creating', LUT_NUM_ELEMENTS, 'files')
-print ('reduction_lut_{0:03d}.dat'.format(0))
-print ('         ...          ')
-print ('reduction_lut_{0:03d}.dat'.format(LUT_NUM_ELEMENTS-1))
-
-for i in range (LUT_NUM_ELEMENTS):
-   Filename = list('reduction_lut_{0:03d}.dat'.format(i))
-   f = open(''.join(Filename), 'w')
-
-   # Polynomial degree offset for V7V6
-   offset = (SEGMENT_ELEMENTS*2)
-
-   # Compute base reduction value for the coefficient degree
-   t_v7v6 = (2**((i + NONREDUNDANT_ELEMENTS + offset) * WORD_LEN)) % M
-   t_v5v4 = (2**((i + NONREDUNDANT_ELEMENTS) * WORD_LEN)) % M
-
-   # Each address represents a different value stored in the coefficient
-   for j in range (LUT_SIZE):
-      cur_v7v6 = (t_v7v6 * j) % M
-      f.write(hex(cur_v7v6)[2:].zfill(LUT_WIDTH // 4))
-      f.write('\n')
-
-   for j in range (LUT_SIZE):
-      cur_v5v4 = (t_v5v4 * j) % M
-      f.write(hex(cur_v5v4)[2:].zfill(LUT_WIDTH // 4))
-      f.write('\n')
-
-   f.close()
+# Same tables the model uses.  Each address represents a different value
+# stored in the coefficient, the first LUT_SIZE entries reduce V7V6 and the
+# next LUT_SIZE reduce V5V4.
+
+def generate_luts(M, redundant_elements=REDUNDANT_ELEMENTS,
+                  nonredundant_elements=NONREDUNDANT_ELEMENTS,
+                  num_segments=NUM_SEGMENTS, word_len=WORD_LEN):
+   return reduction_lut.load(M, redundant_elements, nonredundant_elements,
+                             num_segments, word_len)
+
+# {filename: bytes} of every output: the .dat file per table, reduction_lut.bin
+# holding all tables in the packed binary format for memory mapping from
+# Python and for loading the URAMs from the host, and reduction_lut.sv.
+# Tables for a modulus and geometry seen before come from the generated file
+# cache.
+def generate(M, redundant_elements=REDUNDANT_ELEMENTS,
+             nonredundant_elements=NONREDUNDANT_ELEMENTS,
+             num_segments=NUM_SEGMENTS, word_len=WORD_LEN,
+             num_uram=NUM_URAM, processes=PROCESSES):
+   files = reduction_lut.rtl_files(M, redundant_elements,
+                                   nonredundant_elements, num_segments,
+                                   word_len, processes=processes)
+
+   num_uram, num_bram = memory_counts(num_uram,
+                                      lut_num_elements(redundant_elements,
+                                                       nonredundant_elements,
+                                                       num_segments))
+   files['reduction_lut.sv'] = reduction_lut_sv(num_uram, num_bram).encode()
+   return files
+
+# Files whose content has not changed are left untouched so their mtimes do
+# not trigger a Verilator rebuild.  Returns the written and unchanged names.
+def write(files, directory='.', force=FORCE):
+   return build_cache.write_files(files, directory, force)
 
 ################################################################################
 # Generate RTL to read in files
@@ -125,10 +107,11 @@ for i in range (LUT_NUM_ELEMENTS):
 # This should not really be necessary 
 # Required since parameterizing RTL to read in data was failing synthesis
 
-f = open('reduction_lut.sv', 'w')
+def reduction_lut_sv(NUM_URAM, NUM_BRAM):
+   f = io.StringIO()
 
-emit = \
-'''/*******************************************************************************
+   emit = \
+   '''/*******************************************************************************
   Copyright 2019 Supranational LLC
 
   Licensed under the Apache License, Version 2.0 (the "License");
@@ -170,24 +153,24 @@ module reduction_lut
     input  logic                    shift_overflow,
     output logic [BIT_LEN-1:0]      lut_data[NUM_ELEMENTS][LUT_NUM_ELEMENTS],
 '''
-f.write(emit)
+   f.write(emit)
 
-if NUM_URAM == 0:
-   f.write("/* verilator lint_off UNUSED */")
+   if NUM_URAM == 0:
+      f.write("/* verilator lint_off UNUSED */")
 
-emit = \
-'''
+   emit = \
+   '''
     input                           we,
     input [DIN_LEN-1:0]             din,
     input                           din_valid
 '''
-f.write(emit)
+   f.write(emit)
 
-if NUM_URAM == 0:
-   f.write("/* verilator lint_on UNUSED */")
+   if NUM_URAM == 0:
+      f.write("/* verilator lint_on UNUSED */")
 
-emit = \
-'''
+   emit = \
+   '''
    );
 
    // There is twice as many entries due to low and high values
@@ -200,17 +183,17 @@ emit = \
 
    logic [LUT_WIDTH-1:0]  lut_read_data[LUT_NUM_ELEMENTS];
 '''
-f.write(emit % {'NUM_URAM':NUM_URAM})
+   f.write(emit % {'NUM_URAM':NUM_URAM})
 
-##########################################################################
-# URAM Only
-##########################################################################
+   ##########################################################################
+   # URAM Only
+   ##########################################################################
 
-if NUM_URAM > 0:
-   f.write("   logic [LUT_WIDTH-1:0]  lut_read_data_uram[NUM_URAM];")
+   if NUM_URAM > 0:
+      f.write("   logic [LUT_WIDTH-1:0]  lut_read_data_uram[NUM_URAM];")
 
-   emit = \
-'''       
+      emit = \
+   '''       
    logic [NUM_URAM-1:0]   we_uram;
    genvar i;
    generate
@@ -244,18 +227,18 @@ if NUM_URAM > 0:
       end
    end
 '''
-   f.write(emit)
+      f.write(emit)
 
    
-##########################################################################
-# BRAM Only
-##########################################################################
+   ##########################################################################
+   # BRAM Only
+   ##########################################################################
 
-if NUM_BRAM > 0:
-   f.write("   logic [LUT_WIDTH-1:0]  lut_read_data_bram[NUM_BRAM];")
+   if NUM_BRAM > 0:
+      f.write("   logic [LUT_WIDTH-1:0]  lut_read_data_bram[NUM_BRAM];")
 
-   emit = \
-'''
+      emit = \
+   '''
    logic [BIT_LEN-1:0]    lut_output[NUM_ELEMENTS][LUT_NUM_ELEMENTS];
 
    // Delay to align with data from memory
@@ -267,60 +250,60 @@ if NUM_BRAM > 0:
       shift_overflow_1d <= shift_overflow;
    end
 '''
-   f.write(emit)
+      f.write(emit)
 
-   block_str = '   (* rom_style = "block" *) logic [LUT_WIDTH-1:0] lut_{0:03d}[NUM_LUT_ENTRIES];\n'
+      block_str = '   (* rom_style = "block" *) logic [LUT_WIDTH-1:0] lut_{0:03d}[NUM_LUT_ENTRIES];\n'
 
-   for i in range (NUM_BRAM):
-      f.write(block_str.format(i+NUM_URAM))
+      for i in range (NUM_BRAM):
+         f.write(block_str.format(i+NUM_URAM))
 
-   read_str = '      $readmemh("reduction_lut_{0:03d}.dat", lut_{0:03d});\n'
+      read_str = '      $readmemh("reduction_lut_{0:03d}.dat", lut_{0:03d});\n'
 
-   f.write('\n   initial begin\n')
-   for i in range (NUM_BRAM):
-      f.write(read_str.format(i+NUM_URAM))
-   f.write('   end\n')
+      f.write('\n   initial begin\n')
+      for i in range (NUM_BRAM):
+         f.write(read_str.format(i+NUM_URAM))
+      f.write('   end\n')
 
-   #assign_str = '      lut_read_data[{0:d}] <= lut_{0:03d}[lut_addr[{0:d}]][LUT_WIDTH-1:0];\n'
-   assign_str = '      lut_read_data_bram[{0:d}] <= lut_{1:03d}[lut_addr[{1:d}]];\n'
-   f.write('\n   always_ff @(posedge clk) begin\n')
-   for i in range (NUM_BRAM):
-      f.write(assign_str.format(i, i+NUM_URAM))
-   f.write('   end\n')
+      #assign_str = '      lut_read_data[{0:d}] <= lut_{0:03d}[lut_addr[{0:d}]][LUT_WIDTH-1:0];\n'
+      assign_str = '      lut_read_data_bram[{0:d}] <= lut_{1:03d}[lut_addr[{1:d}]];\n'
+      f.write('\n   always_ff @(posedge clk) begin\n')
+      for i in range (NUM_BRAM):
+         f.write(assign_str.format(i, i+NUM_URAM))
+      f.write('   end\n')
 
-##########################################################################
-# Mixed URAM/BRAM
-##########################################################################
+   ##########################################################################
+   # Mixed URAM/BRAM
+   ##########################################################################
    
-emit = \
-'''
+   emit = \
+   '''
 
    // Read data out of the memories
    always_comb begin
 '''
-f.write(emit)
+   f.write(emit)
 
-emit = \
-'''
+   emit = \
+   '''
       for (int k=0; k<NUM_URAM; k=k+1) begin
          lut_read_data[k]          = lut_read_data_uram[k];
       end
 '''
-if NUM_URAM > 0:
-   f.write(emit)
+   if NUM_URAM > 0:
+      f.write(emit)
 
-emit = \
-'''
+   emit = \
+   '''
       for (int k=0; k<NUM_BRAM; k=k+1) begin
          lut_read_data[k+NUM_URAM] = lut_read_data_bram[k];
       end      
 '''
-if NUM_BRAM > 0:
-   f.write(emit)
+   if NUM_BRAM > 0:
+      f.write(emit)
 
    
-emit = \
-'''
+   emit = \
+   '''
    end
 
    always_comb begin
@@ -375,5 +358,82 @@ emit = \
 endmodule
 '''
 
-f.write(emit)
-f.close()
+   f.write(emit)
+
+   return f.getvalue()
+
+################################################################################
+# Command line
+################################################################################
+
+def usage():
+   print ('gen_reduction_lut.py -M <modulus> -r <num redundant>', \
+         '-nr <num nonredundant> -wl <word length> -u <num_uram>', \
+         '-j <processes> -f')
+
+def main(argv):
+   m                     = M
+   redundant_elements    = REDUNDANT_ELEMENTS
+   nonredundant_elements = NONREDUNDANT_ELEMENTS
+   word_len              = WORD_LEN
+   num_uram              = NUM_URAM
+   processes             = PROCESSES
+   force                 = FORCE
+
+   try:
+      opts, args = getopt.getopt(argv,"hM:r:n:w:j:f",                 \
+                                 ["modulus=","redundant=",           \
+                                  "nonredundant=", "wordlen=", "urams=", \
+                                  "jobs=", "force"])
+   except getopt.GetoptError:
+      usage()
+      sys.exit(2)
+
+   for opt, arg in opts:
+      if opt == '-h':
+         usage()
+         print ('  -j  generate the .dat files in parallel')
+         print ('  -f  rewrite output files even if they are up to date')
+         sys.exit()
+      elif opt in ("-M", "--modulus"):
+         m = int(arg)
+      elif opt in ("-r", "--redundant"):
+         redundant_elements = int(arg)
+      elif opt in ("-n", "--nonredundant"):
+         nonredundant_elements = int(arg)
+      elif opt in ("-w", "--wordlen"):
+         word_len = int(arg)
+      elif opt in ("-u", "--urams"):
+         num_uram = int(arg)
+      elif opt in ("-j", "--jobs"):
+         processes = int(arg)
+      elif opt in ("-f", "--force"):
+         force = True
+
+   print ()
+   print ('Parameter Values')
+   print ('---------------------')
+   print ('REDUNDANT_ELEMENTS   ', redundant_elements)
+   print ('NONREDUNDANT_ELEMENTS', nonredundant_elements)
+   print ('WORD_LEN             ', word_len)
+   print ('NUM_SEGMENTS         ', NUM_SEGMENTS)
+   print ('EXTRA_ELEMENTS       ', EXTRA_ELEMENTS)
+   print ('M                    ', hex(m))
+   print ()
+
+   LUT_NUM_ELEMENTS = lut_num_elements(redundant_elements,
+                                       nonredundant_elements)
+
+   print ('Creating', LUT_NUM_ELEMENTS, 'files')
+   print ('reduction_lut_{0:03d}.dat'.format(0))
+   print ('         ...          ')
+   print ('reduction_lut_{0:03d}.dat'.format(LUT_NUM_ELEMENTS-1))
+
+   files = generate(m, redundant_elements, nonredundant_elements,
+                    NUM_SEGMENTS, word_len, num_uram, processes)
+
+   written, unchanged = write(files, force=force)
+   print ('Wrote', len(written), 'files,', len(unchanged), 'unchanged')
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
@@ -0,0 +1,206 @@
+#!/usr/bin/python3
+
+################################################################################
+# Copyright 2019 Supranational LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+################################################################################
+# Live checker for MSU intermediate values
+################################################################################
+# Reads the host output (msu/sw/main.cpp run with -t <intermediate iters>)
+# from stdin or a file and checks every intermediate value as it arrives:
+#
+#   Modulus is <decimal>
+#   <iteration> <ns> ns/sq: <decimal value>
+#
+# Each reported value is checked by squaring the previous reported value
+# forward, so intervals are independent and are verified in parallel worker
+# processes.  Once every interval up to k has passed, the chain from the start
+# value to k is verified.  The first mismatch is reported together with the
+# time between the line arriving and the mismatch being detected.
+#
+#   ./Vtb -t 1000 -f 1000000 ... | check_intermediates.py -x 0x<sq_in>
+#   check_intermediates.py -F -f 1000000 run.log
+#
+# Without -x the first reported value is taken as the start of the chain.
+
+import concurrent.futures
+import getopt
+import os
+import queue
+import re
+import sys
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', '..', 'modular_square', 'model'))
+
+import sqr_engines
+
+MODULUS_RE      = re.compile(r'^Modulus is (\d+)')
+INTERMEDIATE_RE = re.compile(r'^(\d+) [\d.]+ ns/sq: (\d+)')
+
+# Seconds between polls of a followed file at EOF
+POLL_INTERVAL   = 0.2
+
+def usage():
+   print('check_intermediates.py [-m <modulus>] [-x <start hex>]',
+         '[-f <t_final>] [-j <workers>] [-e <engine>] [-F] [file]')
+   print('  -F  keep following the file as it grows, like tail -f')
+
+def square_interval(modulus, engine_name, x, t):
+   return sqr_engines.get_engine(modulus, engine_name).square(x, t)
+
+################################################################################
+# Reading the host output
+################################################################################
+
+def read_lines(f, follow):
+   while True:
+      line = f.readline()
+      if line:
+         yield line
+      elif follow:
+         time.sleep(POLL_INTERVAL)
+      else:
+         return
+
+# Parses the stream and submits one check per intermediate.  Items put on
+# jobs are (iteration, value, arrival time, future), a string is an error
+# that stops the check and None marks the end.
+def reader(f, follow, modulus, start, t_final, engine_name, executor, jobs):
+   prev_iter  = 0
+   prev_value = start
+
+   try:
+      for line in read_lines(f, follow):
+         arrival = time.time()
+
+         m = MODULUS_RE.match(line)
+         if m:
+            if modulus is None:
+               modulus = int(m.group(1))
+            continue
+
+         m = INTERMEDIATE_RE.match(line)
+         if not m:
+            continue
+         if modulus is None:
+            jobs.put("No modulus given with -m or found in the stream")
+            break
+
+         iteration = int(m.group(1))
+         value     = int(m.group(2))
+
+         # The host restarts the iteration count for every test but keeps
+         # squaring the previous output.  It also reports the last interval
+         # as a full one even when t_final cuts it short.
+         if iteration <= prev_iter:
+            prev_iter = 0
+         squarings = min(iteration, t_final) - min(prev_iter, t_final)
+
+         if prev_value is None:
+            future = None
+            print("Using iteration", iteration, "as the start of the chain")
+         else:
+            future = executor.submit(square_interval, modulus, engine_name,
+                                     prev_value, squarings)
+         jobs.put((iteration, value, arrival, future))
+
+         prev_iter  = iteration
+         prev_value = value
+   finally:
+      jobs.put(None)
+
+################################################################################
+# Checking
+################################################################################
+
+if __name__ == "__main__":
+   modulus     = None
+   start       = None
+   t_final     = 2**64
+   workers     = os.cpu_count()
+   engine_name = 'auto'
+   follow      = False
+
+   try:
+      opts, args = getopt.getopt(sys.argv[1:], "hm:x:f:j:e:F")
+   except getopt.GetoptError:
+      usage()
+      sys.exit(2)
+
+   for opt, arg in opts:
+      if opt == '-h':
+         usage()
+         sys.exit()
+      elif opt == '-m':
+         modulus = int(arg)
+      elif opt == '-x':
+         start = int(arg, 16)
+      elif opt == '-f':
+         t_final = int(arg)
+      elif opt == '-j':
+         workers = int(arg)
+      elif opt == '-e':
+         engine_name = arg
+      elif opt == '-F':
+         follow = True
+
+   f = open(args[0]) if args else sys.stdin
+
+   jobs     = queue.Queue()
+   executor = concurrent.futures.ProcessPoolExecutor(workers)
+   thread   = threading.Thread(target=reader, daemon=True,
+                               args=(f, follow, modulus, start, t_final,
+                                     engine_name, executor, jobs))
+   thread.start()
+
+   checked  = 0
+   failed   = False
+   while True:
+      job = jobs.get()
+      if job is None:
+         break
+      if isinstance(job, str):
+         print(job)
+         failed = True
+         break
+
+      iteration, value, arrival, future = job
+      if future is None:
+         continue
+
+      expected = future.result()
+      latency  = time.time() - arrival
+      checked += 1
+
+      if expected != value:
+         print("MISMATCH at iteration %d, detected %.3f s after it arrived" %
+               (iteration, latency))
+         print("expected is 0x%x" % expected)
+         print("actual   is 0x%x" % value)
+         failed = True
+         break
+
+      print("%d verified, %.3f s latency" % (iteration, latency), flush=True)
+
+   executor.shutdown(wait=False, cancel_futures=True)
+
+   print("Checked", checked, "intermediate values")
+   failed = failed or checked == 0
+   print("FAILED" if failed else "PASSED")
+   sys.exit(1 if failed else 0)
@@ -0,0 +1,349 @@
+#!/usr/bin/python3
+
+################################################################################
+# Copyright 2019 Supranational LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+################################################################################
+# Waveform comparator for modular_square_8_cycles
+################################################################################
+# Streams a Verilator trace and runs the cycle accurate model
+# (modular_square/model/modular_square_8_cycles.py) in lock step with the
+# squarer instance in it.  On every rising clk edge the model is clocked with
+# the reset, start and sq_in values the RTL sampled, then every register of
+# the model's state() (v7v6, v5v4, v2v0, sq_out, the multiplier results, the
+# LUT read data...) is compared against the trace.  The first clock that
+# differs is reported and the comparison stops.
+#
+#   make ... VERILATOR_TRACE=1
+#   compare_waves.py -n 1024 -m <modulus> obj_dir/logs/vlt_dump.vcd
+#   compare_waves.py -n 1024 -m <modulus> run.fst
+#
+# The trace is read one token at a time and only the current value of each
+# compared signal is held, so memory does not grow with the trace.  FST files
+# are converted on the fly by piping them through fst2vcd (from GTKWave).
+#
+# The squarer is found as the scope holding v7v6_overflow unless -p is
+# given.  Unpacked array elements are matched in either the name(i) form
+# Verilator writes or name[i].  Values with x or z bits are not compared.
+# The run fails if REQUIRED_SIGNALS (or the -g signals) are not all in the
+# trace, or if no clocks were compared.
+
+import getopt
+import os
+import re
+import subprocess
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', '..', 'modular_square', 'model'))
+
+import modular_square_8_cycles as m8
+
+REDUNDANT_ELEMENTS = 2
+WORD_LEN           = 16
+BIT_LEN            = 17
+
+DEFAULT_TRACE      = 'obj_dir/logs/vlt_dump.vcd'
+
+# Signal unique to the squarer, used to find its scope
+SQUARER_SIGNAL     = 'v7v6_overflow'
+
+# Model signals that must be in the trace, or every -g signal when given
+REQUIRED_SIGNALS   = ['sq_out', 'v7v6', 'v5v4']
+
+INDEX_RE           = re.compile(r'\((\d+)\)')
+
+################################################################################
+# Streaming VCD reader
+################################################################################
+
+def open_trace(filename):
+   if filename == '-':
+      return sys.stdin, None
+   if filename.endswith('.fst'):
+      proc = subprocess.Popen(['fst2vcd', filename], stdout=subprocess.PIPE,
+                              universal_newlines=True)
+      return proc.stdout, proc
+   return open(filename), None
+
+def tokens(f):
+   for line in f:
+      yield from line.split()
+
+def skip_to_end(tok):
+   for t in tok:
+      if t == '$end':
+         return
+
+# name(3)(1) -> name[3][1]
+def normalize_name(name):
+   return INDEX_RE.sub(r'[\1]', name)
+
+# Reads the header up to $enddefinitions.  Returns {full name: (id, width)}.
+def read_header(tok):
+   scope = []
+   names = {}
+   for t in tok:
+      if t == '$scope':
+         next(tok)
+         scope.append(normalize_name(next(tok)))
+         skip_to_end(tok)
+      elif t == '$upscope':
+         scope.pop()
+         skip_to_end(tok)
+      elif t == '$var':
+         next(tok)
+         width = int(next(tok))
+         code  = next(tok)
+         ref   = normalize_name(next(tok))
+         # Indices may follow as separate tokens, bit ranges are dropped
+         for t in tok:
+            if t == '$end':
+               break
+            if t.startswith('[') and ':' not in t:
+               ref += t
+         names['.'.join(scope + [ref])] = (code, width)
+      elif t == '$enddefinitions':
+         skip_to_end(tok)
+         return names
+      elif t.startswith('$'):
+         skip_to_end(tok)
+   return names
+
+def parse_value(value):
+   try:
+      return int(value, 2)
+   except ValueError:
+      return None   # x or z bits
+
+def find_scope(names):
+   for name in names:
+      parts = name.split('.')
+      if parts[-1] == SQUARER_SIGNAL:
+         return '.'.join(parts[:-1])
+   return None
+
+################################################################################
+# Comparison
+################################################################################
+
+class WaveCompare:
+   def __init__(self, model, names, scope, signals=None):
+      self.model   = model
+      self.values  = {}
+      self.watch   = set()
+      self.missing = []
+
+      def code(name):
+         full = scope + '.' + name
+         if full not in names:
+            return None
+         c, width = names[full]
+         self.watch.add(c)
+         return (c, width)
+
+      self.clk    = code('clk')
+      self.reset  = code('reset')
+      self.start  = code('start')
+      self.sq_in  = [code('sq_in[%d]' % k)
+                     for k in range (model.num_elements)]
+      if self.clk is None:
+         raise ValueError('no clk in scope ' + scope)
+
+      # (signal name, element or None, (code, width)) per compared value
+      self.compared = []
+      for name, value in model.state():
+         if signals is not None and name not in signals:
+            continue
+         if isinstance(value, list):
+            elements = [(k, code('%s[%d]' % (name, k)))
+                        for k in range (len(value))]
+         else:
+            elements = [(None, code(name))]
+         if any(c is None for k, c in elements):
+            self.missing.append(name)
+            continue
+         for k, c in elements:
+            self.compared.append((name, k, c))
+
+      self.clocks   = 0
+      self.prev_clk = None
+      self.sampled  = None
+
+   def get(self, c):
+      if c is None:
+         return 0
+      v = self.values.get(c[0])
+      return 0 if v is None else v
+
+   # Inputs as the RTL samples them, before this timestamp's changes
+   def sample(self):
+      return (self.get(self.reset), self.get(self.start),
+              [self.get(c) for c in self.sq_in])
+
+   # Differences between the model and the trace after this clock
+   def mismatches(self):
+      state = dict(self.model.state())
+      diffs = []
+      for name, k, (c, width) in self.compared:
+         trace = self.values.get(c)
+         if trace is None:
+            continue
+         model = state[name] if k is None else state[name][k]
+         model = model & ((1 << width) - 1)
+         if trace != model:
+            diffs.append((name, k, trace, model))
+      return diffs
+
+   # Called at the end of every timestamp, returns mismatches on a rising
+   # clock edge
+   def end_timestamp(self):
+      clk   = self.values.get(self.clk[0])
+      diffs = []
+      if self.prev_clk == 0 and clk == 1 and self.sampled is not None:
+         reset, start, sq_in = self.sampled
+         self.model.clock(reset=reset, start=start, sq_in=sq_in)
+         self.clocks += 1
+         diffs = self.mismatches()
+      self.prev_clk = clk
+      self.sampled  = self.sample()
+      return diffs
+
+   # Streams the value changes, stopping at the first clock that differs.
+   # Returns (time, mismatches), mismatches empty if the trace matched.
+   def run(self, tok, max_clocks=None):
+      values = self.values
+      watch  = self.watch
+      time   = None
+
+      for t in tok:
+         c = t[0]
+         if c == '#':
+            if time is not None:
+               diffs = self.end_timestamp()
+               if diffs:
+                  return time, diffs
+               if max_clocks is not None and self.clocks >= max_clocks:
+                  return time, []
+            time = int(t[1:])
+         elif c in 'bB':
+            code = next(tok)
+            if code in watch:
+               values[code] = parse_value(t[1:])
+         elif c in 'rR':
+            next(tok)
+         elif c in '01':
+            if t[1:] in watch:
+               values[t[1:]] = int(c)
+         elif c in 'xXzZ':
+            if t[1:] in watch:
+               values[t[1:]] = None
+
+      return time, self.end_timestamp()
+
+def format_value(name, k):
+   return name if k is None else '%s[%d]' % (name, k)
+
+################################################################################
+# Command line
+################################################################################
+
+def usage():
+   print('compare_waves.py -n <mod len> -m <modulus> [-p <squarer scope>]',
+         '[-g <signal,...>] [-c <max clocks>] [trace]')
+   print('  trace is a VCD, an FST (read through fst2vcd) or - for stdin,')
+   print('  ' + DEFAULT_TRACE + ' by default')
+   print('  -g  only compare the named model signals')
+
+if __name__ == "__main__":
+   mod_len    = 1024
+   modulus    = None
+   scope      = None
+   signals    = None
+   max_clocks = None
+
+   try:
+      opts, args = getopt.getopt(sys.argv[1:], "hn:m:p:g:c:")
+   except getopt.GetoptError:
+      usage()
+      sys.exit(2)
+
+   for opt, arg in opts:
+      if opt == '-h':
+         usage()
+         sys.exit()
+      elif opt == '-n':
+         mod_len = int(arg)
+      elif opt == '-m':
+         modulus = int(arg, 0)
+      elif opt == '-p':
+         scope = arg
+      elif opt == '-g':
+         signals = arg.split(',')
+      elif opt == '-c':
+         max_clocks = int(arg)
+
+   if modulus is None:
+      usage()
+      sys.exit(2)
+
+   trace_file = args[0] if args else DEFAULT_TRACE
+
+   f, proc = open_trace(trace_file)
+   tok     = tokens(f)
+   names   = read_header(tok)
+
+   if scope is None:
+      scope = find_scope(names)
+      if scope is None:
+         print("No", SQUARER_SIGNAL, "in the trace, give the scope with -p")
+         sys.exit(1)
+
+   model   = m8.ModularSquare8Cycles(modulus, REDUNDANT_ELEMENTS,
+                                     mod_len // WORD_LEN, 4, BIT_LEN,
+                                     WORD_LEN)
+   compare = WaveCompare(model, names, scope, signals)
+
+   print("Comparing", scope, "against the model,", len(compare.compared),
+         "values")
+   if compare.missing:
+      print("Not in the trace:", ', '.join(compare.missing))
+
+   required = REQUIRED_SIGNALS if signals is None else signals
+   missing  = [name for name in required if name in compare.missing or
+               name not in dict(model.state())]
+   if missing:
+      print("Required signals not in the trace:", ', '.join(missing))
+      print("FAILED")
+      sys.exit(1)
+
+   time, diffs = compare.run(tok, max_clocks)
+
+   if proc is not None:
+      proc.kill()
+   f.close()
+
+   if diffs:
+      print("Divergence at clock", compare.clocks, "time", time,
+            "in", model.cycle_name())
+      for name, k, trace, value in diffs:
+         print("  %-40s trace %x model %x" %
+               (format_value(name, k), trace, value))
+   print("Compared", compare.clocks, "clocks")
+
+   result_str = "FAILED" if (diffs or compare.clocks == 0) else "PASSED"
+   print(result_str)
+   sys.exit(1 if result_str == "FAILED" else 0)
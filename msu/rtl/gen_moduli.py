@@ -0,0 +1,263 @@
+#!/usr/bin/python3
+
+################################################################################
+# Copyright 2019 Supranational LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+################################################################################
+# Build artifacts for many moduli
+################################################################################
+# Runs gen_reduction_lut.py and gen_test.py for a list of moduli, one
+# modulus per process, writing each modulus' files to its own directory:
+#
+#   <out>/<name>/reduction_lut_NNN.dat   LUT contents for $readmemh
+#   <out>/<name>/reduction_lut.bin       packed tables
+#   <out>/<name>/reduction_lut.sv
+#   <out>/<name>/msuconfig.vh
+#   <out>/<name>/test.txt                golden squaring results
+#
+# The moduli file has one modulus per line (decimal, or hex with 0x),
+# optionally preceded by a name for its directory.  Blank lines and lines
+# starting with # are ignored.  Unnamed moduli use their first 16 hex digits.
+# <out>/moduli.txt lists the names and moduli that were built, in the same
+# format.
+#
+# Within a modulus the 2^k mod M table bases are computed once for all
+# tables (reduction_lut.table_bases).  Outputs come from the generated file
+# cache when the same modulus was built before, and files whose content is
+# unchanged are not rewritten.
+
+import getopt
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', '..', 'modular_square', 'model'))
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', '..', 'modular_square', 'rtl'))
+
+import build_cache
+import gen_reduction_lut
+import gen_test
+
+OUT_DIR       = 'moduli'
+MANIFEST_FILE = 'moduli.txt'
+
+################################################################################
+# Moduli
+################################################################################
+
+def default_name(M):
+   return ('%x' % M)[:16]
+
+# [(name, modulus)] from the lines of a moduli file, raises ValueError
+# naming the first line that is not a modulus or a name and a modulus
+def parse_moduli(lines):
+   moduli = []
+   for n, line in enumerate(lines):
+      fields = line.split('#')[0].split()
+      if not fields:
+         continue
+      try:
+         if len(fields) == 1:
+            M = int(fields[0], 0)
+            moduli.append((default_name(M), M))
+         elif len(fields) == 2:
+            moduli.append((fields[0], int(fields[1], 0)))
+         else:
+            raise ValueError
+      except ValueError:
+         raise ValueError('line %d is not a modulus: %s' %
+                          (n+1, line.strip())) from None
+   return moduli
+
+def read_moduli(filename):
+   with open(filename) as f:
+      return parse_moduli(f)
+
+################################################################################
+# Building
+################################################################################
+
+# Pool worker, builds every file for one modulus.
+# Returns (name, files written, files unchanged, seconds, error).
+def build(job):
+   (name, M, out_dir, mod_len, redundant, nonredundant, word_len, num_uram,
+    t_final, interval, engine_name, simple_sq, force) = job
+
+   start     = time.time()
+   directory = os.path.join(out_dir, name)
+   try:
+      os.makedirs(directory, exist_ok=True)
+
+      files = {}
+      if not simple_sq:
+         files = gen_reduction_lut.generate(M, redundant, nonredundant,
+                                            gen_reduction_lut.NUM_SEGMENTS,
+                                            word_len, num_uram)
+
+      sq_out_bits = mod_len if simple_sq else \
+                    (redundant + nonredundant) * word_len * 2
+      files['msuconfig.vh'] = gen_test.msuconfig(M, mod_len, simple_sq,
+                                                 sq_out_bits).encode()
+
+      written, unchanged = build_cache.write_files(files, directory, force)
+
+      test_txt = os.path.join(directory, 'test.txt')
+      exists   = os.path.exists(test_txt)
+      mtime    = os.path.getmtime(test_txt) if exists else None
+      gen_test.write_test_vectors(M, t_final, interval, engine_name,
+                                  filename=test_txt)
+      if exists and os.path.getmtime(test_txt) == mtime:
+         unchanged.append('test.txt')
+      else:
+         written.append('test.txt')
+   except Exception as e:
+      return (name, 0, 0, time.time() - start, '%s: %s' %
+              (type(e).__name__, e))
+
+   return (name, len(written), len(unchanged), time.time() - start, None)
+
+################################################################################
+# Command line
+################################################################################
+
+def usage():
+   print('gen_moduli.py [-i <moduli file>] [-M <modulus,...>]',
+         '[-o <out dir>] [-s <mod len>] [-r <num redundant>]',
+         '[-n <num nonredundant>] [-w <word len>] [-u <num uram>]',
+         '[-t <t final>] [-k <interval>] [-b <engine>] [-j <processes>]',
+         '[-S] [-f]')
+   print('  -S  simple squarer, no reduction LUTs')
+   print('  -f  rewrite output files even if they are up to date')
+
+def main(argv):
+   moduli       = []
+   out_dir      = OUT_DIR
+   mod_len      = gen_test.MOD_LEN
+   redundant    = gen_reduction_lut.REDUNDANT_ELEMENTS
+   nonredundant = None
+   word_len     = gen_reduction_lut.WORD_LEN
+   num_uram     = gen_reduction_lut.NUM_URAM
+   t_final      = gen_test.T_FINAL
+   interval     = gen_test.INTERVAL
+   engine_name  = gen_test.ENGINE
+   processes    = multiprocessing.cpu_count()
+   simple_sq    = False
+   force        = False
+
+   try:
+      opts, args = getopt.getopt(argv, "hi:M:o:s:r:n:w:u:t:k:b:j:Sf")
+   except getopt.GetoptError:
+      usage()
+      sys.exit(2)
+
+   for opt, arg in opts:
+      if opt == '-h':
+         usage()
+         sys.exit()
+      elif opt in ('-i', '-M'):
+         try:
+            moduli += read_moduli(arg) if opt == '-i' else \
+                      parse_moduli(arg.split(','))
+         except (OSError, ValueError) as e:
+            print("Bad moduli in", arg if opt == '-i' else '-M', "-", e)
+            usage()
+            sys.exit(2)
+      elif opt == '-o':
+         out_dir = arg
+      elif opt == '-s':
+         mod_len = int(arg)
+      elif opt == '-r':
+         redundant = int(arg)
+      elif opt == '-n':
+         nonredundant = int(arg)
+      elif opt == '-w':
+         word_len = int(arg)
+      elif opt == '-u':
+         num_uram = int(arg)
+      elif opt == '-t':
+         t_final = int(arg)
+      elif opt == '-k':
+         interval = int(arg)
+      elif opt == '-b':
+         engine_name = arg
+      elif opt == '-j':
+         processes = int(arg)
+      elif opt == '-S':
+         simple_sq = True
+      elif opt == '-f':
+         force = True
+
+   if not moduli:
+      usage()
+      sys.exit(2)
+
+   names = [name for name, M in moduli]
+   dups  = sorted(set([name for name in names if names.count(name) > 1]))
+   if dups:
+      print("Duplicate names, give the moduli names:", ', '.join(dups))
+      sys.exit(1)
+
+   too_long = [name for name, M in moduli if M.bit_length() > mod_len]
+   if too_long:
+      print("Moduli longer than", mod_len, "bits:", ', '.join(too_long))
+      sys.exit(1)
+
+   if nonredundant is None:
+      nonredundant = mod_len // word_len
+
+   print("Building", len(moduli), "moduli in", out_dir, "with", processes,
+         "processes, mod len", mod_len,
+         "simple squarer" if simple_sq else
+         "num elements %d + %d with word len %d" % (nonredundant, redundant,
+                                                    word_len))
+
+   jobs = [(name, M, out_dir, mod_len, redundant, nonredundant, word_len,
+            num_uram, t_final, interval, engine_name, simple_sq, force)
+           for name, M in moduli]
+
+   os.makedirs(out_dir, exist_ok=True)
+
+   start   = time.time()
+   results = []
+   with multiprocessing.Pool(processes) as pool:
+      for r in pool.imap_unordered(build, jobs):
+         name, written, unchanged, seconds, error = r
+         if error is None:
+            print("%-20s wrote %3d unchanged %3d  %7.2fs" %
+                  (name, written, unchanged, seconds), flush=True)
+         else:
+            print("%-20s ERROR %s" % (name, error), flush=True)
+         results.append(r)
+   elapsed = time.time() - start
+
+   built  = [(name, M) for name, M in moduli
+             if any(r[0] == name and r[4] is None for r in results)]
+   build_cache.write_if_changed(os.path.join(out_dir, MANIFEST_FILE),
+                                ''.join(['%s %d\n' % (name, M)
+                                         for name, M in built]).encode())
+
+   print("Built", len(built), "out of", len(moduli), "moduli in",
+         "%.1f seconds" % elapsed)
+
+   result_str = "FAILED" if len(built) != len(moduli) else "PASSED"
+   print(result_str)
+   sys.exit(1 if result_str == "FAILED" else 0)
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
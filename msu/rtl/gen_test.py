@@ -16,71 +16,256 @@
 # limitations under the License.
 ################################################################################
 
+import io
+import os
 import sys
 import getopt
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', '..', 'modular_square', 'model'))
+
+import build_cache
+import sqr_engines
+
+################################################################################
+# Test vector generation
+################################################################################
+# Importable as a module: write_test_vectors() and write_msuconfig() do the
+# work of the command line below, test_vectors() and msuconfig() return the
+# file contents without writing anything.
+
 MOD_LEN = 1024
-M = None
 
 # Set to 50k for final regression runs
 T_FINAL = 1000
 
-gen_msuconfig = False
-
-try:
-   opts, args = getopt.getopt(sys.argv[1:],"hcM:s:", ["modulus=", "size="])
-except getopt.GetoptError:
-   print ('gen_test.py -M <modulus> [-c]')
-   sys.exit(2)
-
-for opt, arg in opts:
-   if opt == '-h':
-      print ('gen_test.py -M <modulus> [-c]')
-      sys.exit()
-   elif opt in ("-s", "--size"):
-      MOD_LEN = int(arg)
-   elif opt in ("-M", "--modulus"):
-      M = int(arg)
-   elif opt == "-c":
-      gen_msuconfig = True
-
-if MOD_LEN == 128 and M == None:
-   M = 302934307671667531413257853548643485645
-
-if MOD_LEN == 1024 and M == None:
-   # For the Ozturk design this modulus must match what is found in modulus.mk
-   # since reduction LUTs have to be generated ahead of time.
-   MOD_LEN == 1024
-   M = 124066695684124741398798927404814432744698427125735684128131855064976895337309138910015071214657674309443149407457493434579063840841220334555160125016331040933690674569571217337630239191517205721310197608387239846364360850220896772964978569683229449266819903414117058030106528073928633017118689826625594484331
-
-print("MOD_LEN = %d" % MOD_LEN)
-print("MODULUS = %d" % M)
-print(" bitlen = %d" % (M.bit_length()))
-
-f = open('test.txt', 'w')
-
-sq_in = 2
-f.write("%x\n" % sq_in)
-
-def sqr(t_start, t_final, incr, sq_in):
-    for i in range(t_start+incr, t_final+1, incr):
-        for j in range(incr):
-            sq_in = (sq_in * sq_in) % M
-        
-        f.write("%d, %x\n" % (i, sq_in))
-    return(i, sq_in)
-
-(t_curr, sq_in) = sqr(0, 10, 1, sq_in)
-(t_curr, sq_in) = sqr(10, T_FINAL, 10, sq_in)
-
-f.close()
-
-if gen_msuconfig:
-    f = open('msu.srcs/msuconfig.vh', 'w')
-    f.write("`define SIMPLE_SQ 1\n")
-    f.write("`define SQ_IN_BITS_DEF %d\n" % (MOD_LEN))
-    f.write("`define SQ_OUT_BITS_DEF %d\n" % (MOD_LEN))
-    f.write("`define MOD_LEN_DEF %d\n" % (MOD_LEN))
-    f.write("`define MODULUS_DEF %d'h%x\n" % (MOD_LEN, M))
-    f.close()
+# Iterations between values written to test.txt after the first 10
+INTERVAL = 10
+
+ENGINE = 'auto'
+
+# Checkpoints allow a long run to resume from the last stored (t, x).
+# Without one, test.txt is built in memory and only rewritten if it changed.
+CHECKPOINT_PERIOD = 1 << 16
+
+def default_modulus(mod_len):
+    if mod_len == 128:
+        return 302934307671667531413257853548643485645
+
+    if mod_len == 1024:
+        # For the Ozturk design this modulus must match what is found in
+        # modulus.mk since reduction LUTs have to be generated ahead of time.
+        return 124066695684124741398798927404814432744698427125735684128131855064976895337309138910015071214657674309443149407457493434579063840841220334555160125016331040933690674569571217337630239191517205721310197608387239846364360850220896772964978569683229449266819903414117058030106528073928633017118689826625594484331
+
+    return None
+
+################################################################################
+# Checkpoints
+################################################################################
+# The checkpoint file holds one line "modulus t_final interval t x offset"
+# (hex values) where offset is the length of test.txt once the value for t
+# was written.  On resume test.txt is truncated back to offset and squaring
+# continues from x.  A checkpoint for other parameters, or whose test.txt is
+# missing or shorter than offset, is ignored and the run starts over.
+
+def load_checkpoint(checkpoint_file, M, t_final, interval, filename):
+    if checkpoint_file is None or not os.path.exists(checkpoint_file):
+        return None
+    with open(checkpoint_file) as cf:
+        fields = cf.read().split()
+    try:
+        values = [int(x, 16) for x in fields]
+    except ValueError:
+        values = []
+    if len(values) != 6 or values[:3] != [M, t_final, interval]:
+        print("Ignoring checkpoint %s for a different modulus, t final or "
+              "interval" % checkpoint_file)
+        return None
+    (t, x, offset) = values[3:]
+    if not os.path.exists(filename) or os.path.getsize(filename) < offset:
+        print("Ignoring checkpoint %s, %s is missing or too short" %
+              (checkpoint_file, filename))
+        return None
+    return (t, x, offset)
+
+def save_checkpoint(checkpoint_file, M, t_final, interval, f, t, x):
+    f.flush()
+    tmp_file = checkpoint_file + '.tmp'
+    with open(tmp_file, 'w') as cf:
+        cf.write("%x %x %x %x %x %x\n" % (M, t_final, interval, t, x,
+                                          f.tell()))
+    os.replace(tmp_file, checkpoint_file)
+
+################################################################################
+# Test vectors
+################################################################################
+
+# Writes the vectors after t_curr up to t_final to f, every iteration up to
+# 10 and every interval iterations after that.  checkpoint(t, x) is called
+# at least every checkpoint_period iterations if given.  Returns (t, x) of
+# the last value written.
+def sqr_vectors(f, engine, t_curr, sq_in, t_final, interval,
+                checkpoint=None, checkpoint_period=CHECKPOINT_PERIOD):
+    last_checkpoint = t_curr
+
+    def sqr(t_start, t_final, incr, sq_in):
+        nonlocal last_checkpoint
+        i = t_start
+        for i in range(t_start+incr, t_final+1, incr):
+            sq_in = engine.square(sq_in, incr)
+
+            f.write("%d, %x\n" % (i, sq_in))
+
+            if (checkpoint is not None and
+                i - last_checkpoint >= checkpoint_period):
+                checkpoint(i, sq_in)
+                last_checkpoint = i
+        return(i, sq_in)
+
+    if t_curr < 10:
+        (t_curr, sq_in) = sqr(t_curr, min(10, t_final), 1, sq_in)
+    return sqr(t_curr, t_final, interval, sq_in)
+
+# Contents of test.txt, squaring from 2
+def test_vectors(M, t_final=T_FINAL, interval=INTERVAL, engine_name=ENGINE):
+    engine = sqr_engines.get_engine(M, engine_name)
+
+    f = io.StringIO()
+    f.write("%x\n" % 2)
+    sqr_vectors(f, engine, 0, 2, t_final, interval)
+    return f.getvalue()
+
+def write_test_vectors(M, t_final=T_FINAL, interval=INTERVAL,
+                       engine_name=ENGINE, filename='test.txt',
+                       checkpoint_file=None,
+                       checkpoint_period=CHECKPOINT_PERIOD):
+    # The same parameters always give the same vectors, reuse them from the
+    # generated file cache when available
+    cache_key = build_cache.cache_key(__file__, {'modulus'  : M,
+                                                 't_final'  : t_final,
+                                                 'interval' : interval})
+    cached    = build_cache.lookup(cache_key)
+
+    if cached is not None:
+        print("Using cached test vectors")
+        test_txt = cached['test.txt']
+    elif checkpoint_file is None:
+        test_txt = test_vectors(M, t_final, interval, engine_name).encode()
+    else:
+        # Long runs stream to the file so they can be resumed
+        engine = sqr_engines.get_engine(M, engine_name)
+        resume = load_checkpoint(checkpoint_file, M, t_final, interval,
+                                 filename)
+
+        if resume is None:
+            f = open(filename, 'w')
+            t_curr = 0
+            sq_in  = 2
+            f.write("%x\n" % sq_in)
+        else:
+            (t_curr, sq_in, offset) = resume
+            print("Resuming from checkpoint at t = %d" % t_curr)
+            f = open(filename, 'r+')
+            f.truncate(offset)
+            f.seek(offset)
+
+        def checkpoint(t, x):
+            save_checkpoint(checkpoint_file, M, t_final, interval, f, t, x)
+
+        (t_curr, sq_in) = sqr_vectors(f, engine, t_curr, sq_in, t_final,
+                                      interval, checkpoint, checkpoint_period)
+        checkpoint(t_curr, sq_in)
+        f.close()
+
+        with open(filename, 'rb') as f:
+            test_txt = f.read()
+
+    if cached is None:
+        build_cache.store(cache_key, {'test.txt' : test_txt})
+
+    build_cache.write_if_changed(filename, test_txt)
+
+# The Ozturk squarer (simple_sq False) outputs the full redundant
+# NUM_ELEMENTS*WORD_LEN*2 bit product, given as sq_out_bits
+def msuconfig(M, mod_len=MOD_LEN, simple_sq=True, sq_out_bits=None):
+    if sq_out_bits is None:
+        sq_out_bits = mod_len
+    return (("`define SIMPLE_SQ 1\n" if simple_sq else "") +
+            "`define SQ_IN_BITS_DEF %d\n" % (mod_len) +
+            "`define SQ_OUT_BITS_DEF %d\n" % (sq_out_bits) +
+            "`define MOD_LEN_DEF %d\n" % (mod_len) +
+            "`define MODULUS_DEF %d'h%x\n" % (mod_len, M))
+
+def write_msuconfig(M, mod_len=MOD_LEN, filename='msu.srcs/msuconfig.vh',
+                    simple_sq=True, sq_out_bits=None):
+    build_cache.write_if_changed(filename,
+                                 msuconfig(M, mod_len, simple_sq,
+                                           sq_out_bits).encode())
+
+################################################################################
+# Command line
+################################################################################
+
+def usage():
+   print ('gen_test.py -M <modulus> [-c] [-s <mod len>] [-t <t final>]',
+          '[-i <interval>] [-b <auto|python|montgomery|gmpy2>]',
+          '[-k <checkpoint file>] [-p <checkpoint period>]')
+
+def main(argv):
+   mod_len           = MOD_LEN
+   M                 = None
+   t_final           = T_FINAL
+   interval          = INTERVAL
+   engine_name       = ENGINE
+   checkpoint_file   = None
+   checkpoint_period = CHECKPOINT_PERIOD
+   gen_msuconfig     = False
+
+   try:
+      opts, args = getopt.getopt(argv,"hcM:s:t:i:b:k:p:",
+                                 ["modulus=", "size=", "tfinal=", "interval=",
+                                  "engine=", "checkpoint=", "period="])
+   except getopt.GetoptError:
+      usage()
+      sys.exit(2)
+
+   for opt, arg in opts:
+      if opt == '-h':
+         usage()
+         sys.exit()
+      elif opt in ("-s", "--size"):
+         mod_len = int(arg)
+      elif opt in ("-M", "--modulus"):
+         M = int(arg)
+      elif opt in ("-t", "--tfinal"):
+         t_final = int(arg)
+      elif opt in ("-i", "--interval"):
+         interval = int(arg)
+      elif opt in ("-b", "--engine"):
+         engine_name = arg
+      elif opt in ("-k", "--checkpoint"):
+         checkpoint_file = arg
+      elif opt in ("-p", "--period"):
+         checkpoint_period = int(arg)
+      elif opt == "-c":
+         gen_msuconfig = True
+
+   if M is None:
+      M = default_modulus(mod_len)
+
+   print("MOD_LEN = %d" % mod_len)
+   print("MODULUS = %d" % M)
+   print(" bitlen = %d" % (M.bit_length()))
+
+   engine = sqr_engines.get_engine(M, engine_name)
+   print(" engine = %s" % engine.name)
+
+   write_test_vectors(M, t_final, interval, engine_name,
+                      checkpoint_file=checkpoint_file,
+                      checkpoint_period=checkpoint_period)
+
+   if gen_msuconfig:
+      write_msuconfig(M, mod_len)
 
+if __name__ == "__main__":
+   main(sys.argv[1:])
@@ -14,6 +14,10 @@
 #  limitations under the License.
 #
 
+import getopt
+import random
+import sys
+
 def int_to_bits(x, bit_len):
    return [x >> i & 1 for i in range(0, bit_len)]
 
@@ -72,6 +76,122 @@ def compressor_tree(terms, bit_len):
 
    return cout, s
 
+################################################################################
+# Word-level compressor tree
+################################################################################
+# Same 3:2 reduction as above but each term is a whole integer rather than a
+# list of bits, so every bit position of a term is compressed in one operation.
+# The grouping of terms, the leftover handling and the width growth per level
+# match csa_level/compressor_tree exactly, so the carry and sum outputs are
+# bit-exact with the bit list versions.
+
+# Carry Save Adder
+def csa_word(A, B, Cin):
+   S    = A ^ B ^ Cin
+   Cout = (A & B) | (Cin & (A ^ B))
+   return Cout, S
+
+# One level of the compressor tree
+def csa_level_word(terms):
+   result_terms = []
+
+   # Feed three consecutive terms to a CSA
+   for i in range(2, len(terms), 3):
+      cout, s  = csa_word(terms[i-2], terms[i-1], terms[i])
+      # Need to shift carry 1 bit
+      result_terms.append(cout << 1)
+      result_terms.append(s)
+
+   # Push any leftover terms not feed to a CSA to the next level
+   for i in range(len(terms)%3):
+      result_terms.append(terms[(len(terms)-1)-i])
+
+   return result_terms
+
+# 3:2 compressor tree
+# Terms are truncated to bit_len bits on the way in, as int_to_bits would.
+# Each level widens the terms by one bit, so the outputs are at most
+# bit_len + levels + 1 bits wide.  Fewer than three terms are padded with
+# zero terms to a single CSA.
+def compressor_tree_word(terms, bit_len):
+   mask  = (1 << bit_len) - 1
+   terms = [t & mask for t in terms] + [0]*(3-len(terms))
+
+   while (len(terms) != 3):
+      terms = csa_level_word(terms)
+
+   cout, s = csa_word(terms[0], terms[1], terms[2])
+
+   return cout << 1, s
+
+################################################################################
+# Fixed width compressor tree
+################################################################################
+# Word-level model of compressor_tree_3_to_2.sv, bit-exact with the RTL.
+# Unlike compressor_tree_word every term stays bit_len bits wide: each CSA
+# carry is rotated left by one bit within bit_len bits as in
+# carry_save_adder_tree_level.sv, leftover terms keep their order at the end
+# of the level, and the final carry is shifted with its top bit dropped.
+#
+# Columns with the same number of terms go through identical trees, so
+# several of them can be evaluated at once by packing them side by side into
+# lanes of bit_len bits (pack_lanes/unpack_lanes).
+
+def pack_lanes(columns, bit_len):
+   terms = [0] * len(columns[0])
+   for lane in range(len(columns)-1, -1, -1):
+      for i, t in enumerate(columns[lane]):
+         terms[i] = (terms[i] << bit_len) | t
+   return terms
+
+def unpack_lanes(x, bit_len, lanes):
+   mask = (1 << bit_len) - 1
+   return [(x >> (lane*bit_len)) & mask for lane in range(lanes)]
+
+# One level of the compressor tree
+def csa_level_fixed(terms, bit_len, lanes=1):
+   mask     = (1 << (bit_len*lanes)) - 1
+   low_bits = mask // ((1 << bit_len) - 1)
+
+   result_terms = []
+
+   for i in range(2, len(terms), 3):
+      cout, s  = csa_word(terms[i-2], terms[i-1], terms[i])
+      # Rotate carry 1 bit within each lane
+      result_terms.append(((cout << 1) & mask & ~low_bits) |
+                          ((cout >> (bit_len-1)) & low_bits))
+      result_terms.append(s)
+
+   result_terms.extend(terms[len(terms)-(len(terms)%3):])
+
+   return result_terms
+
+# 3:2 compressor tree, terms must already fit in bit_len bits per lane
+def compressor_tree_fixed(terms, bit_len, lanes=1):
+   if (len(terms) == 1):
+      return 0, terms[0]
+   elif (len(terms) == 2):
+      return terms[1], terms[0]
+
+   while (len(terms) != 3):
+      terms = csa_level_fixed(terms, bit_len, lanes)
+
+   cout, s = csa_word(terms[0], terms[1], terms[2])
+
+   # Shift carry 1 bit dropping the top bit of each lane
+   mask     = (1 << (bit_len*lanes)) - 1
+   low_bits = mask // ((1 << bit_len) - 1)
+   return (cout << 1) & mask & ~low_bits, s
+
+# Number of CSA levels a tree of num_terms terms goes through, the same for
+# compressor_tree, compressor_tree_word and compressor_tree_fixed
+def compressor_tree_levels(num_terms):
+   levels = 0
+   while (num_terms > 2):
+      num_terms = ((num_terms // 3) * 2) + (num_terms % 3)
+      levels   += 1
+   return levels
+
 # Multiplier
 def multiplier(A, B):
    P = A * B
@@ -102,13 +222,126 @@ def multiply(A, B, NUM_ELEMENTS, COL_BIT_LEN, WORD_LEN):
    s[(NUM_ELEMENTS*2)-1]    = grid[(NUM_ELEMENTS*2)-1][(NUM_ELEMENTS*2)-1]
 
    for i in range (1, (NUM_ELEMENTS*2)-1):
-      grid_bits = []
-      for g in grid[i]:
-         grid_bits.append(int_to_bits(g, COL_BIT_LEN))
+      cout[i], s[i] = compressor_tree_word(grid[i], COL_BIT_LEN)
+
+   return cout, s
+
+################################################################################
+# Squaring
+################################################################################
+# multiply(A, A) with only the products A[i]*A[j] for i <= j.  Each off
+# diagonal product stands for both A[i]*A[j] and A[j]*A[i], so its low and
+# high parts are doubled (shifted) separately and every column adds up to
+# exactly the same total as in multiply.  Roughly half the multipliers and
+# compressor tree terms are needed.  Doubled high parts are one bit wider,
+# so the trees are COL_BIT_LEN+1 bits wide.
+
+def square(A, NUM_ELEMENTS, COL_BIT_LEN, WORD_LEN):
+   word_mask = pow(2,WORD_LEN)-1
+   col_mask  = pow(2,COL_BIT_LEN)-1
+
+   # grid[col] holds only the terms placed in that column
+   grid = [[] for x in range(NUM_ELEMENTS*2)]
+   for i in range (NUM_ELEMENTS):
+      P = multiplier(A[i], A[i])
+      grid[2*i].append(P & word_mask)
+      grid[(2*i)+1].append((P >> WORD_LEN) & col_mask)
 
-      result  = compressor_tree(grid_bits, COL_BIT_LEN)
-      cout[i] = bits_to_int(result[0])
-      s[i]    = bits_to_int(result[1])
+      for j in range (i+1, NUM_ELEMENTS):
+         P = multiplier(A[i], A[j])
+         grid[i+j].append((P & word_mask) << 1)
+         grid[i+j+1].append(((P >> WORD_LEN) & col_mask) << 1)
+
+   cout = (NUM_ELEMENTS*2)*[0]
+   s    = (NUM_ELEMENTS*2)*[0]
+
+   s[0]                     = grid[0][0]
+   s[(NUM_ELEMENTS*2)-1]    = grid[(NUM_ELEMENTS*2)-1][0]
+
+   for i in range (1, (NUM_ELEMENTS*2)-1):
+      cout[i], s[i] = compressor_tree_word(grid[i], COL_BIT_LEN+1)
 
    return cout, s
 
+# True if square(A) gives the same column totals as multiply(A, A)
+def check_square(A, NUM_ELEMENTS, COL_BIT_LEN, WORD_LEN):
+   mul_cout, mul_s = multiply(A, A, NUM_ELEMENTS, COL_BIT_LEN, WORD_LEN)
+   sqr_cout, sqr_s = square(A, NUM_ELEMENTS, COL_BIT_LEN, WORD_LEN)
+
+   for i in range (NUM_ELEMENTS*2):
+      if (mul_cout[i] + mul_s[i]) != (sqr_cout[i] + sqr_s[i]):
+         return False
+   return True
+
+################################################################################
+# Command line
+################################################################################
+# Checks square against multiply over random inputs.  Inputs are BIT_LEN =
+# WORD_LEN+1 bits wide as in the redundant polynomial, with the column width
+# large enough that no column total is truncated.
+
+SQUARE_ELEMENTS  = [1, 2, 3, 8, 17, 32]
+SQUARE_WORD_LENS = [4, 8, 16]
+
+def usage():
+   print('primitives.py -n <num tests> -e <elements> -w <word lens>',
+         '-s <seed>')
+   print('  lists are comma separated, e.g. -w 8,16')
+
+if __name__ == "__main__":
+   num_tests = 100
+   elements  = SQUARE_ELEMENTS
+   word_lens = SQUARE_WORD_LENS
+   seed      = 0
+
+   try:
+      opts, args = getopt.getopt(sys.argv[1:], "hn:e:w:s:")
+   except getopt.GetoptError:
+      usage()
+      sys.exit(2)
+
+   for opt, arg in opts:
+      if opt == '-h':
+         usage()
+         sys.exit()
+      elif opt == '-n':
+         num_tests = int(arg)
+      elif opt == '-e':
+         elements = [int(x) for x in arg.split(',')]
+      elif opt == '-w':
+         word_lens = [int(x) for x in arg.split(',')]
+      elif opt == '-s':
+         seed = int(arg)
+
+   random.seed(seed)
+
+   tests_run    = 0
+   tests_failed = 0
+   for word_len in word_lens:
+      for num_elements in elements:
+         bit_len     = word_len + 1
+         col_bit_len = (bit_len*2) - word_len + num_elements.bit_length()
+
+         # All ones inputs first, then random ones
+         inputs = [[(2**bit_len)-1] * num_elements]
+         inputs += [[random.getrandbits(bit_len) for i in range (num_elements)]
+                    for t in range (num_tests-1)]
+
+         failed = 0
+         for A in inputs:
+            tests_run += 1
+            if not check_square(A, num_elements, col_bit_len, word_len):
+               failed += 1
+               print("Square mismatch, word len", word_len, "elements",
+                     num_elements, "input", [hex(a) for a in A])
+         tests_failed += failed
+
+         print("Checked square, num elements", num_elements, "with word len",
+               word_len, ":", len(inputs)-failed, "out of", len(inputs),
+               "passed", flush=True)
+
+   print("Passed", tests_run-tests_failed, "out of", tests_run, "tests")
+
+   result_str = "FAILED" if (tests_failed > 0 or tests_run == 0) else "PASSED"
+   print(result_str)
+   sys.exit(1 if result_str == "FAILED" else 0)
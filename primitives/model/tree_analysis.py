@@ -0,0 +1,349 @@
+#!/usr/bin/python3
+
+#
+#  Copyright 2019 Supranational, LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+################################################################################
+# Compressor tree depth analysis
+################################################################################
+# Depth and size of the column compressor trees for a grid shape, given as a
+# list of (num_terms, bit_len) per column.  grid_shape(), multiply_shape()
+# and square_shape() give the shapes compress_grid, multiply and square feed
+# to compressor_tree.
+#
+# Schemes:
+#   3:2     the word-level tree of compressor_tree/csa_level, three terms per
+#           CSA and leftover terms passed to the next level
+#   4:2     word-level 4:2 compressors, a leftover 3 goes through a CSA
+#   wallace bit-level Wallace reduction, every column of dots compressed as
+#           far as possible at each stage with full and half adders
+#   dadda   bit-level Dadda reduction, columns only compressed down to the
+#           next height in 2, 3, 4, 6, 9, 13...
+#
+# Each column result holds the number of levels (stages), the XOR delays
+# through them (2 per full adder level, 3 per 4:2 level), the CSA and 4:2
+# compressor counts for the word-level schemes, the full and half adder
+# counts, and the width of the final carry propagate add.  The XOR delays
+# plus the final add width set the critical path of the squaring cycle.
+
+import getopt
+import sys
+
+import primitives as p
+
+SCHEMES        = ['3:2', '4:2', 'wallace', 'dadda']
+
+FA_XOR_DELAYS  = 2
+C42_XOR_DELAYS = 3
+
+################################################################################
+# Grid shapes
+################################################################################
+
+# compress_grid, grid_rows terms per column
+def grid_shape(grid_size, grid_rows, grid_bit_len):
+   return [(grid_rows, grid_bit_len)] * grid_size
+
+# multiply, every column of the 2N x 2N grid is compressed including its
+# zero entries.  With trimmed only the rows of the product parallelogram are
+# compressed as multiply.sv does.
+def multiply_shape(num_elements, col_bit_len, trimmed=False):
+   shape = []
+   for i in range (num_elements*2):
+      if not trimmed:
+         num_terms = num_elements*2
+      elif i < num_elements:
+         num_terms = (i*2) + 1
+      else:
+         num_terms = (num_elements*4) - 1 - (i*2)
+      shape.append((num_terms, col_bit_len))
+   return shape
+
+# square, only the products of the upper triangle, doubled parts one bit wider
+def square_shape(num_elements, col_bit_len):
+   terms = [0] * (num_elements*2)
+   for i in range (num_elements):
+      for j in range (i, num_elements):
+         terms[i+j]   += 1
+         terms[i+j+1] += 1
+   return [(num_terms, col_bit_len+1) for num_terms in terms]
+
+################################################################################
+# Word-level schemes
+################################################################################
+
+def tree_3_to_2(num_terms, bit_len):
+   levels = 0
+   csas   = 0
+   fas    = 0
+   width  = bit_len
+
+   # Same grouping as csa_level, the terms widen by one bit per level
+   while (num_terms > 2):
+      groups     = num_terms // 3
+      csas      += groups
+      fas       += groups * width
+      num_terms  = (groups * 2) + (num_terms % 3)
+      levels    += 1
+      width     += 1
+
+   return {'levels'      : levels,
+           'xor_delays'  : levels * FA_XOR_DELAYS,
+           'csas'        : csas,
+           'c42s'        : 0,
+           'fas'         : fas,
+           'has'         : 0,
+           'final_width' : width}
+
+def tree_4_to_2(num_terms, bit_len):
+   levels     = 0
+   xor_delays = 0
+   csas       = 0
+   c42s       = 0
+   fas        = 0
+   width      = bit_len
+
+   while (num_terms > 2):
+      groups    = num_terms // 4
+      leftover  = num_terms % 4
+      c42s     += groups
+      fas      += groups * width * 2
+      num_terms = groups * 2
+
+      if leftover == 3:
+         csas      += 1
+         fas       += width
+         num_terms += 2
+      else:
+         num_terms += leftover
+
+      levels     += 1
+      xor_delays += C42_XOR_DELAYS if groups > 0 else FA_XOR_DELAYS
+      # Both carries of a 4:2 compressor move up a bit
+      width      += 2 if groups > 0 else 1
+
+   return {'levels'      : levels,
+           'xor_delays'  : xor_delays,
+           'csas'        : csas,
+           'c42s'        : c42s,
+           'fas'         : fas,
+           'has'         : 0,
+           'final_width' : width}
+
+################################################################################
+# Bit-level schemes
+################################################################################
+# heights[i] is the number of dots (bits) of weight 2^i.
+
+def final_width(heights):
+   while heights and heights[-1] == 0:
+      heights = heights[:-1]
+   return len(heights)
+
+def tree_wallace(num_terms, bit_len):
+   heights = [num_terms] * bit_len
+   levels  = 0
+   fas     = 0
+   has     = 0
+
+   while max(heights) > 2:
+      next_heights = [0] * (len(heights) + 1)
+      for i, h in enumerate(heights):
+         fa  = h // 3
+         ha  = 1 if (h % 3) == 2 else 0
+         fas += fa
+         has += ha
+         next_heights[i]   += fa + ha + ((h % 3) if ha == 0 else 0)
+         next_heights[i+1] += fa + ha
+      heights = next_heights
+      levels += 1
+
+   return {'levels'      : levels,
+           'xor_delays'  : levels * FA_XOR_DELAYS,
+           'csas'        : 0,
+           'c42s'        : 0,
+           'fas'         : fas,
+           'has'         : has,
+           'final_width' : final_width(heights)}
+
+def dadda_heights(max_height):
+   d = [2]
+   while d[-1] < max_height:
+      d.append((d[-1] * 3) // 2)
+   return d[:-1]
+
+def tree_dadda(num_terms, bit_len):
+   heights = [num_terms] * bit_len
+   fas     = 0
+   has     = 0
+
+   targets = dadda_heights(num_terms)
+   for d in reversed(targets):
+      next_heights = heights + [0]
+      for i in range (len(heights)):
+         h = next_heights[i]
+         # Only as many adders as needed to reach the target height,
+         # counting the carries coming in from the previous column
+         while h > d:
+            if h == d + 1:
+               has += 1
+               h   -= 1
+            else:
+               fas += 1
+               h   -= 2
+            next_heights[i+1] += 1
+         next_heights[i] = h
+      heights = next_heights
+
+   return {'levels'      : len(targets),
+           'xor_delays'  : len(targets) * FA_XOR_DELAYS,
+           'csas'        : 0,
+           'c42s'        : 0,
+           'fas'         : fas,
+           'has'         : has,
+           'final_width' : final_width(heights)}
+
+TREES = {'3:2'     : tree_3_to_2,
+         '4:2'     : tree_4_to_2,
+         'wallace' : tree_wallace,
+         'dadda'   : tree_dadda}
+
+################################################################################
+# Analysis
+################################################################################
+
+# Results for one column, columns of fewer than three terms need no tree
+def analyze_column(num_terms, bit_len, scheme='3:2'):
+   if num_terms < 3:
+      result = {'levels'      : 0,
+                'xor_delays'  : 0,
+                'csas'        : 0,
+                'c42s'        : 0,
+                'fas'         : 0,
+                'has'         : 0,
+                'final_width' : bit_len}
+   else:
+      result = TREES[scheme](num_terms, bit_len)
+
+   result['terms']   = num_terms
+   result['bit_len'] = bit_len
+   return result
+
+def analyze_grid(shape, scheme='3:2'):
+   return [analyze_column(num_terms, bit_len, scheme)
+           for num_terms, bit_len in shape]
+
+# Deepest column and totals over a grid
+def summarize(results):
+   return {'levels'      : max([r['levels'] for r in results]),
+           'xor_delays'  : max([r['xor_delays'] for r in results]),
+           'csas'        : sum([r['csas'] for r in results]),
+           'c42s'        : sum([r['c42s'] for r in results]),
+           'fas'         : sum([r['fas'] for r in results]),
+           'has'         : sum([r['has'] for r in results]),
+           'final_width' : max([r['final_width'] for r in results])}
+
+# Confirm the 3:2 analysis against compressor_tree itself
+def check_3_to_2(num_terms, bit_len):
+   result = tree_3_to_2(num_terms, bit_len)
+   if num_terms < 3:
+      return True
+
+   terms = [p.int_to_bits((2**bit_len)-1, bit_len) for i in range (num_terms)]
+   cout, s = p.compressor_tree(terms, bit_len)
+
+   return (result['levels'] == p.compressor_tree_levels(num_terms) and
+           result['final_width'] == len(s) and
+           p.bits_to_int(cout) + p.bits_to_int(s) ==
+           num_terms * ((2**bit_len)-1))
+
+################################################################################
+# Command line
+################################################################################
+
+def usage():
+   print('tree_analysis.py -g <grid|multiply|multiply_trimmed|square>',
+         '-n <num elements or grid size> -r <grid rows> -b <bit len>',
+         '[-c]')
+   print('  -c  print every column, not just the summary')
+
+if __name__ == "__main__":
+   shape_name   = 'grid'
+   num_elements = 53
+   grid_rows    = 9
+   bit_len      = 19
+   per_column   = False
+
+   try:
+      opts, args = getopt.getopt(sys.argv[1:], "hg:n:r:b:c")
+   except getopt.GetoptError:
+      usage()
+      sys.exit(2)
+
+   for opt, arg in opts:
+      if opt == '-h':
+         usage()
+         sys.exit()
+      elif opt == '-g':
+         shape_name = arg
+      elif opt == '-n':
+         num_elements = int(arg)
+      elif opt == '-r':
+         grid_rows = int(arg)
+      elif opt == '-b':
+         bit_len = int(arg)
+      elif opt == '-c':
+         per_column = True
+
+   if shape_name == 'grid':
+      shape = grid_shape(num_elements, grid_rows, bit_len)
+   elif shape_name == 'multiply':
+      shape = multiply_shape(num_elements, bit_len)
+   elif shape_name == 'multiply_trimmed':
+      shape = multiply_shape(num_elements, bit_len, trimmed=True)
+   elif shape_name == 'square':
+      shape = square_shape(num_elements, bit_len)
+   else:
+      usage()
+      sys.exit(2)
+
+   header = '%-8s %6s %6s %6s %6s %8s %8s %6s' % \
+            ('scheme', 'levels', 'xors', 'csas', 'c42s', 'fas', 'has',
+             'width')
+   row    = '%-8s %6d %6d %6d %6d %8d %8d %6d'
+
+   if per_column:
+      for scheme in SCHEMES:
+         print(scheme)
+         print('%6s %6s ' % ('column', 'terms') + header[9:])
+         for i, r in enumerate(analyze_grid(shape, scheme)):
+            print('%6d %6d ' % (i, r['terms']) +
+                  (row % ('', r['levels'], r['xor_delays'], r['csas'],
+                          r['c42s'], r['fas'], r['has'],
+                          r['final_width']))[9:])
+         print()
+
+   print(header)
+   for scheme in SCHEMES:
+      s = summarize(analyze_grid(shape, scheme))
+      print(row % (scheme, s['levels'], s['xor_delays'], s['csas'],
+                   s['c42s'], s['fas'], s['has'], s['final_width']))
+
+   checked = set(shape)
+   failed  = [c for c in checked if not check_3_to_2(*c)]
+
+   result_str = "FAILED" if failed else "PASSED"
+   print(result_str)